@@ -0,0 +1,81 @@
+import sys
+import traceback
+from datetime import datetime
+from sqlalchemy import Date, func, case, type_coerce
+from setup import get_config, get_engine, get_db
+from scrapebot.database import base, Run, Data, RunStatistics, RunStatusEnum
+
+
+def main():
+    print('[' + str(datetime.now()) + '] Rebuilding run statistics from all existing runs')
+    config = get_config(False)
+    engine = get_engine(config)
+    base.metadata.create_all(engine)
+    db = get_db(engine)
+    try:
+        rows = backfill(db)
+        db.commit()
+        print('Done, ' + str(rows) + ' row(s) of statistics written')
+    except:
+        print('Error: Statistics could not be rebuilt')
+        error = sys.exc_info()[0]
+        if error is not None:
+            print('- ' + str(error))
+            print('- ' + traceback.format_exc())
+        db.rollback()
+        exit(1)
+    finally:
+        db.remove()
+
+
+def backfill(db, chunk_size=1000):
+    """
+    Replaces all run statistics with aggregates computed from the run and data tables (one GROUP BY each), leaving out
+    runs still in progress just as RunStatistics.add_run only counts finished runs
+    :param db:
+    :param chunk_size: number of statistics rows inserted at a time
+    :return: number of statistics rows written
+    """
+    day = type_coerce(func.date(Run.created), Date)
+    keys = [Run.recipe_uid, Run.instance_uid, day]
+    data_counts = {}
+    for recipe_uid, instance_uid, run_day, data_count in db.query(*keys, func.count(Data.uid))\
+            .join(Data, Data.run_uid == Run.uid)\
+            .filter(Run.status != RunStatusEnum.in_progress)\
+            .group_by(*keys):
+        data_counts[(recipe_uid, instance_uid, run_day)] = data_count
+    db.query(RunStatistics).delete(synchronize_session=False)
+    rows = []
+    written = 0
+    for recipe_uid, instance_uid, run_day, runs, successes, runtime_sum, runtime_min, runtime_max in db.query(
+                *keys,
+                func.count(Run.uid),
+                func.sum(case([(Run.status == RunStatusEnum.success, 1)], else_=0)),
+                func.sum(Run.runtime), func.min(Run.runtime), func.max(Run.runtime)
+            )\
+            .filter(Run.status != RunStatusEnum.in_progress)\
+            .group_by(*keys):
+        rows.append({
+            'recipe_uid': recipe_uid,
+            'instance_uid': instance_uid,
+            'day': run_day,
+            'runs': runs,
+            'successes': successes,
+            'errors': runs - successes,
+            'runtime_sum': runtime_sum or 0,
+            'runtime_min': runtime_min,
+            'runtime_max': runtime_max,
+            'data_count': data_counts.get((recipe_uid, instance_uid, run_day), 0)
+        })
+        if len(rows) == chunk_size:
+            db.execute(RunStatistics.__table__.insert(), rows)
+            written = written + len(rows)
+            rows = []
+    if len(rows) > 0:
+        db.execute(RunStatistics.__table__.insert(), rows)
+        written = written + len(rows)
+    return written
+
+
+if __name__ == '__main__':
+    main()
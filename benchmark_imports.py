@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+# modules which only the browser (i.e., selenium et al.) or only the web frontend (i.e., flask et al.) need
+BROWSER_MODULES = ['selenium', 'pyvirtualdisplay', 'PIL', 'boto3']
+WEB_MODULES = ['flask', 'flask_login', 'flask_sqlalchemy', 'flask_bootstrap', 'flask_mail', 'flask_wtf', 'werkzeug']
+# what each entry point must not load at startup
+TARGETS = {
+    'scrapebot.py': BROWSER_MODULES + WEB_MODULES,
+    'frontend.py': BROWSER_MODULES
+}
+CHILD = '''
+import sys
+import json
+import time
+import runpy
+start = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name='benchmark')
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'modules': sorted(set([name.split('.')[0] for name in sys.modules]))
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures how long scrapebot.py and frontend.py take to start '
+                                                 '(i.e., import everything) in a fresh interpreter')
+    parser.add_argument('targets', nargs='*', default=sorted(TARGETS.keys()),
+                        help='scripts to measure (default: scrapebot.py and frontend.py)')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per script (default: 5)')
+    args = parser.parse_args()
+    failed = False
+    for target in args.targets:
+        seconds, modules = measure(target, max(1, args.runs))
+        unwanted = [module for module in TARGETS.get(target, []) if module in modules]
+        print(target + ': ' + str(round(seconds*1000)) + ' ms (median of ' + str(max(1, args.runs)) + ' runs), ' +
+              str(len(modules)) + ' top-level modules loaded')
+        if len(unwanted) > 0:
+            failed = True
+            print('- Warning: ' + ', '.join(unwanted) + ' loaded although not needed at startup')
+    if failed:
+        exit(1)
+
+
+def measure(target, runs=5):
+    """
+    Runs the script's top level (i.e., without calling main) in fresh interpreters
+    :param target: path to the script
+    :param runs:
+    :return: tuple of the median seconds and the top-level modules loaded
+    """
+    target = os.path.abspath(target)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(target), PYTHONDONTWRITEBYTECODE='1')
+    timings = []
+    modules = []
+    for _ in range(0, runs):
+        output = subprocess.check_output([sys.executable, '-c', CHILD, target], env=env)
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        modules = result['modules']
+    timings.sort()
+    return timings[len(timings)//2], modules
+
+
+if __name__ == '__main__':
+    main()
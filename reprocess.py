@@ -0,0 +1,157 @@
+import os
+import sys
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from sqlalchemy import select
+from setup import get_config, get_engine, get_db
+from scrapebot.database import RecipeStep, Data, Blob
+from scrapebot.steptypes import RecipeStepTypeEnum
+from scrapebot.extract import OFFLINE_STEP_TYPES, parse_html, extract, process_snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Applies extraction steps to HTML snapshots stored by past runs ' +
+                                                 '(i.e., get_htmlsource data) without launching any browser')
+    parser.add_argument('steps', metavar='STEP', type=int, nargs='+',
+                        help='uid of an extraction step (e.g., extract_css_texts) whose results should be backfilled')
+    parser.add_argument('--source', type=int, action='append',
+                        help='uid of the get_htmlsource step to read snapshots from (default: all of the recipe)')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='number of processes to parse snapshots with (default: number of CPUs)')
+    parser.add_argument('--chunk', type=int, default=20, help='number of snapshots handed to a process at a time')
+    parser.add_argument('--replace', action='store_true',
+                        help='delete the steps\' existing data first (default: skip runs that already have some)')
+    args = parser.parse_args()
+
+    print('[' + str(datetime.now()) + '] ScrapeBot reprocessing initiated (this is server time)')
+    config = get_config(False)
+    engine = get_engine(config)
+    db = get_db(engine)
+    try:
+        steps = db.query(RecipeStep).filter(RecipeStep.uid.in_(args.steps)).all()
+        rules = get_rules(steps, args.steps)
+        source_uids = get_source_uids(db, steps[0].recipe_uid, args.source)
+        print('Applying ' + str(len(rules)) + ' step(s) to snapshots of ' + str(len(source_uids)) + ' source step(s)')
+        skip_run_uids = set()
+        if args.replace:
+            deleted = db.query(Data).filter(Data.step_uid.in_(args.steps)).delete(synchronize_session=False)
+            db.commit()
+            print('- deleted ' + str(deleted) + ' existing data row(s)')
+        else:
+            skip_run_uids = set([run_uid for (run_uid,) in db.query(Data.run_uid)
+                                .filter(Data.step_uid.in_(args.steps)).distinct()])
+        inserted, failed = reprocess(engine, db, source_uids, rules, skip_run_uids, args.processes, args.chunk)
+        print('Done, ' + str(inserted) + ' data row(s) stored')
+        if len(failed) > 0:
+            print('- snapshots of the following run(s) could not be parsed: ' + ', '.join(map(str, failed)))
+    except ValueError as error:
+        print('Error: ' + str(error))
+        exit(2)
+    except:
+        print('Error: Reprocessing failed')
+        error = sys.exc_info()[0]
+        if error is not None:
+            print('- ' + str(error))
+            print('- ' + traceback.format_exc())
+        db.rollback()
+        exit(1)
+    finally:
+        db.remove()
+
+
+def get_rules(steps, step_uids):
+    """
+    Checks that all steps exist, belong to the same recipe, and can be applied offline
+    :param steps:
+    :param step_uids:
+    :return: list of (step_uid, step_type, value) tuples
+    """
+    if len(steps) != len(set(step_uids)):
+        raise ValueError('Step(s) not found')
+    if len(set([step.recipe_uid for step in steps])) > 1:
+        raise ValueError('All steps need to belong to the same recipe')
+    rules = []
+    empty_document = parse_html('<html><body></body></html>')
+    for step in steps:
+        if step.type.name not in OFFLINE_STEP_TYPES:
+            raise ValueError('Step ' + str(step.uid) + ' (' + step.type.name + ') cannot be applied offline, ' +
+                             'use one of ' + ', '.join(OFFLINE_STEP_TYPES))
+        try:
+            extract(empty_document, step.type.name, step.value)
+        except Exception as error:
+            raise ValueError('Step ' + str(step.uid) + ' has an invalid value (' + str(error) + ')')
+        rules.append((step.uid, step.type.name, step.value))
+    return rules
+
+
+def get_source_uids(db, recipe_uid, source_uids=None):
+    query = db.query(RecipeStep.uid)\
+        .filter(RecipeStep.recipe_uid == recipe_uid, RecipeStep.type == RecipeStepTypeEnum.get_htmlsource)
+    if source_uids:
+        query = query.filter(RecipeStep.uid.in_(source_uids))
+    uids = [uid for (uid,) in query]
+    if len(uids) == 0:
+        raise ValueError('No get_htmlsource step found to read snapshots from')
+    return uids
+
+
+def reprocess(engine, db, source_uids, rules, skip_run_uids, processes, chunk_size):
+    """
+    Streams snapshots from the database into a process pool and stores the extracted values as data of the
+    respective runs; only a few chunks are in flight at a time, so memory does not grow with the number of snapshots
+    :param engine: used for a dedicated streaming connection, as writes go through db in the meantime
+    :param db:
+    :param source_uids:
+    :param rules:
+    :param skip_run_uids:
+    :param processes:
+    :param chunk_size:
+    :return: tuple of the number of data rows stored and a list of run uids whose snapshot failed
+    """
+    table = Data.__table__
+    blob_table = Blob.__table__
+    inserted = 0
+    failed = []
+    pending = set()
+
+    def store(done):
+        rows, chunk_failed = done.result()
+        if len(rows) > 0:
+            db.execute(table.insert(), rows)
+            db.commit()
+        failed.extend(chunk_failed)
+        return len(rows)
+
+    with engine.connect() as connection, ProcessPoolExecutor(max_workers=max(1, processes)) as pool:
+        snapshots = connection\
+            .execution_options(stream_results=True)\
+            .execute(select([table.c.run_uid, table.c.created, table.c.value,
+                             blob_table.c.compression, blob_table.c.content])
+                     .select_from(table.outerjoin(blob_table, table.c.blob_hash == blob_table.c.hash))
+                     .where(table.c.step_uid.in_(source_uids))
+                     .order_by(table.c.uid))
+        chunk = []
+        for run_uid, created, html, compression, content in snapshots:
+            if run_uid in skip_run_uids:
+                continue
+            if content is not None:
+                html = Blob.decompress(content, compression)
+            chunk.append((run_uid, created, html))
+            if len(chunk) == chunk_size:
+                pending.add(pool.submit(process_snapshots, chunk, rules))
+                chunk = []
+                if len(pending) >= 2*max(1, processes):
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        inserted = inserted + store(future)
+        if len(chunk) > 0:
+            pending.add(pool.submit(process_snapshots, chunk, rules))
+        for future in wait(pending).done:
+            inserted = inserted + store(future)
+    return inserted, failed
+
+
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,278 @@
 import sys
 import time
+import signal
+import argparse
 import traceback
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from random import shuffle
 from setup import get_config, get_engine, get_db
 from scrapebot.database import *
+from scrapebot.schedule import Schedule, RecipeLock
+from scrapebot.upload import screenshot_uploader
+from scrapebot.runner import AsyncRunner
+from scrapebot.steps import wait_through
+from sqlalchemy.orm import scoped_session
 
 
-print('[' + str(datetime.now()) + '] ScrapeBot initiated (this is server time)')
-config = get_config(False)
-db = get_db(get_engine(config))
+# failed runs are retried after this many minutes, just as the cronjob would do
+RETRY_DELAY = 2
 
-this_instance_name = config.get('Instance', 'name')
-this_instance = None
-try:
-    if this_instance_name == '' or db.query(Instance).filter(Instance.name == this_instance_name).count() == 0:
-        print('Error: Instance not found')
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs all due recipes of this ScrapeBot instance')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running and start every recipe as soon as it is due (instead of a cronjob)')
+    args = parser.parse_args()
+
+    print('[' + str(datetime.now()) + '] ScrapeBot initiated (this is server time)')
+    config = get_config(False)
+    workers = get_workers(config)
+    db = get_db(get_engine(config, workers))
+    this_instance = authenticate(config, db)
+
+    if args.daemon:
+        run_daemon(config, db, this_instance.uid, workers)
+        return
+
+    recipes = this_instance.get_active_recipes()
+    if len(recipes) > 0:
+        shuffle(recipes)
+        print(str(len(recipes)) + ' active recipe(s) found to be handled by this instance')
+        if workers > 1:
+            print('Running up to ' + str(workers) + ' recipes in parallel')
+        instance_uid = this_instance.uid
+        recipe_uids = [recipe.uid for recipe in recipes]
+        db.remove()
+        with get_pool(config, workers) as pool:
+            for recipe_uid in recipe_uids:
+                submit_recipe(pool, config, db, instance_uid, recipe_uid)
+        finish_screenshots(db)
+        print('All done')
+    else:
+        print('No (active) recipes found (actively) ascribed to this instance')
+
+    db.remove()
+
+
+def get_workers(config):
+    """
+    Reads the number of recipes this instance may run in parallel (each with its own browser and database session)
+    :param config:
+    :return:
+    """
+    try:
+        return max(1, int(config.get('Instance', 'Workers', fallback=1)))
+    except ValueError:
+        return 1
+
+
+def get_pool(config, workers):
+    """
+    Creates what runs the recipes: a thread pool with one thread per worker or, with Runner set to asyncio, one event
+    loop that interleaves up to Workers runs while only RunnerThreads threads handle their blocking calls
+    :param config:
+    :param workers:
+    :return: ThreadPoolExecutor or AsyncRunner
+    """
+    if (config.get('Instance', 'Runner', fallback='threads') or 'threads').lower() != 'asyncio':
+        return ThreadPoolExecutor(max_workers=workers)
+    try:
+        threads = max(1, int(config.get('Instance', 'RunnerThreads', fallback=4)))
+    except ValueError:
+        threads = 4
+    print('Interleaving up to ' + str(workers) + ' runs on ' + str(threads) + ' thread(s) through asyncio')
+    return AsyncRunner(workers, threads)
+
+
+def submit_recipe(pool, config, db, instance_uid, recipe_uid):
+    """
+    Hands a recipe to the pool (see get_pool)
+    :param pool:
+    :param config:
+    :param db:
+    :param instance_uid:
+    :param recipe_uid:
+    :return: future holding when the recipe is due next
+    """
+    if isinstance(pool, AsyncRunner):
+        # a run's steps are advanced by whichever thread is free, so it cannot use a thread-local session but gets
+        # a session of its own (for which the scope is always the same)
+        recipe_db = scoped_session(db.session_factory, scopefunc=lambda: recipe_uid)
+        return pool.submit(iterate_recipe, config, recipe_db, instance_uid, recipe_uid)
+    return pool.submit(handle_recipe, config, db, instance_uid, recipe_uid)
+
+
+def get_blob_threshold(config):
+    """
+    Reads from how many characters on data values are stored as deduplicated and compressed blobs
+    :param config:
+    :return: 0 if disabled
+    """
+    try:
+        return max(0, int(config.get('Database', 'BlobThreshold', fallback=0)))
+    except ValueError:
+        return 0
+
+
+def authenticate(config, db):
+    this_instance_name = config.get('Instance', 'name')
+    try:
+        if this_instance_name == '' or db.query(Instance).filter(Instance.name == this_instance_name).count() == 0:
+            print('Error: Instance not found')
+            db.close()
+            exit(1)
+        else:
+            print('Authenticated as instance "' + this_instance_name + '"')
+            return db.query(Instance).filter(Instance.name == this_instance_name).one()
+    except SystemExit:
+        raise
+    except:
+        print('Error: Initial database query failed')
+        error = sys.exc_info()[0]
+        if error is not None:
+            print('- ' + str(error))
+            print('- ' + traceback.format_exc())
         db.close()
         exit(1)
-    else:
-        print('Authenticated as instance "' + this_instance_name + '"')
-        this_instance = db.query(Instance).filter(Instance.name == this_instance_name).one()
-except:
-    print('Error: Initial database query failed')
-    error = sys.exc_info()[0]
-    if error is not None:
-        print('- ' + str(error))
-        print('- ' + traceback.format_exc())
-    db.close()
-    exit(1)
-
-recipes = this_instance.get_active_recipes()
-if len(recipes) > 0:
-    shuffle(recipes)
-    print(str(len(recipes)) + ' active recipe(s) found to be handled by this instance')
-    for recipe in recipes:
+
+
+def run_daemon(config, db, instance_uid, workers):
+    """
+    Keeps running and starts every recipe exactly when it is due, based on an in-memory schedule
+    :param config:
+    :param db:
+    :param instance_uid:
+    :param workers:
+    :return:
+    """
+    try:
+        refresh = max(1, int(config.get('Instance', 'ScheduleRefresh', fallback=60)))
+    except ValueError:
+        refresh = 60
+    print('Running as daemon, reloading recipes every ' + str(refresh) + ' seconds')
+    schedule = Schedule()
+    stop = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: (stop.append(signum), schedule.wake()))
+    pool = get_pool(config, workers)
+    clock_offset = timedelta(0)
+    next_refresh = 0
+    try:
+        while len(stop) == 0:
+            if time.time() >= next_refresh:
+                clock_offset = refresh_schedule(db, schedule, instance_uid)
+                next_refresh = time.time() + refresh
+            # the schedule is kept in database time, just as Run.created
+            now = datetime.now() + clock_offset
+            for recipe_uid in schedule.pop_due(now):
+                future = submit_recipe(pool, config, db, instance_uid, recipe_uid)
+                future.add_done_callback(
+                    lambda done, recipe_uid=recipe_uid:
+                    schedule.finish(recipe_uid, None if done.exception() is not None else done.result())
+                )
+            schedule.wait(schedule.get_seconds_until_next(now, max(0, next_refresh - time.time())))
+    except KeyboardInterrupt:
+        pass
+    print('Stopping daemon, waiting for running recipes to finish')
+    pool.shutdown(wait=True)
+    finish_screenshots(db)
+    db.remove()
+
+
+def finish_screenshots(db):
+    """
+    Waits for the background uploader to persist all screenshots taken so far and logs failures to their runs
+    :param db:
+    :return:
+    """
+    failed = screenshot_uploader.join()
+    screenshot_uploader.close()
+    if failed > 0:
+        print('Error: ' + str(failed) + ' screenshot(s) could not be stored')
+        try:
+            screenshot_uploader.store_failures(db)
+            db.commit()
+        except:
+            print('Error: Failed screenshots could not be logged to their runs')
+            print('- ' + traceback.format_exc())
+            db.rollback()
+
+
+def refresh_schedule(db, schedule, instance_uid):
+    """
+    (Re-)loads this instance's active recipes into the schedule
+    :param db:
+    :param schedule:
+    :param instance_uid:
+    :return: offset between the database's clock and ours
+    """
+    try:
+        now = db.query(func.now()).first()[0]
+        clock_offset = now - datetime.now()
+        this_instance = db.query(Instance).filter(Instance.uid == instance_uid).one()
+        recipe_uids = []
+        for recipe in this_instance.get_active_recipes():
+            if len(recipe.get_active_steps()) > 0:
+                recipe_uids.append(recipe.uid)
+                if not schedule.is_running(recipe.uid):
+                    latest_run = recipe.get_latest_run(this_instance, only_include_successful_runs=True)
+                    schedule.update(recipe.uid, Schedule.get_next_due(
+                        None if latest_run is None else latest_run.created, recipe.interval, now
+                    ))
+        schedule.retain(recipe_uids)
+        return clock_offset
+    except:
+        print('Error: Schedule could not be refreshed')
+        error = sys.exc_info()[0]
+        if error is not None:
+            print('- ' + str(error))
+            print('- ' + traceback.format_exc())
+        db.rollback()
+        return timedelta(0)
+    finally:
+        db.remove()
+
+
+def handle_recipe(config, db, instance_uid, recipe_uid):
+    """
+    Runs one recipe on this instance (if it is due) using the calling thread's own database session
+    :param config:
+    :param db: scoped session, so that every worker thread gets a session of its own
+    :param instance_uid:
+    :param recipe_uid:
+    :return: datetime (in database time) when the recipe is due next, or None if it does not need scheduling
+    """
+    return wait_through(iterate_recipe(config, db, instance_uid, recipe_uid))
+
+
+def iterate_recipe(config, db, instance_uid, recipe_uid):
+    """
+    Same as handle_recipe but as generator that yields all waits (in seconds) instead of sleeping
+    :param config:
+    :param db: scoped session
+    :param instance_uid:
+    :param recipe_uid:
+    :return: datetime (in database time) when the recipe is due next, or None if it does not need scheduling
+    """
+    lock = RecipeLock(config.get('Instance', 'name'), recipe_uid)
+    next_due = None
+    try:
+        this_instance = db.query(Instance).filter(Instance.uid == instance_uid).one()
+        recipe = db.query(Recipe).filter(Recipe.uid == recipe_uid).one()
         steps = recipe.get_active_steps()
         if len(steps) > 0:
             latest_run = recipe.get_latest_run(this_instance, only_include_successful_runs=True)
             # to compare with an adequate timezone, we use the same database function as CREATE does
             now = db.query(func.now()).first()[0]
+            next_due = now + timedelta(minutes=RETRY_DELAY)
             if latest_run is not None and \
                (int(time.mktime(now.timetuple()) - time.mktime(latest_run.created.timetuple()))/60) < recipe.interval:
 
                 print('# skipping ' + recipe.name + ' since latest successful run was less than ' +
                       str(recipe.interval) + ' minute(s) ago')
+                next_due = latest_run.created + timedelta(minutes=recipe.interval)
+            elif not lock.acquire():
+                print('# skipping ' + recipe.name + ' since it is currently running elsewhere on this instance')
             else:
                 if latest_run is None:
                     print('# ' + recipe.name + ' (' + str(len(steps)) +
@@ -53,18 +281,19 @@ if len(recipes) > 0:
                     print('# ' + recipe.name + ' (' + str(len(steps)) +
                           ' active step(s) found, last run on this instance at ' + str(latest_run.created) + ')')
                 status = RunStatusEnum.in_progress
+                started = time.perf_counter()
                 run = Run(instance=this_instance, recipe=recipe, status=status)
                 db.add(run)
                 prior_step = None
                 for step in steps:
                     try:
-                        status = step.run(config, run, prior_step)
+                        status = yield from step.iterate(config, run, prior_step)
                     except:
                         error = sys.exc_info()[0]
                         if error is not None:
                             error = str(error).strip('<>')
                             print('- Fatal ERROR: ' + error)
-                            run.log.append(Log(message=error, type=LogTypeEnum.error))
+                            run.add_log(error, LogTypeEnum.error)
                         status = RunStatusEnum.error
                     if status is not RunStatusEnum.success:
                         run.status = status
@@ -75,13 +304,29 @@ if len(recipes) > 0:
                 run.end_session()
                 if run.status == RunStatusEnum.in_progress:
                     run.status = RunStatusEnum.success
-                time_after_run = db.query(func.now()).first()[0]
-                run.runtime = int(time.mktime(time_after_run.timetuple()) - time.mktime(now.timetuple()))
+                run.runtime = int(round(time.perf_counter() - started))
+                run.store_buffer(db, blob_threshold=get_blob_threshold(config),
+                                 blob_compression=config.get('Database', 'BlobCompression', fallback='zlib'))
+                RunStatistics.add_run(db, run)
+                # screenshots of earlier runs that have failed in the background meanwhile are logged to their runs
+                screenshot_uploader.store_failures(db)
                 db.commit()
+                if run.status == RunStatusEnum.success:
+                    next_due = run.created + timedelta(minutes=recipe.interval)
         else:
             print('# skipping ' + recipe.name + ' since no active steps were found')
-    print('All done')
-else:
-    print('No (active) recipes found (actively) ascribed to this instance')
+    except:
+        print('Error: Recipe ' + str(recipe_uid) + ' could not be handled')
+        error = sys.exc_info()[0]
+        if error is not None:
+            print('- ' + str(error))
+            print('- ' + traceback.format_exc())
+        db.rollback()
+    finally:
+        lock.release()
+        db.remove()
+    return next_due
+
 
-db.close()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+import os
+import atexit
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+# clears cookies, storage, caches, and history of all sites at once from Firefox's privileged (chrome) context
+FIREFOX_CLEAR_SCRIPT = '''
+var done = arguments[arguments.length - 1];
+Services.clearData.deleteData(Components.interfaces.nsIClearDataService.CLEAR_ALL, function() { done(true); });
+'''
+
+
+class BrowserSession:
+    """
+    A launched browser (along with its virtual display, if any) that can be reused across several runs
+    """
+
+    def __init__(self, key, selenium, display=None):
+        self.key = key
+        self.selenium = selenium
+        self.display = display
+        self.runs = 0
+        self.calls = 0
+        self.origins = set()
+        self.__count_calls()
+
+    def __count_calls(self):
+        """
+        Counts every WebDriver command (i.e., every round trip to the browser) sent throughout this session
+        :return:
+        """
+        execute = getattr(self.selenium, 'execute', None)
+        if execute is None:
+            return
+
+        def counting_execute(*args, **kwargs):
+            self.calls += 1
+            if len(args) > 1 and args[0] == 'get' and isinstance(args[1], dict):
+                self.add_origin(args[1].get('url'))
+            return execute(*args, **kwargs)
+        self.selenium.execute = counting_execute
+
+    def add_origin(self, url):
+        """
+        Remembers a site the browser went to, so that reset knows where to clear cookies and storage
+        :param url:
+        :return:
+        """
+        parts = urlsplit(str(url or ''))
+        if parts.scheme in ['http', 'https'] and parts.netloc:
+            self.origins.add(parts.scheme + '://' + parts.netloc)
+
+    def reset(self):
+        """
+        Removes all traces of the previous run (cookies and storage of every site visited, and the page itself);
+        delete_all_cookies and the storage APIs only ever reach the current document's site, so the browser is told to
+        clear everything at once where it allows so (Chrome and Firefox, along with a fresh window as session storage
+        belongs to windows), and every site visited is cleared one by one otherwise; raises if this fails, so that the
+        session is not reused
+        :return:
+        """
+        try:
+            self.add_origin(self.selenium.current_url)
+        except:
+            pass
+        self.__clear_document()
+        if not (self.__clear_browser() and self.__switch_to_fresh_window()):
+            for origin in sorted(self.origins):
+                self.selenium.get(origin + '/')
+                self.__clear_document()
+        self.selenium.get('about:blank')
+        self.origins = set()
+
+    def __clear_document(self):
+        try:
+            self.selenium.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+        except:
+            pass
+        self.selenium.delete_all_cookies()
+
+    def __switch_to_fresh_window(self):
+        """
+        Opens a new window and closes all others (i.e., the run's window along with its popups)
+        :return: True if this was possible
+        """
+        try:
+            handles = self.selenium.window_handles
+            self.selenium.execute_script('window.open("about:blank");')
+            fresh = [handle for handle in self.selenium.window_handles if handle not in handles]
+            if len(fresh) != 1:
+                return False
+            for handle in handles:
+                self.selenium.switch_to.window(handle)
+                self.selenium.close()
+            self.selenium.switch_to.window(fresh[0])
+            return True
+        except:
+            return False
+
+    def __clear_browser(self):
+        """
+        Clears cookies and storage of all sites through the browser's own (non-WebDriver) interfaces
+        :return: True if this was possible
+        """
+        try:
+            if hasattr(self.selenium, 'execute_cdp_cmd'):
+                self.selenium.execute_cdp_cmd('Network.clearBrowserCookies', {})
+                for origin in self.origins:
+                    self.selenium.execute_cdp_cmd('Storage.clearDataForOrigin',
+                                                  {'origin': origin, 'storageTypes': 'all'})
+                return True
+            if hasattr(self.selenium, 'context') and hasattr(self.selenium, 'CONTEXT_CHROME'):
+                with self.selenium.context(self.selenium.CONTEXT_CHROME):
+                    self.selenium.execute_async_script(FIREFOX_CLEAR_SCRIPT)
+                return True
+        except:
+            pass
+        return False
+
+    def quit(self):
+        try:
+            self.selenium.quit()
+        except:
+            pass
+        if self.display is not None:
+            display_manager.release(self.display)
+            self.display = None
+
+
+class BrowserPool:
+    """
+    Keeps idle browser sessions alive so that subsequent runs with the very same browser settings
+    (i.e., browser, user agent, language, window size) do not have to launch a new browser
+    """
+
+    def __init__(self):
+        self.__idle = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        with self.__lock:
+            return sum([len(sessions) for sessions in self.__idle.values()])
+
+    def acquire(self, key):
+        """
+        Hands out an idle session with the given settings
+        :param key:
+        :return: BrowserSession or None if no idle session is available
+        """
+        with self.__lock:
+            sessions = self.__idle.get(key)
+            if sessions:
+                return sessions.pop()
+        return None
+
+    def release(self, session, max_runs=1, healthy=True):
+        """
+        Returns a session after a run; it is reset and kept for later unless it crashed or has been used up
+        :param session:
+        :param max_runs: number of runs after which a session gets recycled
+        :param healthy: False if the browser crashed during the run
+        :return: True if the session was kept, False if it was closed
+        """
+        session.runs += 1
+        if healthy and session.runs < max_runs:
+            try:
+                session.reset()
+                with self.__lock:
+                    self.__idle.setdefault(session.key, []).append(session)
+                return True
+            except:
+                pass
+        session.quit()
+        return False
+
+    def close_all(self):
+        with self.__lock:
+            sessions = [session for key_sessions in self.__idle.values() for session in key_sessions]
+            self.__idle = {}
+        for session in sessions:
+            session.quit()
+
+
+class SharedDisplay:
+    """
+    A virtual display (i.e., an Xvfb process) along with the number of browsers currently using it
+    """
+
+    def __init__(self, display, width, height):
+        self.display = display
+        self.width = width
+        self.height = height
+        self.users = 0
+        self.name = getattr(display, 'new_display_var', None) or (':' + str(getattr(display, 'display', '')))
+
+    def is_alive(self):
+        try:
+            return self.display.is_alive()
+        except:
+            return False
+
+    def fits(self, width, height):
+        return self.width >= width and self.height >= height
+
+
+class DisplayManager:
+    """
+    Starts a small, fixed number of virtual displays once per process and shares them among all browser sessions
+    """
+
+    def __init__(self, display_class=None):
+        self.__display_class = display_class
+        self.__displays = []
+        self.__lock = threading.Lock()
+        self.__launch_lock = threading.Lock()
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__displays)
+
+    def __start(self, width, height):
+        display_class = self.__display_class
+        if display_class is None:
+            from pyvirtualdisplay import Display
+            display_class = Display
+        display = display_class(visible=0, size=(width, height))
+        display.start()
+        return SharedDisplay(display, width, height)
+
+    def acquire(self, width, height, count=1):
+        """
+        Hands out the least used healthy display that is large enough, starting a new one only if necessary
+        :param width:
+        :param height:
+        :param count: number of displays to share the load among
+        :return: SharedDisplay
+        """
+        with self.__lock:
+            for shared in list(self.__displays):
+                if shared.users == 0 and (not shared.is_alive() or not shared.fits(width, height)):
+                    self.__stop(shared)
+            candidates = [shared for shared in self.__displays if shared.fits(width, height) and shared.is_alive()]
+            if len(candidates) == 0 or len(self.__displays) < count:
+                shared = self.__start(width, height)
+                self.__displays.append(shared)
+            else:
+                shared = min(candidates, key=lambda candidate: candidate.users)
+            shared.users += 1
+            return shared
+
+    def release(self, shared):
+        """
+        Gives a display back; it is kept running for the next browser unless it has died in the meantime
+        :param shared:
+        :return:
+        """
+        with self.__lock:
+            shared.users = max(0, shared.users - 1)
+            if shared.users == 0 and not shared.is_alive():
+                self.__stop(shared)
+
+    def __stop(self, shared):
+        if shared in self.__displays:
+            self.__displays.remove(shared)
+        try:
+            shared.display.stop()
+        except:
+            pass
+
+    @contextmanager
+    def environment(self, shared):
+        """
+        Points newly launched browsers (and their drivers) to the given display
+        :param shared: SharedDisplay or None to launch without a virtual display
+        :return:
+        """
+        if shared is None:
+            yield
+            return
+        with self.__launch_lock:
+            previous = os.environ.get('DISPLAY')
+            os.environ['DISPLAY'] = shared.name
+            try:
+                yield
+            finally:
+                if previous is None:
+                    del os.environ['DISPLAY']
+                else:
+                    os.environ['DISPLAY'] = previous
+
+    def close_all(self):
+        with self.__lock:
+            for shared in list(self.__displays):
+                self.__stop(shared)
+
+
+display_manager = DisplayManager()
+browser_pool = BrowserPool()
+atexit.register(display_manager.close_all)
+atexit.register(browser_pool.close_all)
@@ -1,17 +1,26 @@
 import string
 import enum
+import json
 import random
-from sqlalchemy import Column, DateTime, String, Integer, Enum, Text, Boolean, ForeignKey, func
-from sqlalchemy.orm import relationship
+import zlib
+import hashlib
+from time import perf_counter
+from datetime import timedelta
+from sqlalchemy import Column, DateTime, Date, String, Integer, Enum, Text, Boolean, ForeignKey, Index, \
+    UniqueConstraint, LargeBinary, Float, func, or_, and_, case
+from sqlalchemy.orm import relationship, joinedload, contains_eager, object_session
 from sqlalchemy.ext.declarative import declarative_base
-from scrapebot.emulate import RecipeStepTypeEnum, Emulator
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import UserMixin
+from sqlalchemy.exc import IntegrityError
+# the model layer is shared by the runner and the web frontend, so neither browser (i.e., selenium) nor web (i.e.,
+# flask) modules are imported here but only once they are needed
+from scrapebot.steptypes import RecipeStepTypeEnum, HTTP_STEP_TYPES
+from scrapebot.steps import wait_through
+from scrapebot.permissions import permission_service
 
 base = declarative_base()
 
 
-class User(UserMixin, base):
+class User(base):
     __tablename__ = 'user'
     uid = Column(Integer, primary_key=True)
     created = Column(DateTime, default=func.now())
@@ -31,16 +40,48 @@ class User(UserMixin, base):
         order_by='UserRecipePrivilege.created'
     )
     active = Column(Boolean, default=True)
+    # bumped whenever the user's privileges change, so that permissions cached by any web worker are dropped
+    permission_version = Column(Integer, default=0)
+    # resolved through permission_service on first use
+    permissions = None
 
     def __repr__(self):
         return "<User(email='%s', name='%s', active='%d')>" % (self.email, self.name, self.active)
 
+    # Flask-Login's UserMixin, implemented here to keep flask_login out of the model layer
+    __hash__ = object.__hash__
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return NotImplemented
+        return not equal
+
+    @property
+    def is_active(self):
+        return True
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
     def create_password(self):
+        from werkzeug.security import generate_password_hash
         temp = ''.join(random.SystemRandom().choice(string.ascii_letters + string.digits) for _ in range(12))
         self.password = generate_password_hash(temp)
         return temp
 
     def check_password(self, password):
+        from werkzeug.security import check_password_hash
         return check_password_hash(self.password, password)
 
     def get_id(self):
@@ -139,18 +180,24 @@ class Instance(base):
         return recipes
 
     def is_visible_to_user(self, user):
-        if self.owner_uid is user.uid:
+        if self.owner_uid == user.uid:
             return True
+        permissions = permission_service.get(object_session(self) or object_session(user), user)
+        if permissions is not None and self.uid is not None:
+            return self.uid in permissions.visible_instances
         for user_privilege in self.privileged_users:
-            if user_privilege.user_uid is user.uid:
+            if user_privilege.user_uid == user.uid:
                 return True
         return False
 
     def is_editable_by_user(self, user):
-        if self.owner_uid is user.uid:
+        if self.owner_uid == user.uid:
             return True
+        permissions = permission_service.get(object_session(self) or object_session(user), user)
+        if permissions is not None and self.uid is not None:
+            return self.uid in permissions.editable_instances
         for user_privilege in self.privileged_users:
-            if user_privilege.user_uid is user.uid and user_privilege.allowed_to_edit:
+            if user_privilege.user_uid == user.uid and user_privilege.allowed_to_edit:
                 return True
         return False
 
@@ -161,6 +208,9 @@ class Instance(base):
         return False
 
     def get_latest_run(self, recipe=None, only_include_successful_runs=False):
+        session = object_session(self)
+        if session is not None and self.uid is not None:
+            return Run.query_latest(session, recipe, self, only_include_successful_runs).first()
         for run in self.runs:
             if recipe is None or run.recipe is recipe:
                 if not only_include_successful_runs or run.status == RunStatusEnum.success:
@@ -168,6 +218,9 @@ class Instance(base):
         return None
 
     def get_latest_runs(self, n=10, recipe=None, only_include_successful_runs=False):
+        session = object_session(self)
+        if session is not None and self.uid is not None:
+            return Run.query_latest(session, recipe, self, only_include_successful_runs).limit(n).all()
         n_runs = []
         for run in self.runs:
             if recipe is None or run.recipe is recipe:
@@ -177,6 +230,41 @@ class Instance(base):
                         break
         return n_runs
 
+    @staticmethod
+    def get_visible_with_latest_runs(session, user, recipe_uids=None):
+        """
+        Fetches all instances visible to the user along with their latest run in one single query (rather than
+        walking through all their runs); owners as well as the runs' recipes are loaded eagerly along the way
+        :param session:
+        :param user:
+        :param recipe_uids: if given, one row per instance and ordered recipe (among these) is returned instead
+        :return: list of (instance, latest run or None) tuples
+        """
+        grouping = [Run.instance_uid] if not recipe_uids else [Run.instance_uid, Run.recipe_uid]
+        latest = session.query(*grouping, func.max(Run.uid).label('run_uid')).group_by(*grouping)
+        if recipe_uids:
+            latest = latest.filter(Run.recipe_uid.in_(recipe_uids))
+        latest = latest.subquery()
+        privileged = session.query(UserInstancePrivilege.instance_uid)\
+            .filter(UserInstancePrivilege.user_uid == user.uid)
+        query = session.query(Instance, Run)\
+            .filter(or_(Instance.owner_uid == user.uid, Instance.uid.in_(privileged.subquery())))
+        if recipe_uids:
+            query = query\
+                .join(RecipeOrder, RecipeOrder.instance_uid == Instance.uid)\
+                .filter(RecipeOrder.recipe_uid.in_(recipe_uids))\
+                .outerjoin(latest, and_(latest.c.instance_uid == Instance.uid,
+                                        latest.c.recipe_uid == RecipeOrder.recipe_uid))\
+                .order_by(Instance.name, RecipeOrder.created)
+        else:
+            query = query\
+                .outerjoin(latest, latest.c.instance_uid == Instance.uid)\
+                .order_by(Instance.name)
+        return query\
+            .outerjoin(Run, Run.uid == latest.c.run_uid)\
+            .options(joinedload(Instance.owner), joinedload(Run.recipe).joinedload(Recipe.owner))\
+            .all()
+
     def jsonify(self, include_latest_run=False, recipe=None):
         if include_latest_run:
             latest_run = self.get_latest_run(recipe)
@@ -221,6 +309,23 @@ class RecipeOrder(base):
         }
 
 
+class RecipeEngineEnum(enum.Enum):
+    browser = 'Browser (Selenium, supports all step types)'
+    http = 'HTTP only (no JavaScript, much faster but limited to navigating, finding, and storing)'
+    auto = 'Automatic (HTTP only if all active steps support it, browser otherwise)'
+
+    @classmethod
+    def choices(cls):
+        return [(choice.name, choice.value) for choice in cls]
+
+    @classmethod
+    def coerce(cls, item):
+        try:
+            return item.name if isinstance(item, RecipeEngineEnum) else item
+        except KeyError:
+            return None
+
+
 class Recipe(base):
     __tablename__ = 'recipe'
     uid = Column(Integer, primary_key=True)
@@ -230,6 +335,7 @@ class Recipe(base):
     active = Column(Boolean, default=False)
     cookies = Column(Boolean, default=False)
     interval = Column(Integer, default=15)
+    engine = Column(Enum(RecipeEngineEnum), default=RecipeEngineEnum.browser)
     owner_uid = Column(Integer, ForeignKey('user.uid'))
     owner = relationship(User, back_populates='recipes_owned')
     privileged_users = relationship(
@@ -260,7 +366,25 @@ class Recipe(base):
                 steps.append(step)
         return steps
 
+    def get_engine(self):
+        """
+        Resolves which engine runs this recipe, where auto picks the HTTP engine if all active steps support it
+        :return: RecipeEngineEnum (either browser or http)
+        """
+        if self.engine == RecipeEngineEnum.auto:
+            for step in self.get_active_steps():
+                if step.type.name not in HTTP_STEP_TYPES:
+                    return RecipeEngineEnum.browser
+            return RecipeEngineEnum.http
+        return RecipeEngineEnum.http if self.engine == RecipeEngineEnum.http else RecipeEngineEnum.browser
+
     def get_average_runtime(self):
+        session = object_session(self)
+        if session is not None and self.uid is not None:
+            runs, runtime_sum = session.query(func.sum(RunStatistics.runs), func.sum(RunStatistics.runtime_sum))\
+                .filter(RunStatistics.recipe_uid == self.uid)\
+                .one()
+            return round(runtime_sum/runs) if runs else 0
         if len(self.runs) > 0:
             summed_runtime = 0
             for run in self.runs:
@@ -269,18 +393,24 @@ class Recipe(base):
         return 0
 
     def is_visible_to_user(self, user):
-        if self.owner_uid is user.uid:
+        if self.owner_uid == user.uid:
             return True
+        permissions = permission_service.get(object_session(self) or object_session(user), user)
+        if permissions is not None and self.uid is not None:
+            return self.uid in permissions.visible_recipes
         for user_privilege in self.privileged_users:
-            if user_privilege.user_uid is user.uid:
+            if user_privilege.user_uid == user.uid:
                 return True
         return False
 
     def is_editable_by_user(self, user):
-        if self.owner_uid is user.uid:
+        if self.owner_uid == user.uid:
             return True
+        permissions = permission_service.get(object_session(self) or object_session(user), user)
+        if permissions is not None and self.uid is not None:
+            return self.uid in permissions.editable_recipes
         for user_privilege in self.privileged_users:
-            if user_privilege.user_uid is user.uid and user_privilege.allowed_to_edit:
+            if user_privilege.user_uid == user.uid and user_privilege.allowed_to_edit:
                 return True
         return False
 
@@ -291,6 +421,9 @@ class Recipe(base):
         return False
 
     def get_latest_run(self, instance=None, only_include_successful_runs=False):
+        session = object_session(self)
+        if session is not None and self.uid is not None:
+            return Run.query_latest(session, self, instance, only_include_successful_runs).first()
         for run in self.runs:
             if instance is None or run.instance is instance:
                 if not only_include_successful_runs or run.status == RunStatusEnum.success:
@@ -298,6 +431,9 @@ class Recipe(base):
         return None
 
     def get_latest_runs(self, n=10, instance=None, only_include_successful_runs=False):
+        session = object_session(self)
+        if session is not None and self.uid is not None:
+            return Run.query_latest(session, self, instance, only_include_successful_runs).limit(n).all()
         n_runs = []
         for run in self.runs:
             if instance is None or run.instance is instance:
@@ -318,6 +454,7 @@ class Recipe(base):
                 'active': self.active,
                 'interval': self.interval,
                 'cookies': self.cookies,
+                'engine': self.engine.name if self.engine is not None else RecipeEngineEnum.browser.name,
                 'owner': self.owner.jsonify(),
                 'latest_run': False if latest_run is None else latest_run.jsonify()
             }
@@ -330,6 +467,7 @@ class Recipe(base):
                 'active': self.active,
                 'interval': self.interval,
                 'cookies': self.cookies,
+                'engine': self.engine.name if self.engine is not None else RecipeEngineEnum.browser.name,
                 'owner': self.owner.jsonify()
             }
 
@@ -368,12 +506,52 @@ class RecipeStep(base):
         :param prior_step:
         :return:
         """
+        return wait_through(self.iterate(config, run, prior_step))
+
+    def iterate(self, config, run, prior_step=None):
+        """
+        Same as run but as generator that yields all waits (in seconds) instead of sleeping
+        :param config:
+        :param run:
+        :param prior_step:
+        :return:
+        """
         if self.use_random_item_instead_of_value:
             item = self.find_random_item()
             self.value = item.value
-            self.data.append(Data(run=run, value=self.value))
-            run.log.append(Log(message='"' + item.value + '" randomly selected'))
-        return run.process(config, self, prior_step)
+            run.add_data(self, self.value)
+            run.add_log('"' + item.value + '" randomly selected')
+        return (yield from run.iterate(config, self, prior_step))
+
+    def has_data_in_latest_runs(self, instance, n=20):
+        """
+        Checks whether this step has stored any (non-empty) data during the latest n runs of its recipe on instance
+        through two indexed queries (i.e., the n-th latest run and one EXISTS on data of that run or any later one; as
+        data is only stored once a run is done, the run's rather than the data's creation decides)
+        :param instance:
+        :param n:
+        :return:
+        """
+        session = object_session(self)
+        if session is None or self.uid is None:
+            for late_run in self.recipe.get_latest_runs(n, instance):
+                for single_data in late_run.data:
+                    if single_data.step is self and single_data.value != '':
+                        return True
+            return False
+        query = session.query(Data.uid)\
+            .join(Run, Data.run_uid == Run.uid)\
+            .filter(Data.step_uid == self.uid, Run.instance_uid == instance.uid,
+                    or_(Data.value != '', Data.blob_hash.isnot(None)))
+        oldest = session.query(Run.created, Run.uid)\
+            .filter(Run.recipe_uid == self.recipe_uid, Run.instance_uid == instance.uid)\
+            .order_by(Run.created.desc(), Run.uid.desc())\
+            .offset(n - 1)\
+            .limit(1)\
+            .first()
+        if oldest is not None:
+            query = query.filter(or_(Run.created > oldest[0], and_(Run.created == oldest[0], Run.uid >= oldest[1])))
+        return session.query(query.exists()).scalar()
 
     def jsonify(self):
         return {
@@ -428,12 +606,87 @@ class Run(base):
     status = Column(Enum(RunStatusEnum), default=RunStatusEnum.success)
     log = relationship('Log', back_populates='run', order_by='Log.created, Log.uid', lazy='select')
     data = relationship('Data', back_populates='run', order_by='Data.created, Data.uid', lazy='select')
-    __emulator = Emulator()
+    timings = relationship('StepTiming', back_populates='run', order_by='StepTiming.uid', lazy='select')
+    __table_args__ = (
+        # backing the latest-run lookups (see Run.query_latest)
+        Index('run_recipe_instance_status_created', 'recipe_uid', 'instance_uid', 'status', 'created'),
+        Index('run_instance_status_created', 'instance_uid', 'status', 'created'),
+        Index('run_recipe_instance_created', 'recipe_uid', 'instance_uid', 'created'),
+        # backing the run lists' keyset pagination (see Run.query_page)
+        Index('run_recipe_created_uid', 'recipe_uid', 'created', 'uid'),
+        Index('run_instance_created_uid', 'instance_uid', 'created', 'uid'),
+        Index('run_created_uid', 'created', 'uid')
+    )
+    __emulator = None
+    log_buffer = None
+    data_buffer = None
+    timing_buffer = None
+    data_count = 0
 
     def __repr__(self):
         return "<Run(date='%s', recipe='%s', instance='%s', status='%s')>" % \
                (self.created, self.recipe.name, self.instance.name, self.status)
 
+    @staticmethod
+    def query_latest(session, recipe=None, instance=None, only_include_successful_runs=False):
+        """
+        Queries runs (newest first) directly in the database, rather than walking through the runs relationships
+        :param session:
+        :param recipe:
+        :param instance:
+        :param only_include_successful_runs:
+        :return: query, to be limited as needed
+        """
+        query = session.query(Run)
+        if recipe is not None:
+            query = query.filter(Run.recipe_uid == recipe.uid)
+        if instance is not None:
+            query = query.filter(Run.instance_uid == instance.uid)
+        if only_include_successful_runs:
+            query = query.filter(Run.status == RunStatusEnum.success)
+        return query.order_by(Run.created.desc(), Run.uid.desc())
+
+    @staticmethod
+    def query_page(session, user, recipe_uid=None, instance_uid=None, before=None, limit=10):
+        """
+        Fetches one page of runs (newest first) whose recipe and instance are both visible to the user, where pages
+        continue after the (created, uid) of their predecessor's last run rather than at an offset, so that every page
+        takes one indexed range scan no matter how deep it is (and filtering happens in the database, so that pages
+        are never short)
+        :param session:
+        :param user:
+        :param recipe_uid: only include runs of this recipe (if given)
+        :param instance_uid: only include runs on this instance (if given)
+        :param before: uid of the preceding page's last run, i.e., its next_cursor (or None for the first page)
+        :param limit: number of runs per page
+        :return: tuple of the runs and the cursor of the next page (None if this is the last page)
+        :raise ValueError: if before is no uid
+        """
+        privileged_recipes = session.query(UserRecipePrivilege.recipe_uid)\
+            .filter(UserRecipePrivilege.user_uid == user.uid)
+        privileged_instances = session.query(UserInstancePrivilege.instance_uid)\
+            .filter(UserInstancePrivilege.user_uid == user.uid)
+        query = session.query(Run)\
+            .join(Run.recipe)\
+            .join(Run.instance)\
+            .filter(or_(Recipe.owner_uid == user.uid, Recipe.uid.in_(privileged_recipes.subquery())))\
+            .filter(or_(Instance.owner_uid == user.uid, Instance.uid.in_(privileged_instances.subquery())))\
+            .options(contains_eager(Run.recipe), contains_eager(Run.instance))
+        if recipe_uid:
+            query = query.filter(Run.recipe_uid == recipe_uid)
+        if instance_uid:
+            query = query.filter(Run.instance_uid == instance_uid)
+        if before:
+            before = int(before)
+            # the cursor's creation time is looked up by its primary key (rather than passed around as string), so
+            # that it compares exactly however the database stores timestamps
+            created = session.query(Run.created).filter(Run.uid == before).as_scalar()
+            query = query.filter(or_(Run.created < created, and_(Run.created == created, Run.uid < before)))
+        runs = query.order_by(Run.created.desc(), Run.uid.desc()).limit(limit + 1).all()
+        if len(runs) > limit:
+            return runs[:limit], runs[limit - 1].uid
+        return runs, None
+
     def get_recipe_order(self):
         for temp_order in self.recipe.instances:
             if temp_order.instance is self.instance:
@@ -448,12 +701,210 @@ class Run(base):
         :param prior_step:
         :return:
         """
-        return self.__emulator.run(config, self, step, prior_step)
+        return wait_through(self.iterate(config, step, prior_step))
+
+    def iterate(self, config, step, prior_step=None):
+        """
+        Same as process but as generator that yields all waits (in seconds) instead of sleeping
+        :param config:
+        :param step:
+        :param prior_step:
+        :return:
+        """
+        if self.__emulator is None:
+            # every run gets its own emulator (i.e., browser or HTTP client) so that runs can be processed in parallel
+            if self.recipe.get_engine() == RecipeEngineEnum.http:
+                from scrapebot.http_emulate import HttpEmulator
+                self.__emulator = HttpEmulator()
+            else:
+                from scrapebot.emulate import Emulator
+                self.__emulator = Emulator()
+        return (yield from self.__emulator.iterate(config, self, step, prior_step))
+
+    def add_log(self, message, type=None):
+        """
+        Buffers a log entry as plain tuple (rather than as ORM object) until store_buffer writes it in bulk
+        :param message:
+        :param type: LogTypeEnum, defaults to info
+        :return:
+        """
+        if self.log_buffer is None:
+            self.log_buffer = []
+        self.log_buffer.append((message, LogTypeEnum.info if type is None else type))
+
+    def add_data(self, step, value):
+        """
+        Buffers a data entry as plain tuple (rather than as ORM object) until store_buffer writes it in bulk
+        :param step:
+        :param value:
+        :return:
+        """
+        if self.data_buffer is None:
+            self.data_buffer = []
+        self.data_count = self.data_count + 1
+        self.data_buffer.append((step, value if value is None or isinstance(value, str) else str(value)))
+
+    def add_timing(self, step, label, duration, calls=0, data_count=0):
+        """
+        Buffers how long a step (or the emulator's setup or teardown, then without step) took
+        :param step: RecipeStep or None
+        :param label: the step type's name or, e.g., browser_start
+        :param duration: in seconds
+        :param calls: number of WebDriver commands (or HTTP requests on the HTTP engine) sent
+        :param data_count: number of data entries added
+        :return:
+        """
+        if self.timing_buffer is None:
+            self.timing_buffer = []
+        self.timing_buffer.append((step, label, duration, calls, data_count))
+
+    def store_buffer(self, session, chunk_size=1000, blob_threshold=0, blob_compression='zlib'):
+        """
+        Writes all buffered log, data, and timing entries through chunked bulk inserts (i.e., executemany)
+        :param session:
+        :param chunk_size:
+        :param blob_threshold: data values of at least this many characters are stored as (deduplicated and
+        compressed) blobs, 0 to disable
+        :param blob_compression: zlib or zstd
+        :return: number of rows written
+        """
+        if self.uid is None:
+            session.flush()
+        start = perf_counter()
+        rows = 0
+        if self.log_buffer:
+            rows = rows + self.__insert_chunked(session, Log.__table__, [
+                {'run_uid': self.uid, 'message': message, 'type': type} for message, type in self.log_buffer
+            ], chunk_size)
+        if self.data_buffer:
+            blob_hashes = {}
+            if blob_threshold > 0:
+                blob_hashes = Blob.store(session, [value for step, value in self.data_buffer
+                                                   if value is not None and len(value) >= blob_threshold],
+                                         blob_compression)
+            rows = rows + self.__insert_chunked(session, Data.__table__, [
+                {
+                    'run_uid': self.uid,
+                    'step_uid': step.uid,
+                    'value': None if value in blob_hashes else value,
+                    'blob_hash': blob_hashes.get(value)
+                } for step, value in self.data_buffer
+            ], chunk_size)
+        if self.timing_buffer:
+            # storing logs and data is timed as well (labelled store), the final commit is not
+            self.timing_buffer.append((None, 'store', perf_counter() - start, 0, 0))
+            rows = rows + self.__insert_chunked(session, StepTiming.__table__, [
+                {
+                    'run_uid': self.uid,
+                    'step_uid': None if step is None else step.uid,
+                    'label': label,
+                    'duration': duration,
+                    'calls': calls,
+                    'data_count': data_count
+                } for step, label, duration, calls, data_count in self.timing_buffer
+            ], chunk_size)
+        self.log_buffer = None
+        self.data_buffer = None
+        self.timing_buffer = None
+        return rows
+
+    @staticmethod
+    def __insert_chunked(session, table, rows, chunk_size):
+        for i in range(0, len(rows), chunk_size):
+            session.execute(table.insert(), rows[i:i+chunk_size])
+        return len(rows)
 
     def end_session(self):
+        if self.__emulator is None:
+            return None
         return self.__emulator.close_session(self)
 
-    def jsonify(self, include_log=False, include_data=False):
+    def serialize(self, session, include_log=False, include_data=False, include_timing=False, chunk_size=1000):
+        """
+        Flat alternative to jsonify for runs with lots of logs and data: instance, recipe, and steps are included only
+        once (data entries refer to their step by uid), and logs and data are read as plain columns, not as objects
+        :param session:
+        :param include_log:
+        :param include_data:
+        :param include_timing:
+        :param chunk_size: number of rows fetched from the database at a time
+        :return: dict
+        """
+        temp = self.__serialize_head(session)
+        if include_log:
+            temp['log'] = list(self.__iterate_log(session, chunk_size))
+        if include_data:
+            temp['data'] = list(self.__iterate_data(session, chunk_size))
+        if include_timing:
+            temp['timing'] = list(self.__iterate_timing(session, chunk_size))
+        return temp
+
+    def stream(self, session, chunk_size=1000):
+        """
+        Same as serialize (including everything) but record by record for runs too large to be built up in memory
+        :param session:
+        :param chunk_size: number of rows fetched from the database at a time
+        :return: generator of dicts, the first being the run itself and all others a log, data, or timing record
+        """
+        yield dict(self.__serialize_head(session), record='run')
+        for temp_log in self.__iterate_log(session, chunk_size):
+            yield dict(temp_log, record='log')
+        for temp_data in self.__iterate_data(session, chunk_size):
+            yield dict(temp_data, record='data')
+        for temp_timing in self.__iterate_timing(session, chunk_size):
+            yield dict(temp_timing, record='timing')
+
+    def __serialize_head(self, session):
+        return {
+            'uid': self.uid,
+            'created': self.created,
+            'runtime': self.runtime,
+            'status': self.status.name,
+            'instance': self.instance.jsonify(),
+            'recipe': self.recipe.jsonify(),
+            'steps': [
+                {'uid': uid, 'sort': sort, 'type': type.name, 'value': value, 'active': active}
+                for uid, sort, type, value, active in session.query(
+                    RecipeStep.uid, RecipeStep.sort, RecipeStep.type, RecipeStep.value, RecipeStep.active
+                ).filter(RecipeStep.recipe_uid == self.recipe_uid).order_by(RecipeStep.sort, RecipeStep.uid)
+            ]
+        }
+
+    def __iterate_log(self, session, chunk_size):
+        query = session.query(Log.uid, Log.created, Log.type, Log.message)\
+            .filter(Log.run_uid == self.uid)\
+            .order_by(Log.created, Log.uid)\
+            .execution_options(stream_results=True)\
+            .yield_per(chunk_size)
+        for uid, created, type, message in query:
+            yield {'uid': uid, 'created': created, 'type': type.name, 'message': message}
+
+    def __iterate_data(self, session, chunk_size):
+        query = session.query(Data.uid, Data.created, Data.value, Data.step_uid, Blob.compression, Blob.content)\
+            .outerjoin(Blob, Data.blob_hash == Blob.hash)\
+            .filter(Data.run_uid == self.uid)\
+            .order_by(Data.created, Data.uid)\
+            .execution_options(stream_results=True)\
+            .yield_per(chunk_size)
+        for uid, created, value, step_uid, compression, content in query:
+            yield {
+                'uid': uid,
+                'created': created,
+                'value': value if content is None else Blob.decompress(content, compression),
+                'step': step_uid
+            }
+
+    def __iterate_timing(self, session, chunk_size):
+        query = session.query(StepTiming.uid, StepTiming.step_uid, StepTiming.label, StepTiming.duration,
+                              StepTiming.calls, StepTiming.data_count)\
+            .filter(StepTiming.run_uid == self.uid)\
+            .order_by(StepTiming.uid)\
+            .yield_per(chunk_size)
+        for uid, step_uid, label, duration, calls, data_count in query:
+            yield {'uid': uid, 'step': step_uid, 'label': label, 'duration': duration, 'calls': calls,
+                   'data_count': data_count}
+
+    def jsonify(self, include_log=False, include_data=False, include_timing=False):
         temp = {
             'uid': self.uid,
             'created': self.created,
@@ -470,9 +921,94 @@ class Run(base):
             temp['data'] = []
             for temp_data in self.data:
                 temp['data'].append(temp_data.jsonify())
+        if include_timing:
+            temp['timing'] = []
+            for temp_timing in self.timings:
+                temp['timing'].append(temp_timing.jsonify())
         return temp
 
 
+class RunStatistics(base):
+    """
+    Daily rollup of runs per recipe and instance, maintained whenever a run finishes (see backfill_statistics.py for
+    installations with runs from before this table existed)
+    """
+    __tablename__ = 'runstatistics'
+    __table_args__ = (
+        UniqueConstraint('recipe_uid', 'instance_uid', 'day', name='runstatistics_recipe_instance_day'),
+    )
+    uid = Column(Integer, primary_key=True)
+    recipe_uid = Column(Integer, ForeignKey('recipe.uid'))
+    recipe = relationship('Recipe')
+    instance_uid = Column(Integer, ForeignKey('instance.uid'))
+    instance = relationship('Instance')
+    day = Column(Date)
+    runs = Column(Integer, default=0)
+    successes = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    runtime_sum = Column(Integer, default=0)
+    runtime_min = Column(Integer)
+    runtime_max = Column(Integer)
+    data_count = Column(Integer, default=0)
+
+    def __repr__(self):
+        return "<RunStatistics(recipe='%s', instance='%s', day='%s', runs='%d')>" % \
+               (self.recipe_uid, self.instance_uid, self.day, self.runs)
+
+    @staticmethod
+    def add_run(session, run):
+        """
+        Adds a finished run to its day's statistics through an atomic UPDATE (or an INSERT for the day's first run)
+        :param session:
+        :param run: flushed run with its final status and runtime
+        :return:
+        """
+        runtime = run.runtime or 0
+        success = 1 if run.status == RunStatusEnum.success else 0
+        key = {'recipe_uid': run.recipe_uid, 'instance_uid': run.instance_uid, 'day': run.created.date()}
+        for attempt in range(0, 2):
+            updated = session.query(RunStatistics)\
+                .filter_by(**key)\
+                .update({
+                    RunStatistics.runs: RunStatistics.runs + 1,
+                    RunStatistics.successes: RunStatistics.successes + success,
+                    RunStatistics.errors: RunStatistics.errors + 1 - success,
+                    RunStatistics.runtime_sum: RunStatistics.runtime_sum + runtime,
+                    RunStatistics.runtime_min: case([(RunStatistics.runtime_min > runtime, runtime)],
+                                                    else_=RunStatistics.runtime_min),
+                    RunStatistics.runtime_max: case([(RunStatistics.runtime_max < runtime, runtime)],
+                                                    else_=RunStatistics.runtime_max),
+                    RunStatistics.data_count: RunStatistics.data_count + run.data_count
+                }, synchronize_session=False)
+            if updated > 0:
+                return
+            try:
+                # the savepoint keeps the run itself if another worker inserted the day's row in the meantime
+                with session.begin_nested():
+                    session.execute(RunStatistics.__table__.insert(), dict(
+                        key, runs=1, successes=success, errors=1 - success,
+                        runtime_sum=runtime, runtime_min=runtime, runtime_max=runtime, data_count=run.data_count
+                    ))
+                return
+            except IntegrityError:
+                pass
+
+    def jsonify(self):
+        return {
+            'uid': self.uid,
+            'recipe_uid': self.recipe_uid,
+            'instance_uid': self.instance_uid,
+            'day': self.day,
+            'runs': self.runs,
+            'successes': self.successes,
+            'errors': self.errors,
+            'runtime_sum': self.runtime_sum,
+            'runtime_min': self.runtime_min,
+            'runtime_max': self.runtime_max,
+            'data_count': self.data_count
+        }
+
+
 class LogTypeEnum(enum.Enum):
     info = 1
     warning = 2
@@ -502,11 +1038,96 @@ class Log(base):
         }
 
 
+class Blob(base):
+    __tablename__ = 'blob'
+    uid = Column(Integer, primary_key=True)
+    created = Column(DateTime, default=func.now())
+    hash = Column(String(64), unique=True)
+    compression = Column(String(16), default='zlib')
+    size = Column(Integer)
+    # the length turns this into a LONGBLOB on MySQL, whose default BLOB would be limited to 64 KB
+    content = Column(LargeBinary(length=2**32-1))
+    data = relationship('Data', back_populates='blob', lazy='select')
+
+    def __repr__(self):
+        return "<Blob(hash='%s', compression='%s', size='%d')>" % (self.hash, self.compression, self.size)
+
+    def get_value(self):
+        return Blob.decompress(self.content, self.compression)
+
+    @staticmethod
+    def get_hash(value):
+        return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def compress(value, compression='zlib'):
+        """
+        Compresses a data value, where zstd requires the zstandard package and falls back to zlib otherwise
+        :param value:
+        :param compression: zlib or zstd
+        :return: tuple of the compression actually used and the compressed bytes
+        """
+        if compression == 'zstd':
+            try:
+                import zstandard
+                return 'zstd', zstandard.ZstdCompressor().compress(value.encode('utf-8'))
+            except ImportError:
+                pass
+        return 'zlib', zlib.compress(value.encode('utf-8'))
+
+    @staticmethod
+    def decompress(content, compression):
+        if content is None:
+            return None
+        if compression == 'zstd':
+            import zstandard
+            return zstandard.ZstdDecompressor().decompress(content).decode('utf-8')
+        return zlib.decompress(content).decode('utf-8')
+
+    @staticmethod
+    def store(session, values, compression='zlib'):
+        """
+        Stores values as blobs, where each distinct content is only compressed and written once (i.e., values already
+        stored by prior runs are not written again)
+        :param session:
+        :param values: list of str
+        :param compression: zlib or zstd
+        :return: dict of the values' hashes by value
+        """
+        hashes = {}
+        for value in values:
+            hashes[value] = Blob.get_hash(value)
+        existing = set()
+        unique_hashes = list(set(hashes.values()))
+        for i in range(0, len(unique_hashes), 500):
+            existing.update([blob_hash for (blob_hash,) in session.query(Blob.hash)
+                            .filter(Blob.hash.in_(unique_hashes[i:i+500]))])
+        for value, blob_hash in hashes.items():
+            if blob_hash not in existing:
+                used_compression, content = Blob.compress(value, compression)
+                try:
+                    # the savepoint keeps the run if another instance stored the very same content in the meantime
+                    with session.begin_nested():
+                        session.execute(Blob.__table__.insert(), {
+                            'hash': blob_hash, 'compression': used_compression, 'size': len(value), 'content': content
+                        })
+                except IntegrityError:
+                    pass
+                existing.add(blob_hash)
+        return hashes
+
+
 class Data(base):
     __tablename__ = 'data'
+    __table_args__ = (
+        # backing RecipeStep.has_data_in_latest_runs
+        Index('data_step_run', 'step_uid', 'run_uid'),
+    )
     uid = Column(Integer, primary_key=True)
     created = Column(DateTime, default=func.now())
     value = Column(Text)
+    blob_hash = Column(String(64), ForeignKey('blob.hash'))
+    blob = relationship(Blob, back_populates='data')
     run_uid = Column(Integer, ForeignKey('run.uid'))
     run = relationship(Run, back_populates='data')
     step_uid = Column(Integer, ForeignKey('recipestep.uid'))
@@ -514,13 +1135,249 @@ class Data(base):
 
     def __repr__(self):
         return "<Data(date='%s', recipe='%s', step='%s', value='%s')>" % \
-               (self.created, self.run.recipe.name, self.step.sort, self.value)
+               (self.created, self.run.recipe.name, self.step.sort, self.get_value())
+
+    def get_value(self):
+        """
+        Returns the value, which large values (see Run.store_buffer) hold in their blob instead
+        :return:
+        """
+        if self.blob_hash is not None and self.value is None:
+            return self.blob.get_value()
+        return self.value
 
     def jsonify(self):
         return {
             'uid': self.uid,
             'created': self.created,
-            'value': self.value,
+            'value': self.get_value(),
             'run': self.run.jsonify(),
             'step': self.step.jsonify()
         }
+
+
+class StepTiming(base):
+    """
+    How long a step took within a run, how many WebDriver commands it sent, and how much data it stored; rows without
+    step cover what happens around the steps (i.e., browser_start, browser_end, and store)
+    """
+    __tablename__ = 'step_timing'
+    __table_args__ = (
+        # backing StepTiming.summarize, which joins a recipe's runs
+        Index('step_timing_run', 'run_uid'),
+    )
+    uid = Column(Integer, primary_key=True)
+    run_uid = Column(Integer, ForeignKey('run.uid'))
+    run = relationship(Run, back_populates='timings')
+    step_uid = Column(Integer, ForeignKey('recipestep.uid'))
+    step = relationship(RecipeStep)
+    label = Column(String(64))
+    duration = Column(Float, default=0)
+    calls = Column(Integer, default=0)
+    data_count = Column(Integer, default=0)
+
+    def __repr__(self):
+        return "<StepTiming(run='%s', label='%s', duration='%s')>" % (self.run_uid, self.label, self.duration)
+
+    @staticmethod
+    def summarize(session, recipe, since=None):
+        """
+        Aggregates the timings of all runs of a recipe per step (and per label for rows without step) in the database
+        :param session:
+        :param recipe:
+        :param since: datetime to only include runs created since then
+        :return: list of dicts, sorted by step
+        """
+        query = session.query(
+            StepTiming.step_uid,
+            StepTiming.label,
+            func.count(StepTiming.uid),
+            func.avg(StepTiming.duration),
+            func.max(StepTiming.duration),
+            func.avg(StepTiming.calls),
+            func.avg(StepTiming.data_count)
+        ).join(Run, StepTiming.run_uid == Run.uid).filter(Run.recipe_uid == recipe.uid)
+        if since is not None:
+            query = query.filter(Run.created >= since)
+        sorts = {step.uid: step.sort for step in recipe.steps}
+        summary = []
+        for step_uid, label, count, average, maximum, calls, data_count in \
+                query.group_by(StepTiming.step_uid, StepTiming.label):
+            summary.append({
+                'step': step_uid,
+                'sort': sorts.get(step_uid),
+                'label': label,
+                'count': count,
+                'duration_avg': float(average or 0),
+                'duration_max': float(maximum or 0),
+                'calls_avg': float(calls or 0),
+                'data_avg': float(data_count or 0)
+            })
+        # browser_start first, then all steps in their order, and browser_end and store last
+        summary.sort(key=lambda row: (0 if row['label'] == 'browser_start' else 1 if row['step'] is not None else 2,
+                                      row['sort'] or 0, row['label']))
+        return summary
+
+    def jsonify(self):
+        return {
+            'uid': self.uid,
+            'step': self.step_uid,
+            'label': self.label,
+            'duration': self.duration,
+            'calls': self.calls,
+            'data_count': self.data_count
+        }
+
+
+class JobTypeEnum(enum.Enum):
+    download = 1
+    duplication = 2
+
+
+class JobStatusEnum(enum.Enum):
+    queued = 0
+    running = 1
+    done = 2
+    failed = 3
+
+
+class Job(base):
+    __tablename__ = 'job'
+    uid = Column(Integer, primary_key=True)
+    created = Column(DateTime, default=func.now())
+    updated = Column(DateTime, default=func.now(), onupdate=func.now())
+    type = Column(Enum(JobTypeEnum))
+    status = Column(Enum(JobStatusEnum), default=JobStatusEnum.queued)
+    payload = Column(Text)
+    progress = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    message = Column(Text)
+    user_uid = Column(Integer, ForeignKey('user.uid'))
+    user = relationship(User)
+
+    def __repr__(self):
+        return "<Job(type='%s', status='%s', progress='%d')>" % (self.type, self.status, self.progress or 0)
+
+    def get_payload(self):
+        return json.loads(self.payload) if self.payload else {}
+
+    @staticmethod
+    def enqueue(session, user, type, payload):
+        """
+        Adds a new job to the queue, to be picked up by the next free worker (see worker.py)
+        :param session:
+        :param user: who gets notified and who is allowed to check on the job's progress
+        :param type: JobTypeEnum
+        :param payload: JSON-serializable dict with everything the job needs
+        :return:
+        """
+        job = Job(user=user, type=type, payload=json.dumps(payload), status=JobStatusEnum.queued)
+        session.add(job)
+        session.commit()
+        return job
+
+    @staticmethod
+    def claim_next(session, retry_delay=60):
+        """
+        Atomically claims the oldest queued job, so that no two workers (not even across hosts) ever pick the same one
+        :param session:
+        :param retry_delay: seconds a job waits after a failed attempt before being claimed again
+        :return: the claimed job or None if no job is waiting
+        """
+        now = session.query(func.now()).first()[0]
+        candidates = session.query(Job.uid)\
+            .filter(
+                Job.status == JobStatusEnum.queued,
+                or_(Job.attempts == 0, Job.updated <= now - timedelta(seconds=retry_delay))
+            )\
+            .order_by(Job.uid)\
+            .limit(10)\
+            .all()
+        for (uid,) in candidates:
+            claimed = session.query(Job)\
+                .filter(Job.uid == uid, Job.status == JobStatusEnum.queued)\
+                .update({
+                    Job.status: JobStatusEnum.running,
+                    Job.attempts: Job.attempts + 1,
+                    Job.updated: func.now()
+                }, synchronize_session=False)
+            session.commit()
+            if claimed == 1:
+                return session.query(Job).filter(Job.uid == uid).one()
+        return None
+
+    @staticmethod
+    def requeue_stale(session, timeout=3600):
+        """
+        Puts running jobs back into the queue whose worker has not reported any progress for too long (e.g., because
+        it has been killed)
+        :param session:
+        :param timeout: in seconds
+        :return: number of jobs requeued
+        """
+        now = session.query(func.now()).first()[0]
+        requeued = session.query(Job)\
+            .filter(Job.status == JobStatusEnum.running, Job.updated <= now - timedelta(seconds=timeout))\
+            .update({Job.status: JobStatusEnum.queued, Job.message: 'Worker timed out'}, synchronize_session=False)
+        session.commit()
+        return requeued
+
+    @staticmethod
+    def report_progress(session, uid, progress):
+        """
+        Stores the progress of a running job (which also tells other workers that the job is still alive)
+        :param session:
+        :param uid:
+        :param progress: in percent
+        :return:
+        """
+        session.query(Job)\
+            .filter(Job.uid == uid)\
+            .update({Job.progress: max(0, min(100, int(progress))), Job.updated: func.now()},
+                    synchronize_session=False)
+        session.commit()
+
+    @staticmethod
+    def save_payload(session, uid, payload):
+        """
+        Stores how far a running job got within its payload, without committing, so that this is committed along with
+        (and only along with) the job's own work; a retried job then picks up where the failed attempt left off
+        :param session: the session the job does its work in
+        :param uid:
+        :param payload:
+        :return:
+        """
+        session.query(Job)\
+            .filter(Job.uid == uid)\
+            .update({Job.payload: json.dumps(payload)}, synchronize_session=False)
+
+    def finish(self, message=None):
+        self.status = JobStatusEnum.done
+        self.progress = 100
+        self.message = message
+
+    def fail(self, message, retries=3):
+        """
+        Marks the current attempt as failed and requeues the job unless it has run out of retries
+        :param message:
+        :param retries: number of attempts after the first one
+        :return: True if the job will be retried
+        """
+        self.message = message
+        if self.attempts <= retries:
+            self.status = JobStatusEnum.queued
+            return True
+        self.status = JobStatusEnum.failed
+        return False
+
+    def jsonify(self):
+        return {
+            'uid': self.uid,
+            'created': self.created,
+            'updated': self.updated,
+            'type': self.type.name,
+            'status': self.status.name,
+            'progress': self.progress,
+            'attempts': self.attempts,
+            'message': self.message
+        }
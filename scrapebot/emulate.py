@@ -1,98 +1,143 @@
+import io
 import sys
-import enum
-import datetime
+import base64
 import json
 import time
 import random
 import platform
 import traceback
-from pyvirtualdisplay import Display
 # https://selenium-python.readthedocs.io
 from selenium import webdriver
-from selenium.common.exceptions import WebDriverException, NoSuchElementException
+from selenium.common.exceptions import WebDriverException, NoSuchElementException, JavascriptException
 from selenium.webdriver.firefox.firefox_binary import FirefoxBinary
+from scrapebot.browser import BrowserSession, browser_pool, display_manager
+from scrapebot.upload import screenshot_uploader
+from scrapebot.extract import split_extraction_value
+from scrapebot.steptypes import RecipeStepTypeEnum
+from scrapebot.steps import StepHandler, StepRegistry, ENTRY_POINT_GROUP, wait_through, LogHandler, DataHandler, \
+    PauseHandler, RandomSelectHandler, ElementCountHandler, UnsetPriorElementHandler
 
 
-class RecipeStepTypeEnum(enum.Enum):
-    navigate = '-> Navigate to the URL as provided in "value"'
-
-    find_by_id = '| Find an element using its ID as provided in "value"'
-    find_by_name = '| Find an element using its name as provided in "value"'
-    find_by_class = '| Find one or many element(s) using a CSS class name as provided in "value"'
-    find_by_tag = '| Find one or many element(s) using a tag name as provided in "value"'
-    find_by_link = '| Find one or many <a> element(s) by searching for their complete link as provided in "value"'
-    find_by_link_partial = '| Find one or many <a> element(s) by searching for parts of their link as provided in ' \
-                           '"value"'
-    find_by_css = '| Find one or many element(s) using a more sophisticated CSS selector as provided in "value"'
-    find_by_xpath = '| Find one or many element(s) using a more sophisticated XPath selector as provided in "value"'
-
-    random_select = '| Randomly select one element of the ones that have been identified in the previous step'
-
-    scroll_to = '| Scroll the page for "value" pixels (or the page bottom, if not specified) with random breaks'
-    pause = '| Wait for value seconds (+/- 25% to introduce some randomness)'
-    click = '-> Click on the element which has been identified in the previous step'
-    write = '. Write "value" onto the element which has been identified in the previous step'
-    write_slowly = '. Write "value" slowly (i.e., character by character, pausing in between, like slow typing) ' \
-                   'onto the the element which has been identified in the previous step'
-    submit = '-> Submit on the element which has been identified in the previous step'
-
-    get_text = '<- Store the text of the first element which has been identified in the previous step as data'
-    get_texts = '<<- Store all texts of all elements identified in the previous step as data'
-    get_value = '<- Store the value of the first element which has been identified in the previous step as data'
-    get_values = '<<- Store all values of all elements identified in the previous step as data'
-    get_attribute = '<- Store the value of the attribute as provided in "value" of the first element which has been ' \
-                    'identified in the previous step as data'
-    get_attributes = '<<- Store the values of the attributes as provided in "value" of all elements which have been ' \
-                     'identified in the previous step as data'
-    get_pagetitle = '<- Store the page title as data'
-    get_element_count = '<- Store the number of previously found elements as data'
-    get_htmlsource = '<- Store the complete HTML source code (WARNING: huuuge amount of data; handle with great care)'
-
-    log = '. Simply log "value" into the log file'
-    data = '. Store "value" as data entry'
-    execute_js = '. Execute "value" as JavaScript code (store any returned value as data)'
-    go_back = '<- Go back one step in the browser history'
-    go_forward = '-> Go forward one step in the browser history (only available if you went back before)'
-    unset_prior_element = '. Remove any previously retrieved element (which could cause error upon further navigation)'
-    screenshot = '. Take a screenshot of the whole page as PNG file'
-    sometimes_screenshot = '. Only take a screenshot of the whole page in 5% of the runs of this recipe on any instance'
-    element_screenshot = '. Take a screenshot of the element which has been identified in the previous step as PNG file'
-
-    # @todo?: allow steps to be grouped (through parent steps) and randomly chosen (either one step or random order)
-
-    @classmethod
-    def choices(cls):
-        return [(choice.name, choice.value) for choice in cls]
-
-    @classmethod
-    def coerce(cls, item):
-        try:
-            return item.name if isinstance(item, RecipeStepTypeEnum) else item
-        except KeyError:
-            return None
+# reads the visible text (or an attribute, preferring the DOM property just like WebElement.get_attribute does) of
+# many elements at once, as every single WebElement call is a WebDriver round trip of its own
+PROPERTIES_JS_FUNCTION = '''function(elements, attribute) {
+    var aliases = {'class': 'className', 'readonly': 'readOnly'};
+    return Array.prototype.map.call(elements, function(element) {
+        if (element.nodeType !== 1) {
+            return element.nodeValue !== null ? element.nodeValue : element.textContent;
+        } else if (attribute === null) {
+            return element.getClientRects().length === 0 ? '' : element.innerText.trim();
+        }
+        var property = element[aliases[attribute] || attribute];
+        if (typeof(property) === 'boolean') {
+            return property ? 'true' : null;
+        } else if (property !== undefined && property !== null && typeof(property) !== 'object' &&
+                   typeof(property) !== 'function') {
+            return String(property);
+        }
+        return element.getAttribute(attribute);
+    });
+}'''
+BATCH_PROPERTIES_JS = 'return (' + PROPERTIES_JS_FUNCTION + ')(arguments[0], arguments[1]);'
+
+# finds elements and reads their texts (or an attribute) within the page, so that no WebElement is ever sent back
+EXTRACT_JS = '''
+var elements = [];
+if (arguments[0] === 'css') {
+    elements = document.querySelectorAll(arguments[1]);
+} else {
+    var result = document.evaluate(arguments[1], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (var i = 0; i < result.snapshotLength; i++) {
+        elements.push(result.snapshotItem(i));
+    }
+}
+return (''' + PROPERTIES_JS_FUNCTION + ''')(elements, arguments[2]);
+'''
+
+# serializes all rows of a table (or of any other element containing rows) into lists of their cells' texts
+EXTRACT_TABLE_JS = '''
+var table = document.querySelector(arguments[0]);
+if (table === null) {
+    return null;
+}
+return Array.prototype.map.call(table.rows || table.querySelectorAll('tr'), function(row) {
+    return Array.prototype.map.call(row.cells || row.querySelectorAll('td, th'), function(cell) {
+        return cell.innerText.trim();
+    });
+});
+'''
+
+# full-page captures through browser-specific WebDriver endpoints (i.e., geckodriver and ChromeDriver extensions)
+FIREFOX_FULL_PAGE_COMMAND = ('GET', '/session/$sessionId/moz/screenshot/full')
+CHROME_CDP_COMMAND = ('POST', '/session/$sessionId/goog/cdp/execute')
+# tiled captures stop at this height (in CSS pixels) to keep the stitched image's memory bounded
+MAX_SCREENSHOT_HEIGHT = 32768
 
 
 class Emulator:
     __selenium = None
     __display = None
+    __session = None
+    __healthy = True
     __timeout = 0
     __config = None
 
     def run(self, config, run, step, prior_step=None):
-        from scrapebot.database import Log, RunStatusEnum
+        return wait_through(self.iterate(config, run, step, prior_step))
+
+    def iterate(self, config, run, step, prior_step=None):
+        """
+        Runs the step as generator, which yields all waits (in seconds) rather than sleeping
+        :param config:
+        :param run:
+        :param step:
+        :param prior_step:
+        :return: RunStatusEnum
+        """
+        from scrapebot.database import RunStatusEnum
         if prior_step is None:
             self.__config = config
-            if not self.__init_browser(run):
+            start = time.perf_counter()
+            initialized = self.__init_browser(run)
+            run.add_timing(None, 'browser_start', time.perf_counter() - start, self.__get_calls())
+            if not initialized:
                 return RunStatusEnum.error
         else:
             if self.__timeout > 0:
                 timeout = random.uniform(self.__timeout*.75, self.__timeout*1.25)
-                run.log.append(Log(message='Waiting for ' + str(round(timeout, 1)) + ' seconds'))
-                time.sleep(timeout)
-        return self.__handle(run, step, prior_step)
+                run.add_log('Waiting for ' + str(round(timeout, 1)) + ' seconds')
+                yield timeout
+                run.add_timing(step, 'wait', timeout)
+        calls = self.__get_calls()
+        data_count = run.data_count
+        start = time.perf_counter()
+        try:
+            return (yield from step_registry.iterate(self, run, step, prior_step))
+        except WebDriverException:
+            # a browser that has thrown errors at us is not handed to the next run
+            self.__healthy = False
+            raise
+        finally:
+            run.add_timing(step, step.type.name, time.perf_counter() - start, self.__get_calls() - calls,
+                           run.data_count - data_count)
+
+    def __get_calls(self):
+        return 0 if self.__session is None else self.__session.calls
+
+    def __get_display_count(self):
+        try:
+            return max(1, int(self.__config.get('Instance', 'Displays', fallback=1)))
+        except ValueError:
+            return 1
+
+    def __get_browser_reuse(self):
+        try:
+            return max(1, int(self.__config.get('Instance', 'BrowserReuse', fallback=1)))
+        except ValueError:
+            return 1
 
     def __init_browser(self, run):
-        from scrapebot.database import Log, LogTypeEnum
+        from scrapebot.database import LogTypeEnum
         browser = self.__config.get('Instance', 'browser', fallback='Firefox')
         executable = self.__config.get('Instance', 'BrowserBinary', fallback='')
         user_agent = self.__config.get('Instance', 'BrowserUserAgent', fallback='')
@@ -101,462 +146,663 @@ class Emulator:
             lib_prefix = self.__config.get('Instance', 'LibDirPrefix', fallback='')
             browser_width = int(self.__config.get('Instance', 'BrowserWidth', fallback=1024))
             browser_height = int(self.__config.get('Instance', 'BrowserHeight', fallback=768))
+            self.__timeout = float(self.__config.get('Instance', 'Timeout', fallback=0))
+            key = (browser, executable, user_agent, language, browser_width, browser_height)
+            if self.__get_browser_reuse() > 1:
+                self.__session = browser_pool.acquire(key)
+                if self.__session is not None:
+                    self.__selenium = self.__session.selenium
+                    self.__display = self.__session.display
+                    run.add_log('Reusing warm ' + browser + ' session (previously used for ' +
+                                str(self.__session.runs) + ' run(s)) at ' + str(browser_width) +
+                                ' by ' + str(browser_height) + ' pixel')
+                    run.add_log('Browser timeout set to ' + str(self.__timeout) + ' seconds')
+                    return True
             display_width = int(browser_width*1.2)
             display_height = int(browser_height*1.2)
             if platform.system() == 'Linux':
-                self.__display = Display(visible=0, size=(display_width, display_height))
-                self.__display.start()
-                run.log.append(Log(message='Running on a virtual display at ' + str(display_width) + ' by ' +
-                                           str(display_height)))
-            if browser == 'Firefox':
-                gecko = '32' if platform.architecture()[0].startswith('32') else '64'
-                if platform.system() == 'Linux':
-                    if platform.machine().lower().startswith('arm'):
-                        gecko = lib_prefix + 'lib/geckodriver-arm-v0.23'
-                    else:
-                        gecko = lib_prefix + 'lib/geckodriver-linux' + gecko
-                elif platform.system() == 'Darwin':
-                    gecko = lib_prefix + 'lib/geckodriver-macos'
-                else:
-                    gecko = lib_prefix + 'lib/geckodriver-win' + gecko + '.exe'
-                profile = webdriver.FirefoxProfile()
-                if user_agent != '':
-                    profile.set_preference('general.useragent.override', user_agent)
-                profile.set_preference('intl.accept_languages', language)
-                run.log.append(Log(message='Browser accept language set to "' + language + '"'))
-                if executable == '':
-                    self.__selenium = webdriver.Firefox(firefox_profile=profile, executable_path=gecko)
-                    run.log.append(Log(message='Browser instance set to Firefox with Geckodriver "' + gecko + '"'))
-                else:
-                    self.__selenium = webdriver.Firefox(firefox_profile=profile,
-                                                        executable_path=gecko,
-                                                        firefox_binary=FirefoxBinary(executable))
-                    run.log.append(Log(message='Browser instance set to Firefox with Geckodriver "' + gecko +
-                                               '" and executable path "' + executable + '"'))
-            elif browser == 'Chrome':
-                if executable == '':
-                    if platform.system() == 'Linux':
-                        if platform.machine().lower().startswith('arm'):
-                            executable = lib_prefix + 'lib/chromedriver-arm'
-                        else:
-                            executable = lib_prefix + 'lib/chromedriver-linux'
-                    elif platform.system() == 'Darwin':
-                        executable = lib_prefix + 'lib/chromedriver-macos'
-                    else:
-                        executable = lib_prefix + 'lib/chromedriver-win.exe'
-                options = webdriver.ChromeOptions()
-                if user_agent != '':
-                    options.add_argument('--user-agent=' + user_agent)
-                options.add_argument('--lang=' + language)
-                options.add_experimental_option('prefs', {'intl.accept_languages': language})
-                run.log.append(Log(message='Browser accept language set to "' + language + '"'))
-                self.__selenium = webdriver.Chrome(executable_path=executable, chrome_options=options)
-                run.log.append(Log(message='Browser instance set to Chrome with ChromeDriver "' + executable + '"'))
-            else:
-                webdriver_class = getattr(webdriver, browser)
-                if executable == '':
-                    self.__selenium = webdriver_class()
-                    run.log.append(Log(message='Browser instance set to ' + browser))
-                else:
-                    self.__selenium = webdriver.Chrome(executable_path=executable)
-                    run.log.append(Log(message='Browser instance set to ' + browser + ' with executable path "' +
-                                               executable + '"'))
+                self.__display = display_manager.acquire(display_width, display_height, self.__get_display_count())
+                run.add_log('Running on shared virtual display ' + self.__display.name + ' at ' +
+                            str(self.__display.width) + ' by ' + str(self.__display.height) +
+                            ' (used by ' + str(self.__display.users) + ' browser(s))')
+            with display_manager.environment(self.__display):
+                self.__launch_browser(run, browser, executable, user_agent, language, lib_prefix)
+            self.__session = BrowserSession(key, self.__selenium, self.__display)
             self.__selenium.set_window_size(browser_width, browser_height)
-            run.log.append(Log(message='Browser size set to ' + str(browser_width) + ' by ' +
-                                       str(browser_height) + ' pixel'))
-            self.__timeout = float(self.__config.get('Instance', 'Timeout', fallback=0))
-            run.log.append(Log(message='Browser timeout set to ' + str(self.__timeout) + ' seconds'))
+            run.add_log('Browser size set to ' + str(browser_width) + ' by ' + str(browser_height) + ' pixel')
+            run.add_log('Browser timeout set to ' + str(self.__timeout) + ' seconds')
             user_agent = self.__selenium.execute_script('return navigator.userAgent')
-            run.log.append(Log(message='User agent for this session is "' + user_agent + '"'))
+            run.add_log('User agent for this session is "' + user_agent + '"')
             # @todo?: add encoding (Accept-Charset and Accept); however, neither is currently available to Selenium
             return True
         except WebDriverException:
             if sys.exc_info()[2] is not None:
-                run.log.append(Log(message=browser + ' has raised the following error: ' + traceback.format_exc(),
-                                   type=LogTypeEnum.error))
+                run.add_log(browser + ' has raised the following error: ' + traceback.format_exc(), LogTypeEnum.error)
             else:
-                run.log.append(Log(message='Browser instance "' + browser + '" not found', type=LogTypeEnum.error))
+                run.add_log('Browser instance "' + browser + '" not found', LogTypeEnum.error)
+            self.__healthy = False
             self.close_session(run)
             return False
         except:
             if sys.exc_info()[2] is not None:
-                run.log.append(Log(message=traceback.format_exc(), type=LogTypeEnum.error))
+                run.add_log(traceback.format_exc(), LogTypeEnum.error)
+            self.__healthy = False
             self.close_session(run)
             return False
 
+    def __launch_browser(self, run, browser, executable, user_agent, language, lib_prefix):
+        if browser == 'Firefox':
+            gecko = '32' if platform.architecture()[0].startswith('32') else '64'
+            if platform.system() == 'Linux':
+                if platform.machine().lower().startswith('arm'):
+                    gecko = lib_prefix + 'lib/geckodriver-arm-v0.23'
+                else:
+                    gecko = lib_prefix + 'lib/geckodriver-linux' + gecko
+            elif platform.system() == 'Darwin':
+                gecko = lib_prefix + 'lib/geckodriver-macos'
+            else:
+                gecko = lib_prefix + 'lib/geckodriver-win' + gecko + '.exe'
+            profile = webdriver.FirefoxProfile()
+            if user_agent != '':
+                profile.set_preference('general.useragent.override', user_agent)
+            profile.set_preference('intl.accept_languages', language)
+            run.add_log('Browser accept language set to "' + language + '"')
+            if executable == '':
+                self.__selenium = webdriver.Firefox(firefox_profile=profile, executable_path=gecko)
+                run.add_log('Browser instance set to Firefox with Geckodriver "' + gecko + '"')
+            else:
+                self.__selenium = webdriver.Firefox(firefox_profile=profile,
+                                                    executable_path=gecko,
+                                                    firefox_binary=FirefoxBinary(executable))
+                run.add_log('Browser instance set to Firefox with Geckodriver "' + gecko +
+                            '" and executable path "' + executable + '"')
+        elif browser == 'Chrome':
+            if executable == '':
+                if platform.system() == 'Linux':
+                    if platform.machine().lower().startswith('arm'):
+                        executable = lib_prefix + 'lib/chromedriver-arm'
+                    else:
+                        executable = lib_prefix + 'lib/chromedriver-linux'
+                elif platform.system() == 'Darwin':
+                    executable = lib_prefix + 'lib/chromedriver-macos'
+                else:
+                    executable = lib_prefix + 'lib/chromedriver-win.exe'
+            options = webdriver.ChromeOptions()
+            if user_agent != '':
+                options.add_argument('--user-agent=' + user_agent)
+            options.add_argument('--lang=' + language)
+            options.add_experimental_option('prefs', {'intl.accept_languages': language})
+            run.add_log('Browser accept language set to "' + language + '"')
+            self.__selenium = webdriver.Chrome(executable_path=executable, chrome_options=options)
+            run.add_log('Browser instance set to Chrome with ChromeDriver "' + executable + '"')
+        else:
+            webdriver_class = getattr(webdriver, browser)
+            if executable == '':
+                self.__selenium = webdriver_class()
+                run.add_log('Browser instance set to ' + browser)
+            else:
+                self.__selenium = webdriver.Chrome(executable_path=executable)
+                run.add_log('Browser instance set to ' + browser + ' with executable path "' + executable + '"')
+
     def close_session(self, run):
-        from scrapebot.database import Log
+        if self.__selenium is None and self.__display is None:
+            return None
+        session = self.__session
+        calls = self.__get_calls()
+        start = time.perf_counter()
+        closed = self.__close_session(run)
+        run.add_timing(None, 'browser_end', time.perf_counter() - start,
+                       0 if session is None else session.calls - calls)
+        return closed
+
+    def __close_session(self, run):
         if self.__selenium is not None:
-            if run.recipe.cookies:
-                order = run.get_recipe_order()
-                if order is not None:
-                    order.cookies_from_last_run = json.dumps(self.__selenium.get_cookies())
-                    run.log.append(Log(message='Cookies stored'))
+            try:
+                if run.recipe.cookies:
+                    order = run.get_recipe_order()
+                    if order is not None:
+                        order.cookies_from_last_run = json.dumps(self.__selenium.get_cookies())
+                        run.add_log('Cookies stored')
+            except WebDriverException:
+                self.__healthy = False
+            if self.__session is not None:
+                if browser_pool.release(self.__session, self.__get_browser_reuse(), self.__healthy):
+                    run.add_log('Browser session reset and kept for the next run')
+                else:
+                    run.add_log('Browser session closed')
+                self.__selenium = None
+                self.__display = None
+                self.__session = None
+                return True
             self.__selenium.quit()
-            run.log.append(Log(message='Browser session closed'))
+            run.add_log('Browser session closed')
         if self.__display is not None:
-            try:
-                self.__display.stop()
-                run.log.append(Log(message='Virtual display closed'))
-            except:
-                return False
+            display_manager.release(self.__display)
+            self.__display = None
+            run.add_log('Virtual display released')
+
+    @property
+    def selenium(self):
+        return self.__selenium
 
-    def __get_first_elem_or_none(self, element):
+    @property
+    def config(self):
+        return self.__config
+
+
+class ExecuteJsHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        return_value = emulator.selenium.execute_script(step.value)
+        if return_value:
+            run.add_data(step, return_value)
+            run.add_log('Ran some JavaScript code, return values stored as data')
+        else:
+            run.add_log('Ran JavaScript code, no return values retrieved')
+        return RunStatusEnum.success
+
+
+class NavigateHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        emulator.selenium.get(step.value)
+        if run.recipe.cookies:
+            order = run.get_recipe_order()
+            if order is not None:
+                cookies = json.loads(order.cookies_from_last_run)
+                for cookie in cookies:
+                    emulator.selenium.add_cookie(cookie)
+                run.add_log('Cookies loaded for browser session')
+                emulator.selenium.get(step.value)
+        run.add_log('Navigated to "' + step.value + '"')
+        return RunStatusEnum.success
+
+
+class ClickHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        element = self.get_first_elem_or_none(prior_step.temp_result)
         if element is None:
-            return None
-        elif isinstance(element, list):
-            return element[0] if len(element) > 0 else None
+            run.add_log('No element available for clicking', LogTypeEnum.warning)
         else:
-            return element
+            element.click()
+            run.add_log('Clicked on previously retrieved element')
+        return RunStatusEnum.success
 
-    def __get_elem_list(self, elements):
-        if elements is None:
-            return []
-        elif isinstance(elements, list):
-            return elements
+
+class SubmitHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        element = self.get_first_elem_or_none(prior_step.temp_result)
+        if element is None:
+            run.add_log('No element available for submitting', LogTypeEnum.warning)
         else:
-            return [elements]
-
-    def __handle(self, run, step, prior_step=None):
-        from scrapebot.database import Log, LogTypeEnum, RunStatusEnum, Data
-        if step.type.name == 'log':
-            run.log.append(Log(message=step.value))
-        elif step.type.name == 'data':
-            run.data.append(Data(step=step, value=step.value))
-        elif step.type.name == 'execute_js':
-            return_value = self.__selenium.execute_script(step.value)
-            if return_value:
-                run.data.append(Data(step=step, value=return_value))
-                run.log.append(Log(message='Ran some JavaScript code, return values stored as data'))
-            else:
-                run.log.append(Log(message='Ran JavaScript code, no return values retrieved'))
-        elif step.type.name == 'navigate':
-            self.__selenium.get(step.value)
-            if run.recipe.cookies:
-                order = run.get_recipe_order()
-                if order is not None:
-                    cookies = json.loads(order.cookies_from_last_run)
-                    for cookie in cookies:
-                        self.__selenium.add_cookie(cookie)
-                    run.log.append(Log(message='Cookies loaded for browser session'))
-                    self.__selenium.get(step.value)
-            run.log.append(Log(message='Navigated to "' + step.value + '"'))
-        elif step.type.name == 'click':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available for clicking', type=LogTypeEnum.warning))
-            else:
-                element.click()
-                run.log.append(Log(message='Clicked on previously retrieved element'))
-        elif step.type.name == 'submit':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available for submitting', type=LogTypeEnum.warning))
-            else:
-                element.submit()
-                run.log.append(Log(message='Submitted on previously retrieved element'))
-                prior_step.temp_result = None
-                step.temp_result = None
-                run.log.append(Log(message='Removed previously retrieved element as it may disappear after submit'))
-        elif step.type.name == 'pause':
-            pause = int(step.value)
-            pause = random.uniform(pause*.75, pause*1.25)
-            time.sleep(pause)
-            run.log.append(Log(message='Paused for ' + str(round(pause, 1)) + ' seconds'))
-        elif step.type.name == 'write':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available for typing', type=LogTypeEnum.warning))
-            else:
-                element.send_keys(step.value)
-                run.log.append(Log(message='Typed "' + step.value + '" on previously retrieved element'))
-        elif step.type.name == 'write_slowly':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available for typing', type=LogTypeEnum.warning))
-            else:
-                for char in step.value:
-                    element.send_keys(char)
-                    time.sleep(random.uniform(0.1, 1))
-                run.log.append(Log(message='Typed "' + step.value + '" very slowly on previously retrieved element'))
-        elif step.type.name == 'scroll_to':
+            element.submit()
+            run.add_log('Submitted on previously retrieved element')
+            prior_step.temp_result = None
+            step.temp_result = None
+            run.add_log('Removed previously retrieved element as it may disappear after submit')
+        return RunStatusEnum.success
+
+
+class WriteHandler(StepHandler):
+    def __init__(self, slowly=False):
+        self.__slowly = slowly
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        element = self.get_first_elem_or_none(prior_step.temp_result)
+        if element is None:
+            run.add_log('No element available for typing', LogTypeEnum.warning)
+        elif self.__slowly:
+            for char in step.value:
+                element.send_keys(char)
+                yield random.uniform(0.1, 1)
+            run.add_log('Typed "' + step.value + '" very slowly on previously retrieved element')
+        else:
+            element.send_keys(step.value)
+            run.add_log('Typed "' + step.value + '" on previously retrieved element')
+        return RunStatusEnum.success
+
+
+class ScrollHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        scroll_to = -1
+        try:
+            scroll_to = int(step.value)
+            if scroll_to == 0:
+                raise ValueError
+            run.add_log('Scrolling for ' + str(scroll_to) + ' pixels')
+        except ValueError:
             scroll_to = -1
-            try:
-                scroll_to = int(step.value)
-                if scroll_to == 0:
-                    raise ValueError
-                run.log.append(Log(message='Scrolling for ' + str(scroll_to) + ' pixels'))
-            except ValueError:
-                scroll_to = -1
-                run.log.append(Log(message='Scrolling to the bottom of the page'))
-            scroll_step = 10 if scroll_to > 10 or scroll_to == -1 else scroll_to
-            scroll_js = 'function scroll_and_wait(step, scrolled, last_pos, limit) {' \
-                'if(window.pageYOffset > last_pos && (scrolled <= limit || limit < 0)) {' + \
-                'last_pos = window.pageYOffset;' + \
-                'window.scrollBy(0, step);' + \
-                'setTimeout(scroll_and_wait, 20, step, (scrolled+step), last_pos, limit);' + \
-                '}' + \
-                '}' + \
-                'scroll_and_wait(' + str(scroll_step) + ', 0, -1, ' + str(scroll_to) + ')'
-            self.__selenium.execute_script(scroll_js)
-        elif step.type.name == 'go_back':
-            self.__selenium.back()
-            run.log.append(Log(message='Navigated back one page'))
-        elif step.type.name == 'go_forward':
-            self.__selenium.forward()
-            run.log.append(Log(message='Navigated forward one page'))
-        elif step.type.name == 'screenshot' or step.type.name == 'sometimes_screenshot':
-            screenshot = True
-            if step.type.name == 'sometimes_screenshot':
-                latest_runs = run.recipe.get_latest_runs(20, run.instance)
-                for late_run in latest_runs:
-                    if screenshot:
-                        for single_data in late_run.data:
-                            if single_data.step is step and single_data.value is not '':
-                                screenshot = False
-                                run.log.append(Log(message='No screenshot taken this time'))
-                                break
-            if screenshot:
-                # Selenium cannot take full-size screenshots, so here's a little workaround
-                # @see https://stackoverflow.com/a/52572919
-                original_size = self.__selenium.get_window_size()
-                required_width = self.__selenium.execute_script('return document.body.parentNode.scrollWidth')
-                required_height = self.__selenium.execute_script('return document.body.parentNode.scrollHeight')
-                self.__selenium.set_window_size(required_width, required_height)
-                screenshot_name = self.__store_screenshot(self.__selenium.find_element_by_tag_name('body'), run, step)
-                self.__selenium.set_window_size(original_size['width'], original_size['height'])
-                run.log.append(Log(message='Screenshot stored as ' + screenshot_name + ' and referenced as data'))
-        elif step.type.name == 'element_screenshot':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available to screenshot', type=LogTypeEnum.warning))
-            else:
-                screenshot_name = self.__store_screenshot(element, run, step)
-                run.log.append(Log(message='Element screenshot stored as ' + screenshot_name +
-                                           ' and referenced as data'))
-        elif step.type.name == 'find_by_id':
-            try:
-                step.temp_result = self.__selenium.find_element_by_id(step.value)
-                run.data.append(Data(step=step, value='1'))
-                run.log.append(Log(message='Element with ID "' + step.value + '" retrieved (count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='Element with ID "' + step.value + '" not found (stored 0 as data)',
-                                   type=LogTypeEnum.warning))
-        elif step.type.name == 'find_by_name':
-            try:
-                step.temp_result = self.__selenium.find_element_by_name(step.value)
-                run.data.append(Data(step=step, value='1'))
-                run.log.append(Log(message='Element with name "' + step.value + '" retrieved (count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No element with name "' + step.value + '" found (stored 0 as data)',
-                                   type=LogTypeEnum.warning))
-        elif step.type.name == 'find_by_class':
-            try:
-                step.temp_result = self.__selenium.find_elements_by_class_name(step.value)
-                count = str(len(step.temp_result))
-                run.data.append(Data(step=step, value=count))
-                run.log.append(Log(message='Retrieved ' + count + ' element(s) with class "' + step.value +
-                                           '" (count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No element with class "' + step.value + '" found (stored 0 as data)',
-                                   type=LogTypeEnum.warning))
-        elif step.type.name == 'find_by_tag':
-            try:
-                step.temp_result = self.__selenium.find_elements_by_tag_name(step.value)
-                count = str(len(step.temp_result))
-                run.data.append(Data(step=step, value=count))
-                run.log.append(Log(message='Retrieved ' + count + ' "' + step.value + '" element(s) '
-                                                                                      '(count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No "' + step.value + '" element found (stored 0 as data)',
-                                   type=LogTypeEnum.warning))
-        elif step.type.name == 'find_by_link':
-            try:
-                step.temp_result = self.__selenium.find_elements_by_link_text(step.value)
-                count = str(len(step.temp_result))
-                run.data.append(Data(step=step, value=count))
-                run.log.append(Log(message='Retrieved ' + count + ' element(s) with link "' + step.value +
-                                           '" (count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No element with link "' + step.value + '" found (stored 0 as data)',
-                                   type=LogTypeEnum.warning))
-        elif step.type.name == 'find_by_link_partial':
-            try:
-                step.temp_result = self.__selenium.find_elements_by_partial_link_text(step.value)
-                count = str(len(step.temp_result))
-                run.data.append(Data(step=step, value=count))
-                run.log.append(Log(message='Retrieved ' + count + ' element(s) with link partially equal to "' +
-                                           step.value + '" (count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No element with link containing "' + step.value +
-                                           '" found (stored 0 as data)', type=LogTypeEnum.warning))
-        elif step.type.name == 'find_by_css':
-            try:
-                step.temp_result = self.__selenium.find_elements_by_css_selector(step.value)
-                count = str(len(step.temp_result))
-                run.data.append(Data(step=step, value=count))
-                run.log.append(Log(message='Retrieved ' + count + ' element(s) with CSS selector "' + step.value +
-                                           '" (count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No element matching CSS selector "' + step.value +
-                                           '" found (stored 0 as data)', type=LogTypeEnum.warning))
-        elif step.type.name == 'find_by_xpath':
-            try:
-                step.temp_result = self.__selenium.find_elements_by_xpath(step.value)
-                count = str(len(step.temp_result))
-                run.data.append(Data(step=step, value=count))
-                run.log.append(Log(message='Retrieved ' + count + ' element(s) with XPath "' + step.value +
-                                           '" (count stored as data)'))
-            except NoSuchElementException:
-                step.temp_result = None
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No element from XPath "' + step.value + '" found (stored 0 as data)',
-                                   type=LogTypeEnum.warning))
-        elif step.type.name == 'random_select':
-            if prior_step.temp_result is None:
-                run.log.append(Log(message='No element from previous step found, hence no element randomly selected',
-                                   type=LogTypeEnum.warning))
-            elif isinstance(prior_step.temp_result, list):
-                count = len(prior_step.temp_result)
-                if count > 0:
-                    i = random.randint(0, count-1)
-                    step.temp_result = prior_step.temp_result[i]
-                    run.data.append(Data(step=step, value=(i+1)))
-                    run.log.append(Log(message='Randomly selected element ' + str(i+1) + '/' + str(count) +
-                                               ' (stored ' + str(i+1) + ' as data)'))
-                else:
-                    run.log.append(
-                        Log(message='No element from previous step found, hence no element randomly selected',
-                            type=LogTypeEnum.warning)
-                    )
-            else:
-                step.temp_result = prior_step.temp_result
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='Only one element from previous step found, so this was selected "randomly"'))
-        elif step.type.name == 'get_text':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available to get text from', type=LogTypeEnum.warning))
-            else:
-                value = element.text
-                run.data.append(Data(step=step, value=value))
-                run.log.append(Log(message='Retrieved and stored text "' + value[:15] + '..." of prior element'))
-        elif step.type.name == 'get_texts':
-            elements = self.__get_elem_list(prior_step.temp_result)
-            for element in elements:
-                run.data.append(Data(step=step, value=element.text))
-            run.log.append(Log(message='Stored text from ' + str(len(elements)) + ' element(s), each as separate data'))
-        elif step.type.name == 'get_value':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available to get a value from', type=LogTypeEnum.warning))
-            else:
-                value = str(element.get_attribute('value'))
-                run.data.append(Data(step=step, value=value))
-                run.log.append(Log(message='Retrieved and stored value "' + value[:15] + '..." of prior element'))
-        elif step.type.name == 'get_values':
-            elements = self.__get_elem_list(prior_step.temp_result)
-            for element in elements:
-                run.data.append(Data(step=step, value=str(element.get_attribute('value'))))
-            run.log.append(Log(message='Stored values from ' + str(len(elements)) +
-                                       ' element(s), each as separate data'))
-        elif step.type.name == 'get_attribute':
-            element = self.__get_first_elem_or_none(prior_step.temp_result)
-            if element is None:
-                run.log.append(Log(message='No element available to get the attribute "' + step.value +
-                                           '" from', type=LogTypeEnum.warning))
+            run.add_log('Scrolling to the bottom of the page')
+        scroll_step = 10 if scroll_to > 10 or scroll_to == -1 else scroll_to
+        scroll_js = 'function scroll_and_wait(step, scrolled, last_pos, limit) {' \
+            'if(window.pageYOffset > last_pos && (scrolled <= limit || limit < 0)) {' + \
+            'last_pos = window.pageYOffset;' + \
+            'window.scrollBy(0, step);' + \
+            'setTimeout(scroll_and_wait, 20, step, (scrolled+step), last_pos, limit);' + \
+            '}' + \
+            '}' + \
+            'scroll_and_wait(' + str(scroll_step) + ', 0, -1, ' + str(scroll_to) + ')'
+        emulator.selenium.execute_script(scroll_js)
+        return RunStatusEnum.success
+
+
+class HistoryHandler(StepHandler):
+    def __init__(self, forward=False):
+        self.__forward = forward
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        if self.__forward:
+            emulator.selenium.forward()
+            run.add_log('Navigated forward one page')
+        else:
+            emulator.selenium.back()
+            run.add_log('Navigated back one page')
+        return RunStatusEnum.success
+
+
+class ScreenshotHandler(StepHandler):
+    def __init__(self, sometimes=False):
+        self.__sometimes = sometimes
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        if self.__sometimes:
+            probability = self.__get_probability(emulator.config)
+            # a probability of 5% means one screenshot within every 20 runs (on this instance)
+            if probability <= 0 or \
+                    (probability < 1 and step.has_data_in_latest_runs(run.instance, int(round(1/probability)))):
+                run.add_log('No screenshot taken this time')
+                return RunStatusEnum.success
+        png, method = self.capture_full_page(emulator.selenium, run)
+        screenshot_name = store_screenshot(emulator.config, png, run, step)
+        run.add_log('Screenshot (' + method + ') stored as ' + screenshot_name + ' and referenced as data')
+        return RunStatusEnum.success
+
+    @staticmethod
+    def __get_probability(config):
+        try:
+            return min(1.0, max(0.0, float(config.get('Instance', 'ScreenshotProbability', fallback=0.05))))
+        except ValueError:
+            return 0.05
+
+    def capture_full_page(self, selenium, run):
+        """
+        Captures the whole page, preferring the browser's native full-page capture (no relayout at all), then a tiled
+        capture stitched in memory, and finally resizing the window to the page's size
+        :param selenium:
+        :param run:
+        :return: tuple of the PNG and the method used
+        """
+        from scrapebot.database import LogTypeEnum
+        try:
+            png = self.__capture_native(selenium)
+            if png is not None:
+                return png, 'native full page'
+        except WebDriverException:
+            run.add_log('Native full-page capture failed, falling back to tiles', LogTypeEnum.warning)
+        try:
+            import PIL.Image
+            return self.__capture_tiled(selenium), 'tiled'
+        except ImportError:
+            pass
+        return self.__capture_resized(selenium), 'resized window'
+
+    @staticmethod
+    def __execute_command(selenium, name, command, params=None):
+        """
+        Executes a WebDriver endpoint that Selenium itself does not know about
+        :param selenium:
+        :param name:
+        :param command: tuple of HTTP method and path
+        :param params:
+        :return: the command's value
+        """
+        commands = selenium.command_executor._commands
+        if name not in commands:
+            commands[name] = command
+        return selenium.execute(name, params or {})['value']
+
+    def __capture_native(self, selenium):
+        name = (selenium.name or '').lower()
+        if name == 'firefox':
+            return base64.b64decode(self.__execute_command(selenium, 'mozFullPageScreenshot',
+                                                           FIREFOX_FULL_PAGE_COMMAND))
+        elif name == 'chrome':
+            metrics = self.__execute_command(selenium, 'executeCdpCommand', CHROME_CDP_COMMAND,
+                                             {'cmd': 'Page.getLayoutMetrics', 'params': {}})
+            content_size = metrics['contentSize']
+            result = self.__execute_command(selenium, 'executeCdpCommand', CHROME_CDP_COMMAND, {
+                'cmd': 'Page.captureScreenshot',
+                'params': {
+                    'format': 'png',
+                    'captureBeyondViewport': True,
+                    'clip': {'x': 0, 'y': 0, 'width': content_size['width'], 'height': content_size['height'],
+                             'scale': 1}
+                }
+            })
+            return base64.b64decode(result['data'])
+        return None
+
+    @staticmethod
+    def __capture_tiled(selenium):
+        """
+        Scrolls through the page viewport by viewport and pastes each screenshot into one image, so that only one
+        viewport's screenshot is held in memory next to the stitched image
+        :param selenium:
+        :return: PNG
+        """
+        import PIL.Image
+        width, height, viewport_height, original_offset = selenium.execute_script(
+            'return [document.documentElement.scrollWidth, document.documentElement.scrollHeight, ' +
+            'window.innerHeight, window.pageYOffset];'
+        )
+        height = min(height, MAX_SCREENSHOT_HEIGHT)
+        stitched = None
+        scale = 1
+        covered = 0
+        while covered < height:
+            offset = selenium.execute_script('window.scrollTo(0, arguments[0]); return window.pageYOffset;',
+                                             int(covered))
+            tile = PIL.Image.open(io.BytesIO(selenium.get_screenshot_as_png()))
+            if stitched is None:
+                # screenshots are taken in device pixels, which may differ from CSS pixels (e.g., on HiDPI screens)
+                scale = tile.size[1] / float(viewport_height) if viewport_height > 0 else 1
+                stitched = PIL.Image.new('RGB', (int(width*scale), int(height*scale)), 'white')
+            # the last viewport is usually scrolled less than requested, so only its yet uncovered part is used
+            skip = max(0, int((covered - offset)*scale))
+            part_height = min(tile.size[1] - skip, int((height - covered)*scale))
+            if part_height <= 0:
+                break
+            stitched.paste(tile.crop((0, skip, tile.size[0], skip + part_height)), (0, int(covered*scale)))
+            tile.close()
+            covered = covered + part_height/scale
+        selenium.execute_script('window.scrollTo(0, arguments[0]);', original_offset)
+        output = io.BytesIO()
+        stitched.save(output, format='PNG')
+        return output.getvalue()
+
+    @staticmethod
+    def __capture_resized(selenium):
+        # Selenium cannot take full-size screenshots, so here's a little workaround
+        # @see https://stackoverflow.com/a/52572919
+        original_size = selenium.get_window_size()
+        required_width = selenium.execute_script('return document.body.parentNode.scrollWidth')
+        required_height = selenium.execute_script('return document.body.parentNode.scrollHeight')
+        selenium.set_window_size(required_width, required_height)
+        png = selenium.find_element_by_tag_name('body').screenshot_as_png
+        selenium.set_window_size(original_size['width'], original_size['height'])
+        return png
+
+
+class ElementScreenshotHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        element = self.get_first_elem_or_none(prior_step.temp_result)
+        if element is None:
+            run.add_log('No element available to screenshot', LogTypeEnum.warning)
+        else:
+            screenshot_name = store_screenshot(emulator.config, element.screenshot_as_png, run, step)
+            run.add_log('Element screenshot stored as ' + screenshot_name + ' and referenced as data')
+        return RunStatusEnum.success
+
+
+class FindElementHandler(StepHandler):
+    """
+    Finds one single element (i.e., by ID or name) and stores 1 or 0 as data
+    """
+
+    def __init__(self, method, found_log, missing_log):
+        self.__method = method
+        self.__found_log = found_log
+        self.__missing_log = missing_log
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        try:
+            step.temp_result = getattr(emulator.selenium, self.__method)(step.value)
+            run.add_data(step, '1')
+            run.add_log(self.__found_log % step.value)
+        except NoSuchElementException:
+            step.temp_result = None
+            run.add_data(step, '0')
+            run.add_log(self.__missing_log % step.value, LogTypeEnum.warning)
+        return RunStatusEnum.success
+
+
+class FindElementsHandler(StepHandler):
+    """
+    Finds all matching elements and stores their count as data
+    """
+
+    def __init__(self, method, found_log, missing_log):
+        self.__method = method
+        self.__found_log = found_log
+        self.__missing_log = missing_log
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        try:
+            step.temp_result = getattr(emulator.selenium, self.__method)(step.value)
+            count = str(len(step.temp_result))
+            run.add_data(step, count)
+            run.add_log('Retrieved ' + count + ' ' + (self.__found_log % step.value) + ' (count stored as data)')
+        except NoSuchElementException:
+            step.temp_result = None
+            run.add_data(step, '0')
+            run.add_log((self.__missing_log % step.value) + ' (stored 0 as data)', LogTypeEnum.warning)
+        return RunStatusEnum.success
+
+
+class GetTextHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        element = self.get_first_elem_or_none(prior_step.temp_result)
+        if element is None:
+            run.add_log('No element available to get text from', LogTypeEnum.warning)
+        else:
+            value = element.text
+            run.add_data(step, value)
+            run.add_log('Retrieved and stored text "' + value[:15] + '..." of prior element')
+        return RunStatusEnum.success
+
+
+class GetAttributeHandler(StepHandler):
+    """
+    Stores the value of the first element's attribute, which is either fixed (e.g., value) or provided in "value"
+    """
+
+    def __init__(self, attribute=None):
+        self.__attribute = attribute
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        attribute = self.__attribute or step.value
+        element = self.get_first_elem_or_none(prior_step.temp_result)
+        if element is None:
+            if self.__attribute is None:
+                run.add_log('No element available to get the attribute "' + attribute + '" from', LogTypeEnum.warning)
             else:
-                value = str(element.get_attribute(step.value))
-                run.data.append(Data(step=step, value=value))
-                run.log.append(Log(message='Retrieved and stored value "' + value[:15] + '..." of attribute "' +
-                                           step.value + '" of prior element'))
-        elif step.type.name == 'get_attributes':
-            elements = self.__get_elem_list(prior_step.temp_result)
-            for element in elements:
-                run.data.append(Data(step=step, value=str(element.get_attribute(step.value))))
-            run.log.append(Log(message='Stored "' + step.value + '" values from ' + str(len(elements)) +
-                                       ' element(s), each as separate data'))
-        elif step.type.name == 'get_element_count':
-            if prior_step.temp_result is None:
-                run.data.append(Data(step=step, value='0'))
-                run.log.append(Log(message='No previously retrieved elements found, thus stored "0"'))
-            elif isinstance(prior_step.temp_result, list):
-                value = str(len(prior_step.temp_result))
-                run.data.append(Data(step=step, value=value))
-                run.log.append(Log(message='Counted and stored ' + value + ' element(s)'))
+                run.add_log('No element available to get a value from', LogTypeEnum.warning)
+        else:
+            value = str(element.get_attribute(attribute))
+            run.add_data(step, value)
+            if self.__attribute is None:
+                run.add_log('Retrieved and stored value "' + value[:15] + '..." of attribute "' +
+                            attribute + '" of prior element')
             else:
-                run.data.append(Data(step=step, value='1'))
-                run.log.append(Log(message='Counted and stored only 1 element'))
-        elif step.type.name == 'get_pagetitle':
-            value = self.__selenium.title
-            run.data.append(Data(step=step, value=value))
-            run.log.append(Log(message='Retrieved and stored page title "' + value + '"'))
-        elif step.type.name == 'get_htmlsource':
-            value = self.__selenium.execute_script('return typeof(XMLSerializer) === \'undefined\' ? ' +
-                                                   'document.body.parentElement.innerHTML : ' +
-                                                   'new XMLSerializer().serializeToString(document)')
-            run.data.append(Data(step=step, value=value))
-            run.log.append(Log(message='Retrieved and stored HTML source code'))
-        elif step.type.name == 'unset_prior_element':
-            if step.temp_result is not None:
-                prior_step.temp_result = None
-                step.temp_result = None
-                run.log.append(Log(message='Previously retrieved element removed'))
+                run.add_log('Retrieved and stored value "' + value[:15] + '..." of prior element')
+        return RunStatusEnum.success
+
+
+class GetPropertiesHandler(StepHandler):
+    """
+    Stores the texts (or the values of an attribute, which is either fixed or provided in "value") of all elements
+    """
+
+    def __init__(self, texts=False, attribute=None):
+        self.__texts = texts
+        self.__attribute = attribute
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        elements = self.get_elem_list(prior_step.temp_result)
+        if self.__texts:
+            for value in self.get_properties(emulator.selenium, elements):
+                run.add_data(step, value)
+            run.add_log('Stored text from ' + str(len(elements)) + ' element(s), each as separate data')
+        elif self.__attribute is not None:
+            for value in self.get_properties(emulator.selenium, elements, self.__attribute):
+                run.add_data(step, str(value))
+            run.add_log('Stored ' + self.__attribute + 's from ' + str(len(elements)) +
+                        ' element(s), each as separate data')
         else:
+            for value in self.get_properties(emulator.selenium, elements, step.value):
+                run.add_data(step, str(value))
+            run.add_log('Stored "' + step.value + '" values from ' + str(len(elements)) +
+                        ' element(s), each as separate data')
+        return RunStatusEnum.success
+
+    @staticmethod
+    def get_properties(selenium, elements, attribute=None):
+        """
+        Retrieves the texts (or attribute values) of all elements through one single JavaScript call; if that fails,
+        it falls back to asking WebDriver element by element
+        :param selenium:
+        :param elements:
+        :param attribute: None to retrieve texts
+        :return: list of values in the order of elements
+        """
+        if len(elements) == 0:
+            return []
+        try:
+            values = selenium.execute_script(BATCH_PROPERTIES_JS, elements, attribute)
+            if isinstance(values, list) and len(values) == len(elements):
+                return values
+        except WebDriverException:
+            pass
+        return [element.text if attribute is None else element.get_attribute(attribute) for element in elements]
+
+
+class ExtractHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        selector_type = 'css' if step.type.name.startswith('extract_css') else 'xpath'
+        selector, attribute = split_extraction_value(step.value)
+        if not step.type.name.endswith('_attributes'):
+            attribute = None
+        elif attribute is None:
+            run.add_log('No attribute provided in the second line of "value"', LogTypeEnum.error)
+            return RunStatusEnum.config_error
+        try:
+            values = emulator.selenium.execute_script(EXTRACT_JS, selector_type, selector, attribute)
+        except JavascriptException:
+            run.add_log('Invalid ' + selector_type.upper() + ' selector "' + selector + '": ' +
+                        traceback.format_exc(), LogTypeEnum.error)
             return RunStatusEnum.config_error
+        for value in values:
+            run.add_data(step, str(value) if attribute is not None else value)
+        log_type = LogTypeEnum.info if len(values) > 0 else LogTypeEnum.warning
+        run.add_log('Extracted and stored ' + ('texts' if attribute is None else '"' + attribute + '" values') +
+                    ' of ' + str(len(values)) + ' element(s) matching ' + selector_type.upper() + ' selector "' +
+                    selector + '", each as separate data', log_type)
         return RunStatusEnum.success
 
-    def __store_screenshot(self, selenium_element, run, step):
-        from scrapebot.database import Data
-        png = selenium_element.screenshot_as_png
-        screenshot_dir = self.__config.get('Instance', 'ScreenshotDirectory')
-        screenshot_name = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + '.png'
-        screenshot_log = ''
-        if screenshot_dir is not None:
-            if not screenshot_dir.endswith('/'):
-                screenshot_dir = screenshot_dir + '/'
-            local_file = open(screenshot_dir + screenshot_name, 'wb')
-            local_file.write(bytearray(png))
-            local_file.close()
-            screenshot_log = screenshot_dir + screenshot_name
-            run.data.append(Data(step=step, value=screenshot_log))
-        if self.__config.get('Database', 'AWSaccess') is not None and \
-           self.__config.get('Database', 'AWSsecret') is not None and \
-           self.__config.get('Database', 'AWSbucket') is not None:
-            import boto3
-            client = boto3.client(
-                's3',
-                aws_access_key_id=self.__config.get('Database', 'AWSaccess'),
-                aws_secret_access_key=self.__config.get('Database', 'AWSsecret')
-            )
-            s3_file = client.put_object(
-                Bucket=self.__config.get('Database', 'AWSbucket'),
-                Key=screenshot_name,
-                Body=png,
-                Metadata={
-                    'Instance': run.instance.name,
-                    'Run': str(run.uid),
-                    'Step': str(step.uid)
-                }
-            )
-            screenshot_name = 's3://' + self.__config.get('Database', 'AWSbucket') + '/' + screenshot_name
-            if screenshot_log is '':
-                screenshot_log = screenshot_name
-            else:
-                screenshot_log = screenshot_log + ' and ' + screenshot_name
-            run.data.append(Data(step=step, value=screenshot_name))
-        return screenshot_log
+
+class ExtractTableHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        try:
+            rows = emulator.selenium.execute_script(EXTRACT_TABLE_JS, step.value.strip())
+        except JavascriptException:
+            run.add_log('Invalid CSS selector "' + step.value + '": ' + traceback.format_exc(), LogTypeEnum.error)
+            return RunStatusEnum.config_error
+        if rows is None:
+            run.add_log('No table matching CSS selector "' + step.value + '" found', LogTypeEnum.warning)
+        else:
+            for row in rows:
+                run.add_data(step, json.dumps(row))
+            run.add_log('Extracted and stored ' + str(len(rows)) + ' table row(s), each as separate data')
+        return RunStatusEnum.success
+
+
+class PageTitleHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        value = emulator.selenium.title
+        run.add_data(step, value)
+        run.add_log('Retrieved and stored page title "' + value + '"')
+        return RunStatusEnum.success
+
+
+class HtmlSourceHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        value = emulator.selenium.execute_script('return typeof(XMLSerializer) === \'undefined\' ? ' +
+                                                 'document.body.parentElement.innerHTML : ' +
+                                                 'new XMLSerializer().serializeToString(document)')
+        run.add_data(step, value)
+        run.add_log('Retrieved and stored HTML source code')
+        return RunStatusEnum.success
+
+
+def store_screenshot(config, png, run, step):
+    # only the capture happens here, the screenshot is written to disk and uploaded to S3 in the background
+    return screenshot_uploader.submit(config, png, run, step)
+
+
+step_registry = StepRegistry(ENTRY_POINT_GROUP)
+step_registry.register(RecipeStepTypeEnum.navigate, NavigateHandler)
+step_registry.register(RecipeStepTypeEnum.find_by_id, FindElementHandler(
+    'find_element_by_id', 'Element with ID "%s" retrieved (count stored as data)',
+    'Element with ID "%s" not found (stored 0 as data)'))
+step_registry.register(RecipeStepTypeEnum.find_by_name, FindElementHandler(
+    'find_element_by_name', 'Element with name "%s" retrieved (count stored as data)',
+    'No element with name "%s" found (stored 0 as data)'))
+step_registry.register(RecipeStepTypeEnum.find_by_class, FindElementsHandler(
+    'find_elements_by_class_name', 'element(s) with class "%s"', 'No element with class "%s" found'))
+step_registry.register(RecipeStepTypeEnum.find_by_tag, FindElementsHandler(
+    'find_elements_by_tag_name', '"%s" element(s)', 'No "%s" element found'))
+step_registry.register(RecipeStepTypeEnum.find_by_link, FindElementsHandler(
+    'find_elements_by_link_text', 'element(s) with link "%s"', 'No element with link "%s" found'))
+step_registry.register(RecipeStepTypeEnum.find_by_link_partial, FindElementsHandler(
+    'find_elements_by_partial_link_text', 'element(s) with link partially equal to "%s"',
+    'No element with link containing "%s" found'))
+step_registry.register(RecipeStepTypeEnum.find_by_css, FindElementsHandler(
+    'find_elements_by_css_selector', 'element(s) with CSS selector "%s"', 'No element matching CSS selector "%s" found'))
+step_registry.register(RecipeStepTypeEnum.find_by_xpath, FindElementsHandler(
+    'find_elements_by_xpath', 'element(s) with XPath "%s"', 'No element from XPath "%s" found'))
+step_registry.register(RecipeStepTypeEnum.random_select, RandomSelectHandler)
+step_registry.register(RecipeStepTypeEnum.scroll_to, ScrollHandler)
+step_registry.register(RecipeStepTypeEnum.get_text, GetTextHandler)
+step_registry.register(RecipeStepTypeEnum.get_texts, GetPropertiesHandler(texts=True))
+step_registry.register(RecipeStepTypeEnum.get_value, GetAttributeHandler('value'))
+step_registry.register(RecipeStepTypeEnum.get_values, GetPropertiesHandler(attribute='value'))
+step_registry.register(RecipeStepTypeEnum.get_attribute, GetAttributeHandler)
+step_registry.register(RecipeStepTypeEnum.get_attributes, GetPropertiesHandler)
+step_registry.register(RecipeStepTypeEnum.get_pagetitle, PageTitleHandler)
+step_registry.register(RecipeStepTypeEnum.get_element_count, ElementCountHandler)
+step_registry.register(RecipeStepTypeEnum.get_htmlsource, HtmlSourceHandler)
+step_registry.register(RecipeStepTypeEnum.extract_css_texts, ExtractHandler)
+step_registry.register(RecipeStepTypeEnum.extract_css_attributes, ExtractHandler)
+step_registry.register(RecipeStepTypeEnum.extract_xpath_texts, ExtractHandler)
+step_registry.register(RecipeStepTypeEnum.extract_xpath_attributes, ExtractHandler)
+step_registry.register(RecipeStepTypeEnum.extract_css_table, ExtractTableHandler)
+step_registry.register(RecipeStepTypeEnum.log, LogHandler)
+step_registry.register(RecipeStepTypeEnum.data, DataHandler)
+step_registry.register(RecipeStepTypeEnum.execute_js, ExecuteJsHandler)
+step_registry.register(RecipeStepTypeEnum.pause, PauseHandler)
+step_registry.register(RecipeStepTypeEnum.click, ClickHandler)
+step_registry.register(RecipeStepTypeEnum.write, WriteHandler)
+step_registry.register(RecipeStepTypeEnum.write_slowly, WriteHandler(slowly=True))
+step_registry.register(RecipeStepTypeEnum.submit, SubmitHandler)
+step_registry.register(RecipeStepTypeEnum.go_back, HistoryHandler)
+step_registry.register(RecipeStepTypeEnum.go_forward, HistoryHandler(forward=True))
+step_registry.register(RecipeStepTypeEnum.unset_prior_element, UnsetPriorElementHandler)
+step_registry.register(RecipeStepTypeEnum.screenshot, ScreenshotHandler)
+step_registry.register(RecipeStepTypeEnum.sometimes_screenshot, ScreenshotHandler(sometimes=True))
+step_registry.register(RecipeStepTypeEnum.element_screenshot, ElementScreenshotHandler)
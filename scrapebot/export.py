@@ -0,0 +1,116 @@
+import csv
+import io
+import zlib
+from time import perf_counter
+from scrapebot.database import Instance, Recipe, RecipeStep, Run, Data, Blob
+
+
+EXPORT_FIELDS = ['run', 'instance',
+                 'recipe', 'recipe_name', 'recipe_status',
+                 'step', 'step_name',
+                 'data_creation', 'data_value']
+
+
+def get_export_rows(session, user, instance_uids, recipe_uids, chunk_size=1000, progress=None, heartbeat=60):
+    """
+    Iterates over all data values of the given instances and recipes (as far as visible to the user) one by one,
+    fetching them in chunks through a server-side cursor instead of loading them all at once
+    :param session:
+    :param user:
+    :param instance_uids:
+    :param recipe_uids:
+    :param chunk_size: number of rows fetched from the database at a time
+    :param progress: optional callback, called with the share (0 to 1) of instance-recipe pairs done so far, both after
+    every pair and every heartbeat seconds within a pair (so that a long pair does not look like a stuck job)
+    :param heartbeat: in seconds
+    :return: generator of dicts with EXPORT_FIELDS as keys
+    """
+    pairs_done = 0
+    last_report = perf_counter()
+    for instance_uid in instance_uids:
+        instance = session.query(Instance).filter(Instance.uid == instance_uid).one_or_none()
+        if instance and instance.is_visible_to_user(user):
+            for recipe_uid in recipe_uids:
+                recipe = session.query(Recipe).filter(Recipe.uid == recipe_uid).one_or_none()
+                if recipe and recipe.is_visible_to_user(user):
+                    query = session.query(
+                            Data.created, Data.value,
+                            RecipeStep.sort, RecipeStep.type,
+                            Run.created, Run.status,
+                            Blob.compression, Blob.content
+                        )\
+                        .outerjoin(Blob, Data.blob_hash == Blob.hash)\
+                        .filter(
+                            Data.step_uid == RecipeStep.uid, Data.run_uid == Run.uid,
+                            Run.instance_uid == instance_uid, Run.recipe_uid == recipe_uid
+                        )\
+                        .execution_options(stream_results=True)\
+                        .yield_per(chunk_size)
+                    for run_data in query:
+                        if progress is not None and perf_counter() - last_report >= heartbeat:
+                            progress(pairs_done / (len(instance_uids) * len(recipe_uids)))
+                            last_report = perf_counter()
+                        yield {
+                            'run': str(run_data[4]),
+                            'instance': instance.name,
+                            'recipe': str(recipe_uid),
+                            'recipe_name': recipe.name,
+                            'recipe_status': run_data[5].name,
+                            'step': run_data[2],
+                            'step_name': run_data[3].name,
+                            'data_creation': str(run_data[0]),
+                            'data_value': run_data[1] if run_data[7] is None else
+                            Blob.decompress(run_data[7], run_data[6])
+                        }
+            if progress is not None:
+                pairs_done = pairs_done + len(recipe_uids)
+                progress(pairs_done / (len(instance_uids) * len(recipe_uids)))
+                last_report = perf_counter()
+
+
+def iterate_csv(rows, compress=False, buffer_size=65536):
+    """
+    Turns rows into CSV output piece by piece, so that only about buffer_size bytes are held in memory at a time
+    :param rows: iterable of dicts with EXPORT_FIELDS as keys
+    :param compress: whether to gzip the output
+    :param buffer_size: number of characters collected before a piece is handed out
+    :return: generator of bytes
+    """
+    buffer = io.StringIO()
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    # extrasaction='ignore' tells DictWriter not to check on the keys in every single iteration
+    csv_data = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    csv_data.writeheader()
+    for row in rows:
+        csv_data.writerow(row)
+        if buffer.tell() >= buffer_size:
+            piece = flush_buffer(buffer, compressor)
+            if piece:
+                yield piece
+    piece = flush_buffer(buffer, compressor)
+    if compressor is not None:
+        piece = piece + compressor.flush()
+    if piece:
+        yield piece
+
+
+def flush_buffer(buffer, compressor):
+    piece = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return piece if compressor is None else compressor.compress(piece)
+
+
+def write_csv(rows, file, compress=False):
+    """
+    Writes rows as CSV (optionally gzipped) to a file opened in binary mode
+    :param rows: iterable of dicts with EXPORT_FIELDS as keys
+    :param file:
+    :param compress:
+    :return: number of bytes written
+    """
+    size = 0
+    for piece in iterate_csv(rows, compress):
+        file.write(piece)
+        size = size + len(piece)
+    return size
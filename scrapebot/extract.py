@@ -0,0 +1,120 @@
+import json
+
+# step types that can be applied to stored HTML snapshots (i.e., get_htmlsource data) without a browser
+OFFLINE_STEP_TYPES = ['extract_css_texts', 'extract_css_attributes',
+                      'extract_xpath_texts', 'extract_xpath_attributes',
+                      'extract_css_table']
+# all text nodes below an element except for those that browsers do not render as text
+RENDERED_TEXT = './/text()[not(ancestor::script or ancestor::style or ancestor::noscript or ancestor::template)]'
+
+
+def split_extraction_value(value):
+    """
+    Splits the value of an extraction step into its selector (first line) and attribute (second line, if any)
+    :param value:
+    :return: tuple of selector and attribute (None if not provided)
+    """
+    lines = (value or '').strip().splitlines()
+    selector = lines[0].strip() if len(lines) > 0 else ''
+    attribute = lines[1].strip() if len(lines) > 1 and lines[1].strip() != '' else None
+    return selector, attribute
+
+
+def parse_html(html, base_url=None):
+    """
+    Parses an HTML snapshot (as stored by get_htmlsource) through lxml, which is only needed for offline extraction
+    :param html: str (which is parsed as UTF-8 regardless of any meta tags) or bytes
+    :param base_url: if provided, relative links (i.e., href and src attributes) are made absolute
+    :return: lxml document
+    """
+    try:
+        import lxml.html
+    except ImportError:
+        raise ImportError('Offline extraction requires lxml and cssselect (see requirements.txt)')
+    if isinstance(html, str):
+        document = lxml.html.document_fromstring(html.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+    else:
+        document = lxml.html.document_fromstring(html)
+    if base_url is not None:
+        document.make_links_absolute(base_url, resolve_base_href=True)
+    return document
+
+
+def extract(document, step_type, value):
+    """
+    Applies an extraction step to a parsed snapshot, mirroring what the step would store when run in the browser
+    (except for texts, which are taken from the markup as there is no rendering to tell what is visible)
+    :param document: as returned by parse_html
+    :param step_type: name of one of OFFLINE_STEP_TYPES
+    :param value: the step's value
+    :return: list of values to be stored as data
+    """
+    selector, attribute = split_extraction_value(value)
+    if step_type == 'extract_css_table':
+        tables = document.cssselect(selector)
+        if len(tables) == 0:
+            return []
+        return [json.dumps([get_text(cell) for cell in row.xpath('./td|./th')]) for row in tables[0].xpath('.//tr')]
+    if step_type not in OFFLINE_STEP_TYPES:
+        raise ValueError('Step type "' + str(step_type) + '" cannot be applied offline')
+    if step_type.endswith('_attributes') and attribute is None:
+        raise ValueError('No attribute provided in the second line of "value"')
+    if step_type.startswith('extract_css'):
+        elements = document.cssselect(selector)
+    else:
+        elements = document.xpath(selector)
+        if not isinstance(elements, list):
+            elements = [elements]
+    values = []
+    for element in elements:
+        if not hasattr(element, 'tag'):
+            # XPath may also select text and attribute nodes (or even compute strings and numbers)
+            values.append(str(element))
+        elif step_type.endswith('_texts'):
+            values.append(get_text(element))
+        else:
+            values.append(str(element.get(attribute)))
+    return values
+
+
+def get_text(element):
+    """
+    Text of the element as a browser would render it, i.e., without the contents of scripts, styles, and the like
+    :param element:
+    :return: string with collapsed whitespace
+    """
+    return ' '.join(''.join(element.xpath(RENDERED_TEXT)).split())
+
+
+def process_snapshot(html, rules):
+    """
+    Post-processing stage that applies any number of extraction rules to one snapshot, parsing it only once
+    :param html:
+    :param rules: list of (step_uid, step_type, value) tuples
+    :return: list of (step_uid, value) tuples
+    """
+    document = parse_html(html)
+    results = []
+    for step_uid, step_type, value in rules:
+        for extracted in extract(document, step_type, value):
+            results.append((step_uid, extracted))
+    return results
+
+
+def process_snapshots(snapshots, rules):
+    """
+    Applies process_snapshot to a chunk of snapshots (this is what runs inside the process pool of reprocess.py)
+    :param snapshots: list of (run_uid, created, html) tuples
+    :param rules: list of (step_uid, step_type, value) tuples
+    :return: tuple of a list of dicts ready to be inserted as data and a list of run uids whose snapshot failed
+    """
+    rows = []
+    failed = []
+    for run_uid, created, html in snapshots:
+        if html:
+            try:
+                for step_uid, value in process_snapshot(html, rules):
+                    rows.append({'run_uid': run_uid, 'step_uid': step_uid, 'created': created, 'value': value})
+            except Exception:
+                failed.append(run_uid)
+    return rows, failed
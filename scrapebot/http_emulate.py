@@ -0,0 +1,490 @@
+import re
+import json
+import time
+import random
+import threading
+import traceback
+from email.utils import parsedate_to_datetime
+from http.cookies import SimpleCookie, CookieError
+from urllib.parse import urljoin, urlsplit
+import urllib3
+from scrapebot.extract import parse_html, extract, get_text
+from scrapebot.steps import StepHandler, StepRegistry, wait_through, LogHandler, DataHandler, PauseHandler, \
+    RandomSelectHandler, ElementCountHandler, UnsetPriorElementHandler
+from scrapebot.steptypes import RecipeStepTypeEnum, HTTP_STEP_TYPES
+
+
+MAX_REDIRECTS = 10
+META_CHARSET = re.compile(br'<meta[^>]+charset=["\']?([a-zA-Z0-9_-]+)', re.IGNORECASE)
+# step types that do not need a page to be loaded first
+PAGELESS_STEP_TYPES = ['navigate', 'log', 'data', 'pause']
+
+
+class ConnectionPool:
+    """
+    Shares one urllib3 pool among all HTTP emulators, so that connections (and TLS handshakes) are kept alive
+    across steps and runs
+    """
+
+    def __init__(self):
+        self.__manager = None
+        self.__lock = threading.Lock()
+
+    def get(self, config):
+        """
+        Returns the shared pool manager, creating it upon first use
+        :param config:
+        :return: urllib3.PoolManager
+        """
+        with self.__lock:
+            if self.__manager is None:
+                try:
+                    pool_size = max(1, int(config.get('Instance', 'HttpPoolSize', fallback=10)))
+                except ValueError:
+                    pool_size = 10
+                self.__manager = urllib3.PoolManager(num_pools=50, maxsize=pool_size, block=False)
+            return self.__manager
+
+
+class HttpEmulator:
+    """
+    Lightweight alternative to Emulator for recipes that only consist of HTTP_STEP_TYPES: pages are requested
+    through a pooled HTTP client and parsed by lxml, so neither a browser nor a virtual display is launched
+    """
+    __config = None
+    __headers = None
+    __timeout = None
+    __wait = 0
+    __url = None
+    __html = None
+    __document = None
+    __cookies = None
+    __requests = 0
+
+    @property
+    def config(self):
+        return self.__config
+
+    @property
+    def url(self):
+        return self.__url
+
+    @property
+    def html(self):
+        return self.__html
+
+    @property
+    def document(self):
+        return self.__document
+
+    def run(self, config, run, step, prior_step=None):
+        return wait_through(self.iterate(config, run, step, prior_step))
+
+    def iterate(self, config, run, step, prior_step=None):
+        """
+        Runs the step as generator, which yields all waits (i.e., the instance's Timeout between steps and pause
+        steps) in seconds rather than sleeping
+        :param config:
+        :param run:
+        :param step:
+        :param prior_step:
+        :return: RunStatusEnum
+        """
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        if step.type.name not in HTTP_STEP_TYPES:
+            run.add_log('Step type "' + step.type.name + '" requires a browser, hence this recipe cannot run on ' +
+                        'the HTTP engine', LogTypeEnum.error)
+            return RunStatusEnum.config_error
+        if prior_step is None:
+            self.__init_client(config, run)
+        elif self.__wait > 0:
+            wait = random.uniform(self.__wait*.75, self.__wait*1.25)
+            run.add_log('Waiting for ' + str(round(wait, 1)) + ' seconds')
+            yield wait
+            run.add_timing(step, 'wait', wait)
+        if self.__document is None and step.type.name not in PAGELESS_STEP_TYPES:
+            run.add_log('No page loaded yet, navigate first', LogTypeEnum.error)
+            return RunStatusEnum.config_error
+        requests = self.__requests
+        data_count = run.data_count
+        start = time.perf_counter()
+        try:
+            return (yield from http_step_registry.iterate(self, run, step, prior_step))
+        finally:
+            # on this engine, HTTP requests are counted instead of WebDriver commands
+            run.add_timing(step, step.type.name, time.perf_counter() - start, self.__requests - requests,
+                           run.data_count - data_count)
+
+    def __init_client(self, config, run):
+        self.__config = config
+        user_agent = config.get('Instance', 'BrowserUserAgent', fallback='')
+        language = config.get('Instance', 'BrowserLanguage', fallback='en')
+        try:
+            timeout = float(config.get('Instance', 'HttpTimeout', fallback=30))
+        except ValueError:
+            timeout = 30
+        try:
+            self.__wait = float(config.get('Instance', 'Timeout', fallback=0))
+        except ValueError:
+            self.__wait = 0
+        self.__timeout = urllib3.Timeout(connect=min(10, timeout), read=timeout)
+        self.__headers = {
+            'User-Agent': user_agent if user_agent != '' else 'Mozilla/5.0 (compatible; ScrapeBot)',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': language,
+            'Accept-Encoding': 'gzip, deflate'
+        }
+        self.__cookies = []
+        if run.recipe.cookies:
+            order = run.get_recipe_order()
+            if order is not None:
+                self.__cookies = load_cookies(order.cookies_from_last_run)
+                run.add_log(str(len(self.__cookies)) + ' cookie(s) loaded for HTTP session')
+        run.add_log('Running on the HTTP engine (no browser) with user agent "' + self.__headers['User-Agent'] +
+                    '" and accept language "' + language + '"')
+        run.add_log('Timeout between steps set to ' + str(self.__wait) + ' seconds')
+
+    def close_session(self, run):
+        if self.__cookies is not None and run.recipe.cookies:
+            order = run.get_recipe_order()
+            if order is not None:
+                order.cookies_from_last_run = dump_cookies(self.__cookies)
+                run.add_log('Cookies stored')
+        self.__document = None
+        self.__html = None
+        run.add_log('HTTP session closed')
+
+    def load(self, run, url):
+        """
+        Requests url and makes the response the current page
+        :param run:
+        :param url:
+        :return: urllib3 response
+        """
+        url, response = self.__get(run, url)
+        self.__url = url
+        self.__html = decode_body(response)
+        self.__document = parse_html(self.__html, url)
+        return response
+
+    def __get(self, run, url):
+        """
+        Requests url, following redirects ourselves so that cookies are sent to and received from every hop
+        :param run:
+        :param url:
+        :return: tuple of final url and response
+        """
+        pool = connection_pool.get(self.__config)
+        for i in range(0, MAX_REDIRECTS + 1):
+            headers = dict(self.__headers)
+            cookie_header = get_cookie_header(self.__cookies, url)
+            if cookie_header != '':
+                headers['Cookie'] = cookie_header
+            self.__requests = self.__requests + 1
+            response = pool.request('GET', url, headers=headers, redirect=False, retries=False,
+                                    timeout=self.__timeout)
+            store_cookies(self.__cookies, url, response.headers.getlist('Set-Cookie'))
+            location = response.headers.get('Location')
+            if response.status not in (301, 302, 303, 307, 308) or location is None:
+                return url, response
+            url = urljoin(url, location)
+            run.add_log('Redirected (' + str(response.status) + ') to "' + url + '"')
+        raise urllib3.exceptions.MaxRetryError(pool, url, 'More than ' + str(MAX_REDIRECTS) + ' redirects')
+
+
+class HttpNavigateHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        response = emulator.load(run, step.value)
+        if response.status >= 400:
+            run.add_log('Navigated to "' + step.value + '" but got HTTP status ' + str(response.status),
+                        LogTypeEnum.warning)
+        else:
+            run.add_log('Navigated to "' + step.value + '" (HTTP status ' + str(response.status) + ', ' +
+                        str(len(response.data)) + ' bytes)')
+        return RunStatusEnum.success
+
+
+class HttpFindElementHandler(StepHandler):
+    """
+    Finds one single element (i.e., by ID or name) in the parsed page and stores 1 or 0 as data
+    """
+
+    def __init__(self, find, attribute):
+        self.__find = find
+        self.__attribute = attribute
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        elements = self.__find(emulator.document, step.value)
+        if len(elements) > 0:
+            step.temp_result = elements[0]
+            run.add_data(step, '1')
+            run.add_log('Element with ' + self.__attribute + ' "' + step.value + '" found (stored 1 as data)')
+        else:
+            step.temp_result = None
+            run.add_data(step, '0')
+            run.add_log('No element with ' + self.__attribute + ' "' + step.value + '" found (stored 0 as data)',
+                        LogTypeEnum.warning)
+        return RunStatusEnum.success
+
+
+class HttpFindElementsHandler(StepHandler):
+    """
+    Finds all matching elements in the parsed page and stores their count as data
+    """
+
+    def __init__(self, find):
+        self.__find = find
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        step.temp_result = self.__find(emulator.document, step.value)
+        count = str(len(step.temp_result))
+        run.add_data(step, count)
+        run.add_log('Retrieved ' + count + ' element(s) using ' + step.type.name + ' "' + step.value +
+                    '" (count stored as data)', LogTypeEnum.info if count != '0' else LogTypeEnum.warning)
+        return RunStatusEnum.success
+
+
+class HttpGetPropertyHandler(StepHandler):
+    """
+    Stores the text, value, or attribute of the first element identified in the previous step
+    """
+
+    def __init__(self, step_type):
+        self.__step_type = step_type
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        element = self.get_first_elem_or_none(prior_step.temp_result)
+        if element is None:
+            run.add_log('No element available to get a value from', LogTypeEnum.warning)
+        else:
+            value = get_property(element, self.__step_type, step.value)
+            run.add_data(step, value)
+            run.add_log('Retrieved and stored "' + value[:15] + '..." of prior element')
+        return RunStatusEnum.success
+
+
+class HttpGetPropertiesHandler(StepHandler):
+    """
+    Stores the texts, values, or attributes of all elements identified in the previous step
+    """
+
+    def __init__(self, step_type):
+        self.__step_type = step_type
+
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        elements = self.get_elem_list(prior_step.temp_result)
+        for element in elements:
+            run.add_data(step, get_property(element, self.__step_type, step.value))
+        run.add_log('Stored ' + step.type.name[len('get_'):] + ' from ' + str(len(elements)) +
+                    ' element(s), each as separate data')
+        return RunStatusEnum.success
+
+
+class HttpExtractHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        try:
+            values = extract(emulator.document, step.type.name, step.value)
+        except Exception:
+            run.add_log('Invalid selector or attribute in "' + step.value + '": ' + traceback.format_exc(),
+                        LogTypeEnum.error)
+            return RunStatusEnum.config_error
+        for value in values:
+            run.add_data(step, value)
+        run.add_log('Extracted and stored ' + str(len(values)) + ' value(s), each as separate data',
+                    LogTypeEnum.info if len(values) > 0 else LogTypeEnum.warning)
+        return RunStatusEnum.success
+
+
+class HttpPageTitleHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        value = ' '.join((emulator.document.findtext('.//title') or '').split())
+        run.add_data(step, value)
+        run.add_log('Retrieved and stored page title "' + value + '"')
+        return RunStatusEnum.success
+
+
+class HttpHtmlSourceHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        run.add_data(step, emulator.html)
+        run.add_log('Retrieved and stored HTML source code')
+        return RunStatusEnum.success
+
+
+def find_by_xpath(document, value):
+    elements = document.xpath(value)
+    return elements if isinstance(elements, list) else [elements]
+
+
+def get_property(element, step_type, attribute=None):
+    """
+    Reads the text, value, or attribute of an lxml element (or of a text/attribute node selected through XPath)
+    :param element:
+    :param step_type: get_text, get_value, or get_attribute
+    :param attribute: only needed for get_attribute
+    :return: str
+    """
+    if not hasattr(element, 'tag'):
+        return str(element)
+    elif step_type == 'get_text':
+        return get_text(element)
+    elif step_type == 'get_value':
+        # lxml.html provides the current value of input, textarea, and select elements just like the DOM does
+        return str(element.value if hasattr(element, 'value') else element.get('value'))
+    return str(element.get(attribute))
+
+
+def decode_body(response):
+    """
+    Decodes a response body according to the charset from its Content-Type header or from a meta tag
+    :param response:
+    :return: str
+    """
+    charset = None
+    content_type = response.headers.get('Content-Type', '')
+    if 'charset=' in content_type:
+        charset = content_type.split('charset=')[-1].split(';')[0].strip('"\' ')
+    else:
+        match = META_CHARSET.search(response.data[:2048])
+        if match is not None:
+            charset = match.group(1).decode('ascii')
+    try:
+        return response.data.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return response.data.decode('utf-8', errors='replace')
+
+
+def load_cookies(cookies_json):
+    """
+    Reads cookies as stored in RecipeOrder.cookies_from_last_run (i.e., the list of dicts Selenium returns), so that
+    both engines share the same cookies
+    :param cookies_json:
+    :return: list of cookie dicts
+    """
+    try:
+        cookies = json.loads(cookies_json or '[]')
+    except ValueError:
+        return []
+    if not isinstance(cookies, list):
+        return []
+    now = time.time()
+    return [cookie for cookie in cookies
+            if isinstance(cookie, dict) and 'name' in cookie and 'value' in cookie and
+            (cookie.get('expiry') is None or cookie['expiry'] > now)]
+
+
+def dump_cookies(cookies):
+    return json.dumps(cookies)
+
+
+def store_cookies(cookies, url, set_cookie_headers):
+    """
+    Adds (or replaces, or removes if expired) the cookies from Set-Cookie response headers
+    :param cookies: list of cookie dicts, altered in place
+    :param url: the url that has been requested
+    :param set_cookie_headers: list of Set-Cookie header values
+    :return:
+    """
+    parts = urlsplit(url)
+    for header in set_cookie_headers:
+        parsed = SimpleCookie()
+        try:
+            parsed.load(header)
+        except CookieError:
+            continue
+        for name, morsel in parsed.items():
+            cookie = {
+                'name': name,
+                'value': morsel.value,
+                'domain': morsel['domain'] if morsel['domain'] != '' else parts.hostname,
+                'path': morsel['path'] if morsel['path'] != '' else (parts.path.rsplit('/', 1)[0] or '/'),
+                'secure': bool(morsel['secure']),
+                'httpOnly': bool(morsel['httponly'])
+            }
+            if morsel['max-age'] != '':
+                try:
+                    cookie['expiry'] = int(time.time()) + int(morsel['max-age'])
+                except ValueError:
+                    pass
+            elif morsel['expires'] != '':
+                try:
+                    cookie['expiry'] = int(parsedate_to_datetime(morsel['expires']).timestamp())
+                except (TypeError, ValueError):
+                    pass
+            cookies[:] = [existing for existing in cookies
+                          if (existing['name'], existing.get('domain', '').lstrip('.'), existing.get('path', '/')) !=
+                          (name, cookie['domain'].lstrip('.'), cookie['path'])]
+            if cookie.get('expiry') is None or cookie['expiry'] > time.time():
+                cookies.append(cookie)
+
+
+def get_cookie_header(cookies, url):
+    """
+    Builds the Cookie request header from all cookies whose domain, path, and secure flag match url
+    :param cookies: list of cookie dicts
+    :param url:
+    :return: str (empty if no cookie matches)
+    """
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    path = parts.path or '/'
+    now = time.time()
+    matching = []
+    for cookie in cookies:
+        domain = (cookie.get('domain') or host).lstrip('.')
+        cookie_path = cookie.get('path') or '/'
+        if (host == domain or host.endswith('.' + domain)) and \
+                (path == cookie_path or path.startswith(cookie_path.rstrip('/') + '/')) and \
+                (not cookie.get('secure') or parts.scheme == 'https') and \
+                (cookie.get('expiry') is None or cookie['expiry'] > now):
+            matching.append(cookie['name'] + '=' + cookie['value'])
+    return '; '.join(matching)
+
+
+connection_pool = ConnectionPool()
+# the HTTP engine's handlers (i.e., its counterpart to Emulator's step_registry), sharing the engine-agnostic ones;
+# elements are found through XPath on the parsed page the way the respective Selenium calls would find them
+http_step_registry = StepRegistry()
+http_step_registry.register(RecipeStepTypeEnum.navigate, HttpNavigateHandler)
+http_step_registry.register(RecipeStepTypeEnum.find_by_id, HttpFindElementHandler(
+    lambda document, value: document.xpath('//*[@id=$value]', value=value), 'ID'))
+http_step_registry.register(RecipeStepTypeEnum.find_by_name, HttpFindElementHandler(
+    lambda document, value: document.xpath('//*[@name=$value]', value=value), 'name'))
+http_step_registry.register(RecipeStepTypeEnum.find_by_class, HttpFindElementsHandler(
+    lambda document, value: document.xpath('//*[contains(concat(" ", normalize-space(@class), " "), $value)]',
+                                           value=' ' + value.strip() + ' ')))
+http_step_registry.register(RecipeStepTypeEnum.find_by_tag, HttpFindElementsHandler(
+    lambda document, value: document.xpath('//*[local-name()=$value]', value=value.strip().lower())))
+http_step_registry.register(RecipeStepTypeEnum.find_by_link, HttpFindElementsHandler(
+    lambda document, value: [element for element in document.xpath('//a') if get_text(element) == value.strip()]))
+http_step_registry.register(RecipeStepTypeEnum.find_by_link_partial, HttpFindElementsHandler(
+    lambda document, value: [element for element in document.xpath('//a') if value in get_text(element)]))
+http_step_registry.register(RecipeStepTypeEnum.find_by_css, HttpFindElementsHandler(
+    lambda document, value: document.cssselect(value)))
+http_step_registry.register(RecipeStepTypeEnum.find_by_xpath, HttpFindElementsHandler(find_by_xpath))
+http_step_registry.register(RecipeStepTypeEnum.random_select, RandomSelectHandler)
+http_step_registry.register(RecipeStepTypeEnum.get_text, HttpGetPropertyHandler('get_text'))
+http_step_registry.register(RecipeStepTypeEnum.get_texts, HttpGetPropertiesHandler('get_text'))
+http_step_registry.register(RecipeStepTypeEnum.get_value, HttpGetPropertyHandler('get_value'))
+http_step_registry.register(RecipeStepTypeEnum.get_values, HttpGetPropertiesHandler('get_value'))
+http_step_registry.register(RecipeStepTypeEnum.get_attribute, HttpGetPropertyHandler('get_attribute'))
+http_step_registry.register(RecipeStepTypeEnum.get_attributes, HttpGetPropertiesHandler('get_attribute'))
+http_step_registry.register(RecipeStepTypeEnum.get_pagetitle, HttpPageTitleHandler)
+http_step_registry.register(RecipeStepTypeEnum.get_element_count, ElementCountHandler)
+http_step_registry.register(RecipeStepTypeEnum.get_htmlsource, HttpHtmlSourceHandler)
+http_step_registry.register(RecipeStepTypeEnum.extract_css_texts, HttpExtractHandler)
+http_step_registry.register(RecipeStepTypeEnum.extract_css_attributes, HttpExtractHandler)
+http_step_registry.register(RecipeStepTypeEnum.extract_xpath_texts, HttpExtractHandler)
+http_step_registry.register(RecipeStepTypeEnum.extract_xpath_attributes, HttpExtractHandler)
+http_step_registry.register(RecipeStepTypeEnum.extract_css_table, HttpExtractHandler)
+http_step_registry.register(RecipeStepTypeEnum.log, LogHandler)
+http_step_registry.register(RecipeStepTypeEnum.data, DataHandler)
+http_step_registry.register(RecipeStepTypeEnum.pause, PauseHandler)
+http_step_registry.register(RecipeStepTypeEnum.unset_prior_element, UnsetPriorElementHandler)
@@ -0,0 +1,103 @@
+import time
+import threading
+
+
+class Permissions:
+    """
+    The uids of all recipes and instances a user may see and edit (i.e., owns or has been granted privileges on)
+    """
+
+    def __init__(self, visible_recipes=None, editable_recipes=None, visible_instances=None, editable_instances=None):
+        self.visible_recipes = visible_recipes or set()
+        self.editable_recipes = editable_recipes or set()
+        self.visible_instances = visible_instances or set()
+        self.editable_instances = editable_instances or set()
+
+    @staticmethod
+    def load(session, user):
+        """
+        Resolves the user's permissions in two queries (one for recipes, one for instances), each uniting what the user
+        owns with what the user has been granted
+        :param session:
+        :param user:
+        :return: Permissions
+        """
+        from scrapebot.database import Recipe, Instance, UserRecipePrivilege, UserInstancePrivilege
+        from sqlalchemy import literal
+        permissions = Permissions()
+        recipes = session.query(Recipe.uid, literal(True))\
+            .filter(Recipe.owner_uid == user.uid)\
+            .union_all(session.query(UserRecipePrivilege.recipe_uid, UserRecipePrivilege.allowed_to_edit)
+                       .filter(UserRecipePrivilege.user_uid == user.uid))
+        for uid, allowed_to_edit in recipes:
+            permissions.visible_recipes.add(uid)
+            if allowed_to_edit:
+                permissions.editable_recipes.add(uid)
+        instances = session.query(Instance.uid, literal(True))\
+            .filter(Instance.owner_uid == user.uid)\
+            .union_all(session.query(UserInstancePrivilege.instance_uid, UserInstancePrivilege.allowed_to_edit)
+                       .filter(UserInstancePrivilege.user_uid == user.uid))
+        for uid, allowed_to_edit in instances:
+            permissions.visible_instances.add(uid)
+            if allowed_to_edit:
+                permissions.editable_instances.add(uid)
+        return permissions
+
+
+class PermissionService:
+    """
+    Hands out users' permissions, loading them once per user object (i.e., once per web request, as every request
+    loads its user anew) and, if ttl is set, keeping them for that many seconds across requests as well; as every
+    (gunicorn) worker holds a cache of its own, cached permissions are only used as long as the user's
+    permission_version (which invalidate bumps and which is read along with the user) has not changed
+    """
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    def get(self, session, user):
+        """
+        :param session:
+        :param user:
+        :return: Permissions (or None if they cannot be resolved, e.g., for users not stored yet)
+        """
+        if user is None or getattr(user, 'uid', None) is None:
+            return None
+        if user.permissions is not None:
+            return user.permissions
+        version = user.permission_version or 0
+        if self.ttl > 0:
+            with self.__lock:
+                cached = self.__cache.get(user.uid)
+            if cached is not None and cached[0] > time.monotonic() and cached[1] == version:
+                user.permissions = cached[2]
+                return cached[2]
+        if session is None:
+            return None
+        permissions = Permissions.load(session, user)
+        user.permissions = permissions
+        if self.ttl > 0:
+            with self.__lock:
+                self.__cache[user.uid] = (time.monotonic() + self.ttl, version, permissions)
+        return permissions
+
+    def invalidate(self, user=None):
+        """
+        Forgets cached permissions, to be called whenever privileges are granted or revoked (before committing, as the
+        user's bumped permission_version is what makes all other workers drop their cached permissions as well)
+        :param user: the user whose permissions changed (or None for all users of this worker)
+        :return:
+        """
+        with self.__lock:
+            if user is None:
+                self.__cache.clear()
+            else:
+                self.__cache.pop(user.uid, None)
+        if user is not None:
+            user.permissions = None
+            user.permission_version = (user.permission_version or 0) + 1
+
+
+permission_service = PermissionService()
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import concurrent.futures
+from scrapebot.steps import advance
+
+
+class AsyncRunner:
+    """
+    Runs recipes as coroutines on one event loop (in a background thread of its own): whatever blocks (i.e., WebDriver
+    and database calls) is handed to a small thread pool, while waits (i.e., Timeout, pause, and write_slowly) are
+    awaited and thus do not occupy any thread; submit and shutdown are used just like ThreadPoolExecutor's
+    """
+
+    def __init__(self, runs, threads):
+        """
+        :param runs: number of runs to interleave at most
+        :param threads: number of threads for blocking calls
+        """
+        self.__runs = runs
+        self.__semaphore = None
+        self.__futures = set()
+        self.__lock = threading.Lock()
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__run_loop, name='async-runner', daemon=True)
+        self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+        return False
+
+    def __run_loop(self):
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.run_forever()
+        self.__loop.close()
+
+    def submit(self, fn, *args):
+        """
+        Schedules a generator function that yields delays (in seconds), such as handle_recipe's iterate_recipe
+        :param fn:
+        :param args:
+        :return: concurrent.futures.Future holding the generator's return value
+        """
+        future = asyncio.run_coroutine_threadsafe(self.__run(fn, args), self.__loop)
+        with self.__lock:
+            self.__futures.add(future)
+        future.add_done_callback(self.__discard)
+        return future
+
+    def __discard(self, future):
+        with self.__lock:
+            self.__futures.discard(future)
+
+    async def __run(self, fn, args):
+        if self.__semaphore is None:
+            # created here as it is bound to the event loop (and this always runs on the loop's thread)
+            self.__semaphore = asyncio.Semaphore(self.__runs)
+        async with self.__semaphore:
+            return await self.wait_through(fn(*args))
+
+    async def wait_through(self, steps):
+        """
+        Advances a generator in the thread pool and awaits every delay it yields
+        :param steps:
+        :return: the generator's return value
+        """
+        while True:
+            done, value = await self.__loop.run_in_executor(self.__executor, advance, steps)
+            if done:
+                return value
+            await asyncio.sleep(value)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the event loop and the thread pool
+        :param wait: whether to wait for all submitted runs to finish first
+        :return:
+        """
+        with self.__lock:
+            futures = list(self.__futures)
+        if wait:
+            concurrent.futures.wait(futures)
+        else:
+            for future in futures:
+                future.cancel()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__executor.shutdown(wait=wait)
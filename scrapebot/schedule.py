@@ -0,0 +1,154 @@
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Schedule:
+    """
+    In-memory schedule of when each recipe is due next on this instance, used by the long-running daemon mode
+    """
+
+    def __init__(self):
+        self.__due = {}
+        self.__not_before = {}
+        self.__running = set()
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+
+    def __len__(self):
+        return len(self.__due)
+
+    @staticmethod
+    def get_next_due(latest_run_created, interval, now):
+        """
+        Calculates when a recipe is due next, based on its latest successful run and its interval
+        :param latest_run_created: creation datetime of the latest successful run (or None if there is none)
+        :param interval: in minutes
+        :param now:
+        :return:
+        """
+        if latest_run_created is None:
+            return now
+        return latest_run_created + timedelta(minutes=interval)
+
+    def update(self, recipe_uid, due):
+        """
+        Sets (or refreshes) the due date of a recipe, unless a previously finished run postponed it further
+        :param recipe_uid:
+        :param due:
+        :return:
+        """
+        with self.__lock:
+            not_before = self.__not_before.get(recipe_uid)
+            self.__due[recipe_uid] = due if not_before is None or due > not_before else not_before
+        self.__wakeup.set()
+
+    def retain(self, recipe_uids):
+        """
+        Drops all recipes (unless currently running) that are not among the given ones anymore
+        :param recipe_uids:
+        :return:
+        """
+        with self.__lock:
+            for recipe_uid in list(self.__due.keys()):
+                if recipe_uid not in recipe_uids and recipe_uid not in self.__running:
+                    del self.__due[recipe_uid]
+                    self.__not_before.pop(recipe_uid, None)
+
+    def pop_due(self, now):
+        """
+        Returns all recipes that are due and marks them as running, so that they cannot be handed out twice
+        :param now:
+        :return:
+        """
+        with self.__lock:
+            due = [recipe_uid for recipe_uid, due in sorted(self.__due.items(), key=lambda item: item[1])
+                   if due <= now and recipe_uid not in self.__running]
+            self.__running.update(due)
+        return due
+
+    def finish(self, recipe_uid, next_due=None):
+        """
+        Marks a recipe as no longer running and schedules its next run (or drops it if next_due is None)
+        :param recipe_uid:
+        :param next_due:
+        :return:
+        """
+        with self.__lock:
+            self.__running.discard(recipe_uid)
+            if next_due is None:
+                self.__due.pop(recipe_uid, None)
+                self.__not_before.pop(recipe_uid, None)
+            else:
+                self.__due[recipe_uid] = next_due
+                self.__not_before[recipe_uid] = next_due
+        self.__wakeup.set()
+
+    def is_running(self, recipe_uid):
+        with self.__lock:
+            return recipe_uid in self.__running
+
+    def get_seconds_until_next(self, now, maximum):
+        """
+        Seconds to sleep until the next recipe not currently running is due (but never more than maximum)
+        :param now:
+        :param maximum:
+        :return:
+        """
+        with self.__lock:
+            waiting = [due for recipe_uid, due in self.__due.items() if recipe_uid not in self.__running]
+        if len(waiting) == 0:
+            return maximum
+        return max(0, min(maximum, (min(waiting) - now).total_seconds()))
+
+    def wait(self, seconds):
+        """
+        Sleeps for the given seconds or until the schedule changes (e.g., because a run has finished)
+        :param seconds:
+        :return:
+        """
+        self.__wakeup.wait(seconds)
+        self.__wakeup.clear()
+
+    def wake(self):
+        self.__wakeup.set()
+
+
+class RecipeLock:
+    """
+    Inter-process lock ensuring that a recipe is never run twice at the same time on the same instance,
+    no matter whether it was started by the daemon or by overlapping cronjobs
+    """
+
+    def __init__(self, instance_name, recipe_uid, directory=None):
+        name = 'scrapebot_' + re.sub('[^a-zA-Z0-9_-]', '_', str(instance_name)) + '_' + str(recipe_uid) + '.lock'
+        self.path = os.path.join(directory if directory is not None else tempfile.gettempdir(), name)
+        self.__file = None
+
+    def acquire(self):
+        """
+        Tries to acquire the lock without blocking
+        :return: True if the lock was acquired, False if somebody else holds it
+        """
+        if fcntl is None:
+            return True
+        self.__file = open(self.path, 'a')
+        try:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self.__file.close()
+            self.__file = None
+            return False
+
+    def release(self):
+        if self.__file is not None:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+            self.__file.close()
+            self.__file = None
@@ -0,0 +1,265 @@
+import sys
+import time
+import random
+import inspect
+import traceback
+
+
+# entry point group through which other packages can provide step handlers, named after the step type they handle
+ENTRY_POINT_GROUP = 'scrapebot.steps'
+
+
+class StepHandler:
+    """
+    Handles one (or several related) step type(s); before and after are called around every handle, where after also
+    receives the time handle took (in seconds); handlers that wait (e.g., pause) do not sleep themselves but yield the
+    number of seconds to wait, so that an asynchronous runner can use this time for other runs
+    """
+
+    def before(self, emulator, run, step, prior_step=None):
+        pass
+
+    def handle(self, emulator, run, step, prior_step=None):
+        """
+        Does what the step promises to do, either right away or as generator yielding delays (in seconds)
+        :param emulator:
+        :param run:
+        :param step:
+        :param prior_step:
+        :return: RunStatusEnum (or a generator returning it)
+        """
+        raise NotImplementedError
+
+    def after(self, emulator, run, step, prior_step, status, duration):
+        pass
+
+    @staticmethod
+    def get_first_elem_or_none(element):
+        if element is None:
+            return None
+        elif isinstance(element, list):
+            return element[0] if len(element) > 0 else None
+        else:
+            return element
+
+    @staticmethod
+    def get_elem_list(elements):
+        if elements is None:
+            return []
+        elif isinstance(elements, list):
+            return elements
+        else:
+            return [elements]
+
+
+class StepRegistry:
+    """
+    Maps step types to their handlers, so that a step is dispatched through a single dictionary lookup
+    """
+
+    def __init__(self, entry_point_group=None):
+        self.__handlers = {}
+        self.__listeners = []
+        self.__entry_point_group = entry_point_group
+        self.__entry_points_loaded = entry_point_group is None
+
+    def register(self, step_type, handler):
+        """
+        Registers (or replaces) the handler of a step type
+        :param step_type: RecipeStepTypeEnum
+        :param handler: StepHandler instance (or class, which is then instantiated)
+        :return:
+        """
+        self.__handlers[step_type] = handler() if isinstance(handler, type) else handler
+
+    def get(self, step_type):
+        if not self.__entry_points_loaded:
+            self.load_entry_points()
+        return self.__handlers.get(step_type)
+
+    def add_listener(self, listener):
+        """
+        Adds a function to be called after every step with the step, its status, and its duration (in seconds)
+        :param listener:
+        :return:
+        """
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.__listeners:
+            self.__listeners.remove(listener)
+
+    def dispatch(self, emulator, run, step, prior_step=None):
+        """
+        Hands the step to its handler (including the handler's hooks and all listeners) and sleeps whenever it waits
+        :param emulator:
+        :param run:
+        :param step:
+        :param prior_step:
+        :return: RunStatusEnum (config_error if no handler is registered for the step's type)
+        """
+        return wait_through(self.iterate(emulator, run, step, prior_step))
+
+    def iterate(self, emulator, run, step, prior_step=None):
+        """
+        Same as dispatch but as generator that yields the delays (in seconds) instead of sleeping
+        :param emulator:
+        :param run:
+        :param step:
+        :param prior_step:
+        :return: RunStatusEnum (config_error if no handler is registered for the step's type)
+        """
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        handler = self.get(step.type)
+        if handler is None:
+            run.add_log('No handler found for step type "' + step.type.name + '"', LogTypeEnum.error)
+            return RunStatusEnum.config_error
+        status = None
+        handler.before(emulator, run, step, prior_step)
+        start = time.perf_counter()
+        try:
+            status = handler.handle(emulator, run, step, prior_step)
+            if inspect.isgenerator(status):
+                status = yield from status
+            return status
+        finally:
+            duration = time.perf_counter() - start
+            handler.after(emulator, run, step, prior_step, status, duration)
+            for listener in self.__listeners:
+                listener(step, status, duration)
+
+    def load_entry_points(self):
+        """
+        Registers the handlers that installed packages provide through ENTRY_POINT_GROUP, e.g.:
+        entry_points={'scrapebot.steps': ['get_htmlsource = my_package:HtmlSourceHandler']}
+        :return: number of handlers registered
+        """
+        from scrapebot.steptypes import RecipeStepTypeEnum
+        self.__entry_points_loaded = True
+        registered = 0
+        for entry_point in iter_entry_points(self.__entry_point_group):
+            if entry_point.name not in RecipeStepTypeEnum.__members__:
+                print('Warning: Step handler "' + entry_point.name + '" ignored as there is no such step type')
+                continue
+            try:
+                self.register(RecipeStepTypeEnum[entry_point.name], entry_point.load())
+                registered = registered + 1
+            except:
+                print('Error: Step handler "' + entry_point.name + '" could not be loaded')
+                error = sys.exc_info()[0]
+                if error is not None:
+                    print('- ' + str(error))
+                    print('- ' + traceback.format_exc())
+        return registered
+
+
+class LogHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        run.add_log(step.value)
+        return RunStatusEnum.success
+
+
+class DataHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        run.add_data(step, step.value)
+        return RunStatusEnum.success
+
+
+class PauseHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        pause = int(step.value)
+        pause = random.uniform(pause*.75, pause*1.25)
+        yield pause
+        run.add_log('Paused for ' + str(round(pause, 1)) + ' seconds')
+        return RunStatusEnum.success
+
+
+class RandomSelectHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import LogTypeEnum, RunStatusEnum
+        if prior_step.temp_result is None:
+            run.add_log('No element from previous step found, hence no element randomly selected',
+                        LogTypeEnum.warning)
+        elif isinstance(prior_step.temp_result, list):
+            count = len(prior_step.temp_result)
+            if count > 0:
+                i = random.randint(0, count-1)
+                step.temp_result = prior_step.temp_result[i]
+                run.add_data(step, i+1)
+                run.add_log('Randomly selected element ' + str(i+1) + '/' + str(count) +
+                            ' (stored ' + str(i+1) + ' as data)')
+            else:
+                run.add_log('No element from previous step found, hence no element randomly selected',
+                            LogTypeEnum.warning)
+        else:
+            step.temp_result = prior_step.temp_result
+            run.add_data(step, '0')
+            run.add_log('Only one element from previous step found, so this was selected "randomly"')
+        return RunStatusEnum.success
+
+
+class ElementCountHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        if prior_step.temp_result is None:
+            run.add_data(step, '0')
+            run.add_log('No previously retrieved elements found, thus stored "0"')
+        elif isinstance(prior_step.temp_result, list):
+            value = str(len(prior_step.temp_result))
+            run.add_data(step, value)
+            run.add_log('Counted and stored ' + value + ' element(s)')
+        else:
+            run.add_data(step, '1')
+            run.add_log('Counted and stored only 1 element')
+        return RunStatusEnum.success
+
+
+class UnsetPriorElementHandler(StepHandler):
+    def handle(self, emulator, run, step, prior_step=None):
+        from scrapebot.database import RunStatusEnum
+        if prior_step is not None and prior_step.temp_result is not None:
+            prior_step.temp_result = None
+            step.temp_result = None
+            run.add_log('Previously retrieved element removed')
+        return RunStatusEnum.success
+
+
+def wait_through(steps, sleep=time.sleep):
+    """
+    Runs a generator that yields delays (in seconds) by sleeping for each of them
+    :param steps:
+    :param sleep:
+    :return: the generator's return value
+    """
+    while True:
+        done, value = advance(steps)
+        if done:
+            return value
+        sleep(value)
+
+
+def advance(steps):
+    """
+    Runs a generator until it yields its next delay (or returns)
+    :param steps:
+    :return: tuple of whether the generator is done and either its delay or its return value
+    """
+    try:
+        return False, next(steps)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+def iter_entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(group))
+    points = entry_points()
+    if hasattr(points, 'select'):
+        return list(points.select(group=group))
+    return list(points.get(group, []))
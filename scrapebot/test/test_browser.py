@@ -0,0 +1,214 @@
+import os
+import pytest
+from scrapebot.browser import BrowserSession, BrowserPool, DisplayManager
+
+
+class FakeSelenium(object):
+    def __init__(self):
+        self.cookies = [{'name': 'foo', 'value': 'bar'}]
+        self.url = 'https://www.google.com'
+        self.closed = False
+
+    def execute_script(self, script):
+        return None
+
+    def delete_all_cookies(self):
+        self.cookies = []
+
+    def get(self, url):
+        self.url = url
+
+    def quit(self):
+        self.closed = True
+
+    def execute(self, command, params=None):
+        return {'value': None}
+
+
+class MultiSiteSelenium(FakeSelenium):
+    """
+    Keeps cookies and storage per site, where (just like in a real browser) only the current site's are cleared
+    """
+
+    def __init__(self):
+        super(MultiSiteSelenium, self).__init__()
+        self.url = 'about:blank'
+        self.site_cookies = {}
+        self.site_storage = {}
+
+    @property
+    def current_url(self):
+        return self.url
+
+    def __site(self):
+        return '/'.join(self.url.split('/')[:3])
+
+    def get(self, url):
+        self.execute('get', {'url': url})
+        self.url = url
+
+    def add_cookie(self, cookie):
+        self.site_cookies.setdefault(self.__site(), []).append(cookie)
+
+    def set_item(self, key, value):
+        self.site_storage.setdefault(self.__site(), {})[key] = value
+
+    def execute_script(self, script):
+        self.site_storage.pop(self.__site(), None)
+
+    def delete_all_cookies(self):
+        self.site_cookies.pop(self.__site(), None)
+
+
+class ChromeSelenium(MultiSiteSelenium):
+    def __init__(self):
+        super(ChromeSelenium, self).__init__()
+        self.cdp_commands = []
+
+    def execute_cdp_cmd(self, command, params):
+        self.cdp_commands.append((command, params.get('origin')))
+
+
+class FakeDisplay(object):
+    counter = 100
+
+    def __init__(self, visible=0, size=(1024, 768)):
+        FakeDisplay.counter += 1
+        self.new_display_var = ':' + str(FakeDisplay.counter)
+        self.size = size
+        self.alive = False
+
+    def start(self):
+        self.alive = True
+
+    def stop(self):
+        self.alive = False
+
+    def is_alive(self):
+        return self.alive
+
+
+@pytest.fixture
+def new_display_manager():
+    return DisplayManager(FakeDisplay)
+
+
+@pytest.fixture
+def new_browser_pool():
+    return BrowserPool()
+
+
+def make_browser_session(key=('Firefox', '', '', 'en', 1024, 768)):
+    return BrowserSession(key, FakeSelenium())
+
+
+class TestBrowserPool(object):
+    def test_acquire_empty(self, new_browser_pool):
+        assert new_browser_pool.acquire(('Firefox', '', '', 'en', 1024, 768)) is None
+
+    def test_release_and_reuse(self, new_browser_pool):
+        session = make_browser_session()
+        assert new_browser_pool.release(session, 5)
+        assert session.selenium.cookies == []
+        assert session.selenium.url == 'about:blank'
+        assert new_browser_pool.acquire(('Firefox', '', '', 'de', 1024, 768)) is None
+        assert new_browser_pool.acquire(session.key) is session
+        assert len(new_browser_pool) == 0
+
+    def test_recycle(self, new_browser_pool):
+        session = make_browser_session()
+        assert new_browser_pool.release(session, 2)
+        assert new_browser_pool.acquire(session.key) is session
+        assert new_browser_pool.release(session, 2) is False
+        assert session.selenium.closed
+        assert len(new_browser_pool) == 0
+
+    def test_crashed(self, new_browser_pool):
+        session = make_browser_session()
+        assert new_browser_pool.release(session, 5, healthy=False) is False
+        assert session.selenium.closed
+
+    def test_close_all(self, new_browser_pool):
+        sessions = [make_browser_session(), make_browser_session()]
+        for session in sessions:
+            new_browser_pool.release(session, 5)
+        assert len(new_browser_pool) == 2
+        new_browser_pool.close_all()
+        assert len(new_browser_pool) == 0
+        assert all([session.selenium.closed for session in sessions])
+
+    def test_reset_all_sites(self, new_browser_pool):
+        session = BrowserSession(('Firefox', '', '', 'en', 1024, 768), MultiSiteSelenium())
+        for url in ['https://www.google.com/search?q=scrapebot', 'https://www.bing.com/']:
+            session.selenium.get(url)
+            session.selenium.add_cookie({'name': 'foo', 'value': 'bar'})
+            session.selenium.set_item('foo', 'bar')
+        assert session.origins == {'https://www.google.com', 'https://www.bing.com'}
+        assert new_browser_pool.release(session, 5)
+        assert session.selenium.site_cookies == {} and session.selenium.site_storage == {}
+        assert session.selenium.url == 'about:blank' and session.origins == set()
+
+    def test_reset_chrome(self, new_browser_pool):
+        session = BrowserSession(('Chrome', '', '', 'en', 1024, 768), ChromeSelenium())
+        session.selenium.get('https://www.google.com/')
+        session.selenium.get('https://www.bing.com/')
+        assert new_browser_pool.release(session, 5)
+        assert session.selenium.cdp_commands[0] == ('Network.clearBrowserCookies', None)
+        assert sorted(session.selenium.cdp_commands[1:]) == [('Storage.clearDataForOrigin', 'https://www.bing.com'),
+                                                             ('Storage.clearDataForOrigin', 'https://www.google.com')]
+
+    def test_count_calls(self):
+        session = make_browser_session()
+        session.selenium.execute('getTitle')
+        session.selenium.execute('getCurrentUrl', {})
+        assert session.calls == 2
+
+
+class TestDisplayManager(object):
+    def test_share(self, new_display_manager):
+        first = new_display_manager.acquire(1200, 900)
+        second = new_display_manager.acquire(1200, 900)
+        assert first is second
+        assert first.users == 2
+        assert len(new_display_manager) == 1
+        new_display_manager.release(first)
+        new_display_manager.release(second)
+        assert first.users == 0
+        assert first.is_alive()
+
+    def test_count(self, new_display_manager):
+        first = new_display_manager.acquire(1200, 900, 2)
+        second = new_display_manager.acquire(1200, 900, 2)
+        third = new_display_manager.acquire(1200, 900, 2)
+        assert first is not second
+        assert third.users == 2
+        assert len(new_display_manager) == 2
+
+    def test_health(self, new_display_manager):
+        first = new_display_manager.acquire(1200, 900)
+        first.display.stop()
+        second = new_display_manager.acquire(1200, 900)
+        assert first is not second
+        new_display_manager.release(first)
+        assert len(new_display_manager) == 1
+
+    def test_size(self, new_display_manager):
+        small = new_display_manager.acquire(800, 600)
+        new_display_manager.release(small)
+        large = new_display_manager.acquire(1200, 900)
+        assert small is not large
+        assert small.is_alive() is False
+        assert new_display_manager.acquire(800, 600) is large
+
+    def test_environment(self, new_display_manager):
+        shared = new_display_manager.acquire(1200, 900)
+        previous = os.environ.get('DISPLAY')
+        with new_display_manager.environment(shared):
+            assert os.environ['DISPLAY'] == shared.name
+        assert os.environ.get('DISPLAY') == previous
+
+    def test_close_all(self, new_display_manager):
+        shared = new_display_manager.acquire(1200, 900)
+        new_display_manager.close_all()
+        assert len(new_display_manager) == 0
+        assert shared.is_alive() is False
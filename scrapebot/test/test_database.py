@@ -1,5 +1,7 @@
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from scrapebot.database import *
 from scrapebot.emulate import RecipeStepTypeEnum
 
@@ -183,6 +185,20 @@ def make_data(run, recipe_step):
     return data
 
 
+@pytest.fixture
+def db_session():
+    engine = create_engine('sqlite:///:memory:')
+    base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def owner():
+    return User(email='mario@haim.it', password='Ak&f(8-fL:')
+
+
 class TestUser(object):
     def test_jsonify(self, new_user):
         assert type(new_user.get_id()) is str
@@ -193,6 +209,13 @@ class TestUser(object):
         assert len(password) >= 10
         assert new_user.check_password(password)
 
+    def test_login(self, new_user):
+        other_user = make_user()
+        other_user.uid = new_user.uid
+        assert new_user.is_active and new_user.is_authenticated and not new_user.is_anonymous
+        assert new_user == other_user and not new_user != other_user
+        assert len({new_user, other_user}) == 2
+
 
 class TestUserInstancePrivilege(object):
     def test_jsonify(self, new_user_instance_privilege):
@@ -314,6 +337,129 @@ class TestRun(object):
         run = make_run(new_recipe_order.recipe, new_recipe_order.instance)
         assert run.get_recipe_order() is new_recipe_order
 
+    def test_add_log_and_data(self, new_run, new_recipe_step):
+        new_run.add_log('test log')
+        new_run.add_log('test error', LogTypeEnum.error)
+        new_run.add_data(new_recipe_step, 42)
+        assert new_run.log_buffer == [('test log', LogTypeEnum.info), ('test error', LogTypeEnum.error)]
+        assert new_run.data_buffer == [(new_recipe_step, '42')]
+
+    def test_store_buffer(self, db_session, owner):
+        instance = Instance(name='buffer_instance', owner=owner)
+        recipe = Recipe(name='buffer_recipe', owner=owner)
+        step = RecipeStep(sort=1, type=RecipeStepTypeEnum.data, value='x', recipe=recipe)
+        run = Run(instance=instance, recipe=recipe, status=RunStatusEnum.success)
+        db_session.add(run)
+        for i in range(0, 25):
+            run.add_log('log ' + str(i))
+            run.add_data(step, i)
+        assert run.store_buffer(db_session, chunk_size=10) == 50
+        db_session.commit()
+        assert run.log_buffer is None and run.data_buffer is None
+        assert db_session.query(Log).filter(Log.run_uid == run.uid).count() == 25
+        assert [data.value for data in run.data] == [str(i) for i in range(0, 25)]
+        assert run.data[0].step is step
+
+    def test_store_buffer_blobs(self, db_session, owner):
+        instance = Instance(name='blob_instance', owner=owner)
+        recipe = Recipe(name='blob_recipe', owner=owner)
+        step = RecipeStep(sort=1, type=RecipeStepTypeEnum.get_htmlsource, recipe=recipe)
+        html = '<html><body>' + 'snapshot ' * 1000 + '</body></html>'
+        runs = [Run(instance=instance, recipe=recipe, status=RunStatusEnum.success) for _ in range(0, 3)]
+        db_session.add_all(runs)
+        for run in runs:
+            run.add_data(step, html)
+            run.add_data(step, html)
+            run.add_data(step, 'short')
+            run.store_buffer(db_session, blob_threshold=100)
+        db_session.commit()
+        blob = db_session.query(Blob).one()
+        assert blob.size == len(html) and len(blob.content) < len(html) / 10
+        assert blob.hash == Blob.get_hash(html)
+        data = db_session.query(Data).filter(Data.run_uid == runs[2].uid).order_by(Data.uid).all()
+        assert [temp_data.value for temp_data in data] == [None, None, 'short']
+        assert [temp_data.get_value() for temp_data in data] == [html, html, 'short']
+        assert data[0].jsonify()['value'] == html
+        assert Blob.store(db_session, [html]) == {html: blob.hash}
+        assert db_session.query(Blob).count() == 1
+
+    @pytest.mark.parametrize('rows', [5, 50])
+    def test_serialize(self, rows, db_session, owner):
+        from sqlalchemy import event
+        instance = Instance(name='serialize_instance', owner=owner)
+        recipe = Recipe(name='serialize_recipe', owner=owner)
+        steps = [RecipeStep(sort=i, type=RecipeStepTypeEnum.data, recipe=recipe) for i in range(1, 3)]
+        run = Run(instance=instance, recipe=recipe, status=RunStatusEnum.success)
+        db_session.add(run)
+        for i in range(0, rows):
+            run.add_log('log ' + str(i))
+            run.add_data(steps[i % 2], 'long value ' * 20 if i == 0 else str(i))
+        run.add_timing(steps[0], 'data', 0.5, 1, 1)
+        run.store_buffer(db_session, chunk_size=10, blob_threshold=100)
+        db_session.commit()
+        db_session.expire_all()
+        statements = []
+        event.listen(db_session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        temp = run.serialize(db_session, include_log=True, include_data=True, include_timing=True, chunk_size=10)
+        # the number of queries does not depend on the number of rows (i.e., nothing is lazy-loaded per row)
+        assert len(statements) <= 8
+        assert [step['sort'] for step in temp['steps']] == [1, 2]
+        assert temp['instance']['name'] == 'serialize_instance' and temp['recipe']['name'] == 'serialize_recipe'
+        assert [data['step'] for data in temp['data']] == [steps[i % 2].uid for i in range(0, rows)]
+        assert temp['data'][0]['value'] == 'long value ' * 20 and temp['data'][1]['value'] == '1'
+        assert [log['message'] for log in temp['log']] == ['log ' + str(i) for i in range(0, rows)]
+        assert temp['timing'][0]['duration'] == 0.5
+        assert 'run' not in temp['log'][0] and 'recipe' not in temp['steps'][0]
+        records = [record['record'] for record in run.stream(db_session, chunk_size=10)]
+        assert records == ['run'] + ['log'] * rows + ['data'] * rows + ['timing', 'timing']
+
+    def test_store_buffer_timings(self, db_session, owner):
+        instance = Instance(name='timing_instance', owner=owner)
+        recipe = Recipe(name='timing_recipe', owner=owner)
+        steps = [RecipeStep(sort=i, type=RecipeStepTypeEnum.data, recipe=recipe) for i in range(1, 3)]
+        for duration in [1.0, 3.0]:
+            run = Run(instance=instance, recipe=recipe, status=RunStatusEnum.success)
+            db_session.add(run)
+            run.add_timing(None, 'browser_start', duration)
+            run.add_timing(steps[1], 'get_texts', duration, 2, 4)
+            run.add_timing(steps[0], 'navigate', duration / 2, 1)
+            assert run.store_buffer(db_session) == 4
+        db_session.commit()
+        assert run.timing_buffer is None
+        assert [timing['label'] for timing in run.jsonify(include_timing=True)['timing']] == \
+            ['browser_start', 'get_texts', 'navigate', 'store']
+        summary = StepTiming.summarize(db_session, recipe)
+        assert [(row['sort'], row['label'], row['count']) for row in summary] == \
+            [(None, 'browser_start', 2), (1, 'navigate', 2), (2, 'get_texts', 2), (None, 'store', 2)]
+        assert (summary[2]['duration_avg'], summary[2]['duration_max']) == (2.0, 3.0)
+        assert (summary[2]['calls_avg'], summary[2]['data_avg']) == (2.0, 4.0)
+
+    def test_query_page(self, db_session, owner):
+        from scrapebot.database import UserRecipePrivilege as RecipePrivilege
+        guest = User(email='guest@haim.it', password='Ak&f(8-fL:')
+        instances = [Instance(name='page_instance_' + str(i), owner=owner) for i in range(0, 2)]
+        recipe = Recipe(name='page_recipe', owner=owner)
+        db_session.add_all([guest, RecipePrivilege(user=guest, recipe=recipe),
+                            UserInstancePrivilege(user=guest, instance=instances[0])])
+        for i in range(0, 25):
+            # pairs of runs share their creation time, so that pages are told apart by uid as well
+            db_session.add(Run(instance=instances[i % 2], recipe=recipe, status=RunStatusEnum.success,
+                               created=datetime(2018, 1, 1) + timedelta(minutes=i // 2)))
+        db_session.commit()
+        expected = db_session.query(Run).order_by(Run.created.desc(), Run.uid.desc()).all()
+        for user, visible in [(owner, expected), (guest, [run for run in expected if run.instance is instances[0]])]:
+            paged = []
+            runs, cursor = Run.query_page(db_session, user, recipe.uid, limit=4)
+            paged.extend(runs)
+            while cursor is not None:
+                assert len(runs) == 4
+                runs, cursor = Run.query_page(db_session, user, recipe.uid, before=cursor, limit=4)
+                paged.extend(runs)
+            assert paged == visible
+        assert Run.query_page(db_session, guest, instance_uid=instances[1].uid) == ([], None)
+        with pytest.raises(ValueError):
+            Run.query_page(db_session, owner, before='yesterday')
+
 
 class TestLog(object):
     @pytest.mark.parametrize('new_type', [LogTypeEnum.info, LogTypeEnum.error])
@@ -324,3 +470,170 @@ class TestLog(object):
 class TestData(object):
     def test_jsonify(self, new_data):
         assert isinstance(new_data.jsonify(), dict)
+
+
+class TestJob(object):
+    def test_jsonify(self, new_user):
+        job = Job(user=new_user, type=JobTypeEnum.download, status=JobStatusEnum.queued, payload='{"a": 1}')
+        assert isinstance(job.jsonify(), dict)
+        assert job.get_payload() == {'a': 1}
+
+    def test_queue(self, db_session, owner):
+        first = Job.enqueue(db_session, owner, JobTypeEnum.download, {'instance_uids': [1]})
+        second = Job.enqueue(db_session, owner, JobTypeEnum.duplication, {'recipe_uid': 1})
+        job = Job.claim_next(db_session)
+        assert job.uid == first.uid and job.status is JobStatusEnum.running and job.attempts == 1
+        assert Job.claim_next(db_session).uid == second.uid
+        assert Job.claim_next(db_session) is None
+        Job.report_progress(db_session, first.uid, 150)
+        db_session.refresh(job)
+        assert job.progress == 100
+        assert job.fail('error', retries=1)
+        db_session.commit()
+        assert Job.claim_next(db_session) is None
+        assert Job.claim_next(db_session, retry_delay=0).uid == first.uid
+        assert not job.fail('error', retries=1)
+        assert job.status is JobStatusEnum.failed
+        assert Job.requeue_stale(db_session, timeout=0) == 1
+        assert Job.claim_next(db_session, retry_delay=0).uid == second.uid
+
+    def test_save_payload(self, db_session, owner):
+        job = Job.enqueue(db_session, owner, JobTypeEnum.duplication, {'recipe_uid': 1, 'amount': 3})
+        for copies_done in [1, 2]:
+            Job.save_payload(db_session, job.uid, {'recipe_uid': 1, 'amount': 3, 'copies_done': copies_done})
+            if copies_done == 1:
+                db_session.commit()
+            else:
+                # a failed attempt does not move the checkpoint along
+                db_session.rollback()
+        db_session.expire_all()
+        assert job.get_payload()['copies_done'] == 1
+
+
+class TestInstanceQueries(object):
+    def test_get_visible_with_latest_runs(self, db_session, owner):
+        from sqlalchemy import event
+        other = User(email='other@haim.it', password='Ak&f(8-fL:')
+        instances = [Instance(name='instance ' + str(i), owner=owner) for i in range(0, 3)]
+        shared = Instance(name='shared instance', owner=other)
+        hidden = Instance(name='hidden instance', owner=other)
+        shared.privileged_users.append(UserInstancePrivilege(user=owner, allowed_to_edit=False))
+        recipes = [Recipe(name='recipe ' + str(i), owner=other) for i in range(0, 2)]
+        for instance in instances + [shared, hidden]:
+            for recipe in recipes:
+                instance.recipes.append(RecipeOrder(recipe=recipe))
+                for _ in range(0, 5):
+                    db_session.add(Run(instance=instance, recipe=recipe, status=RunStatusEnum.success))
+        db_session.add_all([instances[0], hidden])
+        db_session.commit()
+        expected = db_session.query(func.max(Run.uid)).filter(Run.instance_uid == shared.uid).one()[0]
+        owner_uid = owner.uid
+        recipe_uid = recipes[0].uid
+        db_session.expunge_all()
+        user = db_session.query(User).filter(User.uid == owner_uid).one()
+
+        statements = []
+        event.listen(db_session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        rows = Instance.get_visible_with_latest_runs(db_session, user)
+        json = [dict(instance.jsonify(), latest_run=latest_run.jsonify()) for (instance, latest_run) in rows]
+        assert len(statements) == 1
+        assert [row['name'] for row in json] == ['instance 0', 'instance 1', 'instance 2', 'shared instance']
+        assert json[3]['latest_run']['uid'] == expected
+        assert json[3]['owner']['email'] == 'other@haim.it'
+
+        del statements[:]
+        rows = Instance.get_visible_with_latest_runs(db_session, user, [recipe_uid])
+        assert len(statements) == 1
+        assert len(rows) == 4
+        assert all([latest_run.recipe.name == 'recipe 0' for (instance, latest_run) in rows])
+
+
+class TestRunQueries(object):
+    def test_get_latest_run(self, db_session, owner):
+        from sqlalchemy import event
+        instance = Instance(name='instance', owner=owner)
+        other_instance = Instance(name='other instance', owner=owner)
+        recipe = Recipe(name='recipe', owner=owner)
+        statuses = [RunStatusEnum.success, RunStatusEnum.error, RunStatusEnum.success, RunStatusEnum.error]
+        runs = [Run(instance=instance, recipe=recipe, status=status, created=datetime(2019, 1, 1, i))
+                for i, status in enumerate(statuses)]
+        db_session.add_all(runs + [Run(instance=other_instance, recipe=recipe, created=datetime(2019, 1, 2))])
+        db_session.commit()
+
+        statements = []
+        event.listen(db_session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        assert recipe.get_latest_run(instance) is runs[3]
+        assert recipe.get_latest_run(instance, only_include_successful_runs=True) is runs[2]
+        assert recipe.get_latest_run().instance is other_instance
+        assert recipe.get_latest_runs(2, instance) == [runs[3], runs[2]]
+        assert instance.get_latest_run(recipe, only_include_successful_runs=True) is runs[2]
+        assert instance.get_latest_runs(10) == list(reversed(runs))
+        assert all(['LIMIT' in statement for statement in statements if statement.startswith('SELECT run.')])
+
+    def test_has_data_in_latest_runs(self, db_session, owner):
+        from sqlalchemy import event
+        instance = Instance(name='instance', owner=owner)
+        other_instance = Instance(name='other instance', owner=owner)
+        recipe = Recipe(name='recipe', owner=owner)
+        step = RecipeStep(sort=1, type=RecipeStepTypeEnum.sometimes_screenshot, recipe=recipe)
+        runs = [Run(instance=instance, recipe=recipe, status=RunStatusEnum.success, created=datetime(2019, 1, 1, i))
+                for i in range(0, 10)]
+        db_session.add_all(runs)
+        db_session.add(Data(run=runs[2], step=step, value='screenshot.png', created=datetime(2019, 1, 1, 2)))
+        db_session.add(Data(run=runs[9], step=step, value='', created=datetime(2019, 1, 1, 9)))
+        # data of an older run that took long is stored after later runs have started, but still belongs to the old run
+        db_session.add(Data(run=runs[0], step=step, value='screenshot.png', created=datetime(2019, 1, 1, 9, 30)))
+        other_run = Run(instance=other_instance, recipe=recipe, created=datetime(2019, 1, 2))
+        db_session.add(Data(run=other_run, step=step, value='screenshot.png', created=datetime(2019, 1, 2)))
+        db_session.commit()
+
+        statements = []
+        event.listen(db_session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        assert step.has_data_in_latest_runs(instance, 8)
+        assert not step.has_data_in_latest_runs(instance, 7)
+        assert step.has_data_in_latest_runs(other_instance, 1)
+        # neither runs nor data are loaded as a whole
+        assert not any(['data_value' in statement or 'run_runtime' in statement for statement in statements])
+
+    def test_upgrade_schema(self):
+        from sqlalchemy import create_engine, inspect
+        from setup import upgrade_schema
+        engine = create_engine('sqlite:///:memory:')
+        base.metadata.create_all(engine)
+        for index in Run.__table__.indexes:
+            index.drop(engine)
+        assert sorted(upgrade_schema(engine)) == sorted([index.name for index in Run.__table__.indexes])
+        assert len(inspect(engine).get_indexes('run')) == len(Run.__table__.indexes)
+        assert upgrade_schema(engine) == []
+
+
+class TestRunStatistics(object):
+    def test_add_run_and_backfill(self, db_session, owner):
+        from backfill_statistics import backfill
+        instance = Instance(name='instance', owner=owner)
+        recipe = Recipe(name='recipe', owner=owner)
+        step = RecipeStep(sort=1, type=RecipeStepTypeEnum.data, value='x', recipe=recipe)
+        for runtime, status in [(10, RunStatusEnum.success), (30, RunStatusEnum.error), (20, RunStatusEnum.success)]:
+            run = Run(instance=instance, recipe=recipe, status=status, runtime=runtime)
+            db_session.add(run)
+            run.add_data(step, runtime)
+            run.add_data(step, runtime)
+            run.store_buffer(db_session)
+            RunStatistics.add_run(db_session, run)
+            db_session.commit()
+        # runs still in progress are not counted (yet), neither live nor by the backfill
+        run = Run(instance=instance, recipe=recipe, status=RunStatusEnum.in_progress, runtime=0)
+        db_session.add(run)
+        run.add_data(step, 0)
+        run.store_buffer(db_session)
+        db_session.commit()
+        statistics = db_session.query(RunStatistics).one()
+        expected = (3, 2, 1, 60, 10, 30, 6)
+        assert (statistics.runs, statistics.successes, statistics.errors, statistics.runtime_sum,
+                statistics.runtime_min, statistics.runtime_max, statistics.data_count) == expected
+        assert recipe.get_average_runtime() == 20
+        assert backfill(db_session) == 1
+        db_session.commit()
+        statistics = db_session.query(RunStatistics).one()
+        assert (statistics.runs, statistics.successes, statistics.errors, statistics.runtime_sum,
+                statistics.runtime_min, statistics.runtime_max, statistics.data_count) == expected
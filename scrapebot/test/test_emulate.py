@@ -2,7 +2,7 @@ from time import time
 import pytest
 from scrapebot.test.test_database import *
 from scrapebot.test.test_configuration import *
-from scrapebot.emulate import RecipeStepTypeEnum, Emulator
+from scrapebot.emulate import RecipeStepTypeEnum, Emulator, ScreenshotHandler
 from scrapebot.database import base, Recipe, RecipeStep, Instance, User, RecipeOrder, Run, RunStatusEnum
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
@@ -32,7 +32,7 @@ def test_step_run_with_random_item(new_recipe_step_item):
     try:
         new_recipe_step_item.step.run(None, run)
     except:
-        assert run.data.__len__() > 0
+        assert run.data_buffer.__len__() > 0
 
 
 def test_step_run_with_fixed_item(new_recipe_step_item):
@@ -41,7 +41,7 @@ def test_step_run_with_fixed_item(new_recipe_step_item):
     try:
         new_recipe_step_item.step.run(None, run)
     except:
-        assert run.data.__len__() == 0
+        assert run.data_buffer is None
 
 
 class TestEmulator(object):
@@ -57,8 +57,8 @@ class TestEmulator(object):
         step.value = 42
         handler = new_emulator.run(new_configuration, new_run, step, make_recipe_step(recipe))
         assert handler is RunStatusEnum.success
-        assert new_run.data.__len__() == 1
-        assert new_run.data[0].value == step.value
+        assert new_run.data_buffer.__len__() == 1
+        assert new_run.data_buffer[0][1] == str(step.value)
 
     def test_run_pause(self, new_configuration, new_emulator, new_run, new_user):
         recipe = make_recipe(new_user)
@@ -105,6 +105,7 @@ class TestEmulator(object):
                 steps[i].temp_result = steps[i-1].temp_result
         run.end_session()
         connect_db.add(run)
+        run.store_buffer(connect_db)
         connect_db.commit()
 
         run = connect_db.query(Run).one_or_none()
@@ -112,3 +113,155 @@ class TestEmulator(object):
         assert run.data.__len__() > 0
         last_data_value = run.data.pop().value
         assert last_data_value.__contains__('http')
+
+
+class FakeElement(object):
+    def __init__(self, text, attributes):
+        self.text = text
+        self.attributes = attributes
+
+    def get_attribute(self, name):
+        return self.attributes.get(name)
+
+
+class FakeSelenium(object):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.scripts = 0
+
+    def execute_script(self, script, *args):
+        from scrapebot.emulate import EXTRACT_JS, EXTRACT_TABLE_JS
+        from selenium.common.exceptions import JavascriptException
+        self.scripts += 1
+        if self.fail:
+            raise JavascriptException('not supported')
+        if script is EXTRACT_JS:
+            self.extracted = args
+            return ['first', 'second'] if args[2] is None else ['https://haim.it', None]
+        if script is EXTRACT_TABLE_JS:
+            return [['a', 'b'], ['c', 'd']] if args[0] == 'table' else None
+        elements, attribute = args
+        return [element.text if attribute is None else element.attributes.get(attribute) for element in elements]
+
+
+class TestEmulatorBatchProperties(object):
+    @pytest.mark.parametrize('fail', [False, True])
+    @pytest.mark.parametrize('step_type, step_value, expected', [
+        (RecipeStepTypeEnum.get_texts, None, ['first', 'second']),
+        (RecipeStepTypeEnum.get_values, None, ['1', 'None']),
+        (RecipeStepTypeEnum.get_attributes, 'href', ['https://haim.it', 'None'])
+    ])
+    def test_run(self, new_configuration, new_emulator, new_run, new_user, fail, step_type, step_value, expected):
+        selenium = FakeSelenium(fail)
+        new_emulator._Emulator__selenium = selenium
+        recipe = make_recipe(new_user)
+        prior_step = make_recipe_step(recipe)
+        prior_step.temp_result = [FakeElement('first', {'value': '1', 'href': 'https://haim.it'}),
+                                  FakeElement('second', {})]
+        step = make_recipe_step(recipe)
+        step.type = step_type
+        step.value = step_value
+        assert new_emulator.run(new_configuration, new_run, step, prior_step) is RunStatusEnum.success
+        assert [value for (data_step, value) in new_run.data_buffer] == expected
+        assert selenium.scripts == 1
+
+
+class TestEmulatorExtract(object):
+    @pytest.mark.parametrize('step_type, step_value, expected, extracted', [
+        (RecipeStepTypeEnum.extract_css_texts, 'a.result', ['first', 'second'], ('css', 'a.result', None)),
+        (RecipeStepTypeEnum.extract_xpath_texts, '//a', ['first', 'second'], ('xpath', '//a', None)),
+        (RecipeStepTypeEnum.extract_css_attributes, 'a.result\nhref', ['https://haim.it', 'None'],
+         ('css', 'a.result', 'href')),
+        (RecipeStepTypeEnum.extract_xpath_attributes, '//a\n href ', ['https://haim.it', 'None'],
+         ('xpath', '//a', 'href')),
+        (RecipeStepTypeEnum.extract_css_table, 'table', ['["a", "b"]', '["c", "d"]'], None),
+        (RecipeStepTypeEnum.extract_css_table, 'div', [], None)
+    ])
+    def test_run(self, new_configuration, new_emulator, new_run, new_user, step_type, step_value, expected, extracted):
+        selenium = FakeSelenium()
+        new_emulator._Emulator__selenium = selenium
+        recipe = make_recipe(new_user)
+        step = make_recipe_step(recipe)
+        step.type = step_type
+        step.value = step_value
+        assert new_emulator.run(new_configuration, new_run, step, make_recipe_step(recipe)) is RunStatusEnum.success
+        assert [value for (data_step, value) in new_run.data_buffer or []] == expected
+        assert selenium.scripts == 1
+        if extracted is not None:
+            assert selenium.extracted == extracted
+
+    def test_run_invalid(self, new_configuration, new_emulator, new_run, new_user):
+        new_emulator._Emulator__selenium = FakeSelenium(fail=True)
+        recipe = make_recipe(new_user)
+        step = make_recipe_step(recipe)
+        step.type = RecipeStepTypeEnum.extract_css_texts
+        step.value = '#invalid['
+        assert new_emulator.run(new_configuration, new_run, step, make_recipe_step(recipe)) is \
+            RunStatusEnum.config_error
+        step.type = RecipeStepTypeEnum.extract_css_attributes
+        step.value = 'a'
+        assert new_emulator.run(new_configuration, new_run, step, make_recipe_step(recipe)) is \
+            RunStatusEnum.config_error
+
+
+class FakeCommandExecutor(object):
+    def __init__(self):
+        self._commands = {}
+
+
+class FakeScreenshotSelenium(object):
+    def __init__(self, name, fail=False):
+        import io
+        self.io = io
+        self.name = name
+        self.fail = fail
+        self.command_executor = FakeCommandExecutor()
+        self.executed = []
+        self.offset = 0
+
+    def execute(self, command, params):
+        import base64
+        from selenium.common.exceptions import WebDriverException
+        self.executed.append((command, params.get('cmd')))
+        if self.fail:
+            raise WebDriverException('unknown command')
+        if params.get('cmd') == 'Page.getLayoutMetrics':
+            return {'value': {'contentSize': {'width': 100, 'height': 250}}}
+        data = base64.b64encode(b'native').decode('ascii')
+        return {'value': data if command == 'mozFullPageScreenshot' else {'data': data}}
+
+    def execute_script(self, script, *args):
+        if script.startswith('return ['):
+            return [100, 250, 100, 0]
+        # the page is 250 pixels tall with a viewport of 100 pixels, so it can be scrolled by 150 at most
+        self.offset = min(args[0], 150)
+        return self.offset
+
+    def get_screenshot_as_png(self):
+        from PIL import Image
+        # a HiDPI screen with two device pixels per CSS pixel, where each tile is shaded by its scroll offset
+        tile = Image.new('RGB', (200, 200), (self.offset, 0, 0))
+        output = self.io.BytesIO()
+        tile.save(output, format='PNG')
+        return output.getvalue()
+
+
+class TestEmulatorFullPageScreenshot(object):
+    @pytest.mark.parametrize('name, commands', [
+        ('firefox', [('mozFullPageScreenshot', None)]),
+        ('chrome', [('executeCdpCommand', 'Page.getLayoutMetrics'), ('executeCdpCommand', 'Page.captureScreenshot')])
+    ])
+    def test_capture_native(self, new_run, name, commands):
+        selenium = FakeScreenshotSelenium(name)
+        assert ScreenshotHandler().capture_full_page(selenium, new_run) == (b'native', 'native full page')
+        assert selenium.executed == commands
+
+    @pytest.mark.parametrize('name, fail', [('firefox', True), ('safari', False)])
+    def test_capture_tiled(self, new_run, name, fail):
+        image = pytest.importorskip('PIL.Image')
+        import io
+        png, method = ScreenshotHandler().capture_full_page(FakeScreenshotSelenium(name, fail), new_run)
+        assert method == 'tiled'
+        stitched = image.open(io.BytesIO(png))
+        assert stitched.size == (200, 500)
+        assert [stitched.getpixel((0, y))[0] for y in [0, 199, 200, 399, 400, 499]] == [0, 0, 100, 100, 150, 150]
@@ -0,0 +1,79 @@
+import csv
+import gzip
+import io
+import pytest
+from scrapebot.database import *
+from scrapebot.emulate import RecipeStepTypeEnum
+from scrapebot.export import EXPORT_FIELDS, get_export_rows, iterate_csv, write_csv
+from scrapebot.test.test_database import db_session, owner
+
+
+@pytest.fixture
+def new_rows():
+    return make_rows(500)
+
+
+def make_rows(count):
+    return [{
+        'run': '2019-01-01 00:00:00',
+        'instance': 'test instance',
+        'recipe': '1',
+        'recipe_name': 'test recipe',
+        'recipe_status': 'success',
+        'step': 1,
+        'step_name': 'get_text',
+        'data_creation': '2019-01-01 00:00:01',
+        'data_value': 'value ' + str(i) + ', with "quotes"'
+    } for i in range(0, count)]
+
+
+def read_csv(content):
+    return list(csv.DictReader(io.StringIO(content.decode('utf-8'))))
+
+
+class TestExport(object):
+    def test_iterate_csv(self, new_rows):
+        pieces = list(iterate_csv(iter(new_rows), buffer_size=1024))
+        assert len(pieces) > 1
+        assert max([len(piece) for piece in pieces]) < 2048
+        rows = read_csv(b''.join(pieces))
+        assert len(rows) == len(new_rows)
+        assert list(rows[0].keys()) == EXPORT_FIELDS
+        assert rows[-1]['data_value'] == new_rows[-1]['data_value']
+
+    def test_iterate_csv_compressed(self, new_rows):
+        content = b''.join(iterate_csv(iter(new_rows), compress=True, buffer_size=1024))
+        assert content[:2] == b'\x1f\x8b'
+        assert gzip.decompress(content) == b''.join(iterate_csv(iter(new_rows)))
+
+    def test_iterate_csv_empty(self):
+        assert read_csv(b''.join(iterate_csv(iter([])))) == []
+
+    def test_write_csv(self, new_rows):
+        file = io.BytesIO()
+        assert write_csv(new_rows, file) == file.tell()
+        assert len(read_csv(file.getvalue())) == len(new_rows)
+
+    @pytest.mark.parametrize('blob_threshold', [0, 1])
+    def test_get_export_rows(self, blob_threshold, db_session, owner):
+        stranger = User(email='stranger@haim.it', password='Ak&f(8-fL:')
+        instance = Instance(name='export_instance', owner=owner)
+        recipe = Recipe(name='export_recipe', owner=owner)
+        step = RecipeStep(sort=1, type=RecipeStepTypeEnum.data, value='x', recipe=recipe)
+        run = Run(instance=instance, recipe=recipe, status=RunStatusEnum.success)
+        db_session.add_all([stranger, run])
+        for i in range(0, 10):
+            run.add_data(step, i)
+        run.store_buffer(db_session, blob_threshold=blob_threshold)
+        db_session.commit()
+        rows = list(get_export_rows(db_session, owner, [instance.uid], [recipe.uid], chunk_size=3))
+        assert len(rows) == 10
+        assert rows[0]['recipe_name'] == 'export_recipe'
+        assert rows[0]['step_name'] == 'data'
+        assert sorted([int(row['data_value']) for row in rows]) == list(range(0, 10))
+        assert list(get_export_rows(db_session, stranger, [instance.uid], [recipe.uid])) == []
+        reports = []
+        rows = list(get_export_rows(db_session, owner, [instance.uid], [recipe.uid], progress=reports.append,
+                                    heartbeat=0))
+        # long instance-recipe pairs keep reporting (i.e., the job stays alive) rather than only once they are done
+        assert reports == [0.0] * 10 + [1.0]
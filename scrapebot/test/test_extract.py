@@ -0,0 +1,84 @@
+import json
+import pytest
+from scrapebot.database import *
+from scrapebot.emulate import RecipeStepTypeEnum
+from scrapebot.extract import split_extraction_value, process_snapshots
+
+lxml = pytest.importorskip('lxml')
+pytest.importorskip('cssselect')
+from scrapebot.extract import parse_html, extract
+
+
+SNAPSHOT = '<?xml version="1.0" encoding="UTF-8"?><html xmlns="http://www.w3.org/1999/xhtml"><head>' \
+           '<title>Test</title></head><body>' \
+           '<div id="rso"><a class="result" href="https://haim.it">First  result</a>' \
+           '<a class="result">Second <b>result</b></a></div>' \
+           '<table id="table"><tr><th>Name</th><th>Value</th></tr><tr><td>a</td><td>1</td></tr></table>' \
+           '</body></html>'
+
+
+@pytest.fixture
+def new_document():
+    return parse_html(SNAPSHOT)
+
+
+class TestExtract(object):
+    def test_split_extraction_value(self):
+        assert split_extraction_value('a.result\nhref') == ('a.result', 'href')
+        assert split_extraction_value(' a.result ') == ('a.result', None)
+        assert split_extraction_value(None) == ('', None)
+
+    @pytest.mark.parametrize('step_type, value, expected', [
+        ('extract_css_texts', 'a.result', ['First result', 'Second result']),
+        ('extract_css_attributes', 'a.result\nhref', ['https://haim.it', 'None']),
+        ('extract_xpath_texts', '//a[@class="result"]', ['First result', 'Second result']),
+        ('extract_xpath_attributes', '//a\nclass', ['result', 'result']),
+        ('extract_xpath_texts', '//a/@href', ['https://haim.it']),
+        ('extract_css_table', '#table', [json.dumps(['Name', 'Value']), json.dumps(['a', '1'])]),
+        ('extract_css_table', '#missing', [])
+    ])
+    def test_extract(self, new_document, step_type, value, expected):
+        assert extract(new_document, step_type, value) == expected
+
+    def test_extract_invalid(self, new_document):
+        with pytest.raises(ValueError):
+            extract(new_document, 'extract_css_attributes', 'a.result')
+        with pytest.raises(ValueError):
+            extract(new_document, 'get_texts', 'a.result')
+
+    def test_process_snapshots(self):
+        rules = [(1, 'extract_css_texts', 'a.result'), (2, 'extract_css_attributes', 'a\nhref')]
+        rows, failed = process_snapshots([(10, None, SNAPSHOT), (11, None, ''), (12, None, 42)], rules)
+        assert [(row['run_uid'], row['step_uid'], row['value']) for row in rows] == [
+            (10, 1, 'First result'), (10, 1, 'Second result'), (10, 2, 'https://haim.it'), (10, 2, 'None')
+        ]
+        assert failed == [12]
+
+    def test_reprocess(self, tmpdir):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker, scoped_session
+        from reprocess import get_rules, get_source_uids, reprocess
+        engine = create_engine('sqlite:///' + str(tmpdir.join('reprocess.db')))
+        base.metadata.create_all(engine)
+        db = scoped_session(sessionmaker(bind=engine))
+        user = User(email='mario@haim.it', password='Ak&f(8-fL:')
+        recipe = Recipe(name='recipe', owner=user)
+        instance = Instance(name='instance', owner=user)
+        source = RecipeStep(sort=1, type=RecipeStepTypeEnum.get_htmlsource, recipe=recipe)
+        target = RecipeStep(sort=2, type=RecipeStepTypeEnum.extract_css_texts, value='a.result', recipe=recipe)
+        runs = [Run(instance=instance, recipe=recipe, status=RunStatusEnum.success) for _ in range(0, 5)]
+        db.add_all(runs)
+        for run in runs:
+            run.add_data(source, SNAPSHOT)
+            run.store_buffer(db, blob_threshold=100)
+        db.commit()
+        rules = get_rules([target], [target.uid])
+        assert get_source_uids(db, recipe.uid) == [source.uid]
+        inserted, failed = reprocess(engine, db, [source.uid], rules, set([runs[0].uid]), 2, 2)
+        assert (inserted, failed) == (8, [])
+        assert db.query(Blob).count() == 1
+        assert db.query(Data).filter(Data.step_uid == target.uid, Data.run_uid == runs[0].uid).count() == 0
+        assert db.query(Data).filter(Data.step_uid == target.uid, Data.run_uid == runs[1].uid).count() == 2
+        with pytest.raises(ValueError):
+            get_rules([source], [source.uid])
+        db.remove()
@@ -0,0 +1,190 @@
+import json
+import time
+import pytest
+from scrapebot.test.test_database import *
+from scrapebot.test.test_configuration import *
+from scrapebot.emulate import RecipeStepTypeEnum
+from scrapebot.database import RecipeEngineEnum, RunStatusEnum
+from scrapebot.http_emulate import HttpEmulator, connection_pool, store_cookies, get_cookie_header, load_cookies
+
+pytest.importorskip('lxml')
+pytest.importorskip('cssselect')
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+
+PAGE = '<html><head><title>Test  page</title></head><body>' \
+       '<div id="rso" class="results list"><a class="result" href="/first">First  result</a>' \
+       '<a class="result" href="https://haim.it/second">Second <b>result</b></a></div>' \
+       '<input name="q" value="query"><table><tr><td>a</td><td>1</td></tr></table>' \
+       '</body></html>'
+
+
+class FakePoolManager(object):
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.requests.append((url, headers))
+        status, response_headers, body = self.pages[url]
+        return HTTPResponse(body=body.encode('utf-8'), headers=response_headers, status=status)
+
+
+@pytest.fixture
+def fake_pool():
+    redirect_headers = HTTPHeaderDict()
+    redirect_headers.add('Location', '/page')
+    redirect_headers.add('Set-Cookie', 'session=abc; Path=/')
+    redirect_headers.add('Set-Cookie', 'tracking=1; Max-Age=3600')
+    pool = FakePoolManager({
+        'https://haim.it/': (302, redirect_headers, ''),
+        'https://haim.it/page': (200, {'Content-Type': 'text/html; charset=utf-8'}, PAGE)
+    })
+    connection_pool._ConnectionPool__manager = pool
+    yield pool
+    connection_pool._ConnectionPool__manager = None
+
+
+def run_steps(config, run, steps):
+    emulator = HttpEmulator()
+    prior_step = None
+    for step_type, value in steps:
+        step = make_recipe_step(run.recipe)
+        step.type = step_type
+        step.value = value
+        status = emulator.run(config, run, step, prior_step)
+        if status is not RunStatusEnum.success:
+            return emulator, status
+        if step.temp_result is None and prior_step is not None and prior_step.temp_result is not None:
+            step.temp_result = prior_step.temp_result
+        prior_step = step
+    return emulator, RunStatusEnum.success
+
+
+class TestHttpEmulator(object):
+    @pytest.mark.parametrize('steps, expected', [
+        ([(RecipeStepTypeEnum.get_pagetitle, None)], ['Test page']),
+        ([(RecipeStepTypeEnum.find_by_css, 'a.result'), (RecipeStepTypeEnum.get_texts, None)],
+         ['2', 'First result', 'Second result']),
+        ([(RecipeStepTypeEnum.find_by_class, 'results'), (RecipeStepTypeEnum.get_element_count, None)], ['1', '1']),
+        ([(RecipeStepTypeEnum.find_by_tag, 'A'), (RecipeStepTypeEnum.get_attributes, 'href')],
+         ['2', 'https://haim.it/first', 'https://haim.it/second']),
+        ([(RecipeStepTypeEnum.find_by_link, 'Second result'), (RecipeStepTypeEnum.get_text, None)],
+         ['1', 'Second result']),
+        ([(RecipeStepTypeEnum.find_by_link_partial, 'result'), (RecipeStepTypeEnum.get_element_count, None)],
+         ['2', '2']),
+        ([(RecipeStepTypeEnum.find_by_name, 'q'), (RecipeStepTypeEnum.get_value, None)], ['1', 'query']),
+        ([(RecipeStepTypeEnum.find_by_id, 'missing'), (RecipeStepTypeEnum.get_text, None)], ['0']),
+        ([(RecipeStepTypeEnum.find_by_xpath, '//a/@href'), (RecipeStepTypeEnum.get_texts, None)],
+         ['2', 'https://haim.it/first', 'https://haim.it/second']),
+        ([(RecipeStepTypeEnum.extract_css_attributes, 'a\nhref')], ['https://haim.it/first', 'https://haim.it/second']),
+        ([(RecipeStepTypeEnum.extract_css_table, 'table')], [json.dumps(['a', '1'])])
+    ])
+    def test_run(self, new_configuration, new_run, fake_pool, steps, expected):
+        steps = [(RecipeStepTypeEnum.navigate, 'https://haim.it/')] + steps
+        emulator, status = run_steps(new_configuration, new_run, steps)
+        assert status is RunStatusEnum.success
+        assert [value for (data_step, value) in new_run.data_buffer or []] == expected
+        assert [url for (url, headers) in fake_pool.requests] == ['https://haim.it/', 'https://haim.it/page']
+        assert fake_pool.requests[1][1]['Cookie'] == 'session=abc; tracking=1'
+
+    def test_run_htmlsource(self, new_configuration, new_run, fake_pool):
+        emulator, status = run_steps(new_configuration, new_run, [(RecipeStepTypeEnum.navigate, 'https://haim.it/'),
+                                                                  (RecipeStepTypeEnum.get_htmlsource, None)])
+        assert status is RunStatusEnum.success
+        assert new_run.data_buffer[0][1] == PAGE
+        assert [(label, calls, data_count) for step, label, duration, calls, data_count in new_run.timing_buffer] == \
+            [('navigate', 2, 0), ('get_htmlsource', 0, 1)]
+
+    def test_run_hidden_text(self, new_configuration, new_run, fake_pool):
+        fake_pool.pages['https://haim.it/script'] = (200, {}, '<html><body><div id="content">Visible<script>var a = 1;'
+                                                              '</script><style>div { color: red; }</style> text</div>'
+                                                              '</body></html>')
+        steps = [(RecipeStepTypeEnum.navigate, 'https://haim.it/script'), (RecipeStepTypeEnum.find_by_id, 'content'),
+                 (RecipeStepTypeEnum.get_text, None), (RecipeStepTypeEnum.extract_css_texts, 'div')]
+        emulator, status = run_steps(new_configuration, new_run, steps)
+        assert status is RunStatusEnum.success
+        assert [value for (data_step, value) in new_run.data_buffer] == ['1', 'Visible text', 'Visible text']
+
+    def test_run_timeout(self, new_configuration, new_run, fake_pool):
+        new_configuration.add_value('Instance', 'Timeout', '2')
+        emulator = HttpEmulator()
+        steps = []
+        for step_type, value in [(RecipeStepTypeEnum.navigate, 'https://haim.it/'),
+                                 (RecipeStepTypeEnum.get_pagetitle, None)]:
+            step = make_recipe_step(new_run.recipe)
+            step.type = step_type
+            step.value = value
+            steps.append(step)
+        # the first step starts right away, every further one waits for the instance's Timeout like in the browser
+        assert list(emulator.iterate(new_configuration, new_run, steps[0])) == []
+        waits = list(emulator.iterate(new_configuration, new_run, steps[1], steps[0]))
+        assert len(waits) == 1 and 1.5 <= waits[0] <= 2.5
+        assert [label for step, label, duration, calls, data_count in new_run.timing_buffer] == \
+            ['navigate', 'wait', 'get_pagetitle']
+
+    @pytest.mark.parametrize('steps', [
+        [(RecipeStepTypeEnum.navigate, 'https://haim.it/'), (RecipeStepTypeEnum.click, None)],
+        [(RecipeStepTypeEnum.navigate, 'https://haim.it/'), (RecipeStepTypeEnum.extract_css_attributes, 'a')],
+        [(RecipeStepTypeEnum.get_pagetitle, None)]
+    ])
+    def test_run_invalid(self, new_configuration, new_run, fake_pool, steps):
+        emulator, status = run_steps(new_configuration, new_run, steps)
+        assert status is RunStatusEnum.config_error
+
+    def test_cookies(self, new_configuration, new_user, fake_pool):
+        recipe = make_recipe(new_user)
+        recipe.cookies = True
+        instance = make_instance(new_user)
+        order = make_recipe_order(instance, recipe)
+        order.cookies_from_last_run = json.dumps([{'name': 'consent', 'value': 'yes', 'domain': '.haim.it',
+                                                   'path': '/', 'secure': True}])
+        run = make_run(recipe, instance)
+        emulator, status = run_steps(new_configuration, run, [(RecipeStepTypeEnum.navigate, 'https://haim.it/')])
+        assert status is RunStatusEnum.success
+        assert fake_pool.requests[0][1]['Cookie'] == 'consent=yes'
+        emulator.close_session(run)
+        assert [cookie['name'] for cookie in json.loads(order.cookies_from_last_run)] == \
+            ['consent', 'session', 'tracking']
+
+    def test_cookie_matching(self):
+        cookies = load_cookies('{}')
+        assert cookies == []
+        store_cookies(cookies, 'http://www.haim.it/a/b', ['a=1; Domain=haim.it', 'b=2', 'c=3; Secure; Path=/',
+                                                          'd=4; Expires=Thu, 01 Jan 1970 00:00:00 GMT'])
+        assert get_cookie_header(cookies, 'http://haim.it/a/') == 'a=1'
+        assert get_cookie_header(cookies, 'http://www.haim.it/a/c') == 'a=1; b=2'
+        assert get_cookie_header(cookies, 'http://www.haim.it/ab') == ''
+        assert get_cookie_header(cookies, 'https://www.haim.it/') == 'c=3'
+        store_cookies(cookies, 'http://www.haim.it/a/', ['a=2; Domain=haim.it', 'b=; Max-Age=0'])
+        assert get_cookie_header(cookies, 'https://www.haim.it/a/c') == 'c=3; a=2'
+        assert load_cookies(json.dumps([{'name': 'old', 'value': '1', 'expiry': time.time() - 1}])) == []
+
+
+class TestRecipeEngine(object):
+    @pytest.mark.parametrize('engine, step_types, expected', [
+        (None, [RecipeStepTypeEnum.navigate], RecipeEngineEnum.browser),
+        (RecipeEngineEnum.http, [RecipeStepTypeEnum.click], RecipeEngineEnum.http),
+        (RecipeEngineEnum.auto, [RecipeStepTypeEnum.navigate, RecipeStepTypeEnum.get_texts], RecipeEngineEnum.http),
+        (RecipeEngineEnum.auto, [RecipeStepTypeEnum.navigate, RecipeStepTypeEnum.screenshot],
+         RecipeEngineEnum.browser)
+    ])
+    def test_get_engine(self, new_user, engine, step_types, expected):
+        recipe = make_recipe(new_user)
+        recipe.engine = engine
+        for step_type in step_types:
+            step = make_recipe_step(recipe)
+            step.type = step_type
+            step.active = True
+        assert recipe.get_engine() is expected
+
+    def test_process(self, new_configuration, new_run, fake_pool):
+        new_run.recipe.engine = RecipeEngineEnum.auto
+        step = make_recipe_step(new_run.recipe)
+        step.type = RecipeStepTypeEnum.navigate
+        step.value = 'https://haim.it/'
+        step.active = True
+        assert new_run.process(new_configuration, step) is RunStatusEnum.success
+        assert isinstance(new_run._Run__emulator, HttpEmulator)
+        new_run.end_session()
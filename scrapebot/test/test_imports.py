@@ -0,0 +1,31 @@
+import os
+import sys
+import json
+import subprocess
+from benchmark_imports import measure, BROWSER_MODULES, WEB_MODULES
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def get_loaded_modules(code):
+    # a fresh interpreter, as this one has long imported everything
+    output = subprocess.check_output([sys.executable, '-c', code + '\nimport sys, json\n' +
+                                      'print(json.dumps(sorted(set([m.split(".")[0] for m in sys.modules]))))'],
+                                     cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT))
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class TestImports(object):
+    def test_model_layer(self):
+        modules = get_loaded_modules('import scrapebot.database, scrapebot.steptypes, scrapebot.steps')
+        assert 'sqlalchemy' in modules
+        assert [module for module in BROWSER_MODULES + WEB_MODULES + ['urllib3', 'lxml'] if module in modules] == []
+
+    def test_emulate(self):
+        assert 'selenium' in get_loaded_modules('import scrapebot.emulate')
+
+    def test_runner_startup(self):
+        seconds, modules = measure(os.path.join(ROOT, 'scrapebot.py'), 1)
+        assert seconds > 0
+        assert [module for module in BROWSER_MODULES + WEB_MODULES if module in modules] == []
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import event
+from scrapebot.database import User, Instance, Recipe, UserInstancePrivilege, UserRecipePrivilege
+from scrapebot.permissions import Permissions, PermissionService, permission_service
+from scrapebot.test.test_database import db_session, owner
+
+
+@pytest.fixture
+def privileged_session(db_session, owner):
+    guest = User(email='guest@haim.it', password='Ak&f(8-fL:')
+    recipes = [Recipe(name='permission_recipe_' + str(i), owner=owner) for i in range(0, 3)]
+    instances = [Instance(name='permission_instance_' + str(i), owner=owner) for i in range(0, 3)]
+    db_session.add_all(recipes + instances + [
+        guest,
+        UserRecipePrivilege(user=guest, recipe=recipes[0], allowed_to_edit=True),
+        UserRecipePrivilege(user=guest, recipe=recipes[1], allowed_to_edit=False),
+        UserInstancePrivilege(user=guest, instance=instances[2], allowed_to_edit=False)
+    ])
+    db_session.commit()
+    statements = []
+    event.listen(db_session.get_bind(), 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return db_session, owner, guest, recipes, instances, statements
+
+
+class TestPermissions(object):
+    def test_load(self, privileged_session):
+        session, owner, guest, recipes, instances, statements = privileged_session
+        permissions = Permissions.load(session, guest)
+        assert len([statement for statement in statements if 'user2' in statement]) == 2
+        assert permissions.visible_recipes == {recipes[0].uid, recipes[1].uid}
+        assert permissions.editable_recipes == {recipes[0].uid}
+        assert permissions.visible_instances == {instances[2].uid}
+        assert permissions.editable_instances == set()
+        permissions = Permissions.load(session, owner)
+        assert permissions.editable_recipes == set([recipe.uid for recipe in recipes])
+        assert permissions.editable_instances == set([instance.uid for instance in instances])
+
+    def test_model_methods(self, privileged_session):
+        session, owner, guest, recipes, instances, statements = privileged_session
+        session.expire_all()
+        guest.permissions = None
+        assert [recipe.is_visible_to_user(guest) for recipe in recipes] == [True, True, False]
+        assert [recipe.is_editable_by_user(guest) for recipe in recipes] == [True, False, False]
+        assert [instance.is_visible_to_user(guest) for instance in instances] == [False, False, True]
+        assert [instance.is_editable_by_user(guest) for instance in instances] == [False, False, False]
+        # beyond reloading the expired objects, only the two permission queries are issued (rather than one per
+        # recipe and instance for its privileged users)
+        privilege_queries = [statement for statement in statements if 'user2' in statement]
+        assert len(privilege_queries) == 2
+        assert instances[0].is_visible_to_user(owner)
+
+    def test_fallback(self):
+        owner = User(email='mario@haim.it', password='Ak&f(8-fL:')
+        owner.uid = 1000
+        guest = User(email='guest@haim.it', password='Ak&f(8-fL:')
+        guest.uid = 1001
+        recipe = Recipe(name='detached_recipe', owner=owner)
+        recipe.owner_uid = owner.uid
+        recipe.privileged_users.append(UserRecipePrivilege(user=guest, user_uid=guest.uid, allowed_to_edit=False))
+        assert permission_service.get(None, guest) is None
+        assert recipe.is_visible_to_user(guest) and not recipe.is_editable_by_user(guest)
+        assert recipe.is_editable_by_user(owner)
+
+    def test_ttl(self, privileged_session):
+        session, owner, guest, recipes, instances, statements = privileged_session
+        service = PermissionService(ttl=60)
+        guest.permissions = None
+        permissions = service.get(session, guest)
+        guest.permissions = None
+        assert service.get(session, guest) is permissions
+        assert len([statement for statement in statements if 'user2' in statement]) == 2
+        service.invalidate(guest)
+        assert guest.permissions is None
+        assert service.get(session, guest) is not permissions
+        assert len([statement for statement in statements if 'user2' in statement]) == 4
+        assert guest.permission_version == 1
+
+    def test_version(self, privileged_session):
+        session, owner, guest, recipes, instances, statements = privileged_session
+        # two workers with caches of their own, where privileges are changed through the first one
+        first, second = PermissionService(ttl=60), PermissionService(ttl=60)
+        guest.permissions = None
+        assert recipes[2].uid not in second.get(session, guest).visible_recipes
+        session.add(UserRecipePrivilege(user=guest, recipe=recipes[2], allowed_to_edit=False))
+        first.invalidate(guest)
+        session.commit()
+        guest = session.query(User).filter(User.uid == guest.uid).one()
+        guest.permissions = None
+        assert recipes[2].uid in second.get(session, guest).visible_recipes
+
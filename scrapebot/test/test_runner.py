@@ -0,0 +1,57 @@
+import time
+import threading
+import pytest
+from scrapebot.runner import AsyncRunner
+from scrapebot.steps import wait_through
+
+
+def waiting_run(delays, result, threads=None):
+    for delay in delays:
+        if threads is not None:
+            threads.add(threading.current_thread().name)
+        yield delay
+    return result
+
+
+def failing_run():
+    yield 0
+    raise RuntimeError('failed')
+
+
+@pytest.fixture
+def new_runner():
+    runner = AsyncRunner(10, 2)
+    yield runner
+    runner.shutdown()
+
+
+class TestAsyncRunner(object):
+    def test_submit(self, new_runner):
+        futures = [new_runner.submit(waiting_run, [0, 0.01], i) for i in range(0, 5)]
+        assert [future.result(timeout=5) for future in futures] == list(range(0, 5))
+
+    def test_interleave(self, new_runner):
+        threads = set()
+        start = time.perf_counter()
+        futures = [new_runner.submit(waiting_run, [0.2, 0.2], i, threads) for i in range(0, 10)]
+        for future in futures:
+            future.result(timeout=5)
+        # ten runs waiting 0.4 seconds each would take 4 seconds one after another (or 2 seconds on two threads)
+        assert time.perf_counter() - start < 1.5
+        assert len(threads) <= 2
+
+    def test_limit(self):
+        with AsyncRunner(1, 2) as runner:
+            start = time.perf_counter()
+            futures = [runner.submit(waiting_run, [0.2], i) for i in range(0, 3)]
+        assert all([future.done() for future in futures])
+        assert time.perf_counter() - start >= 0.6
+
+    def test_exception(self, new_runner):
+        with pytest.raises(RuntimeError):
+            new_runner.submit(failing_run).result(timeout=5)
+
+    def test_wait_through(self):
+        slept = []
+        assert wait_through(waiting_run([1, 2.5], 'done'), slept.append) == 'done'
+        assert slept == [1, 2.5]
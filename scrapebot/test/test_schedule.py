@@ -0,0 +1,69 @@
+import pytest
+from datetime import datetime, timedelta
+from scrapebot.schedule import Schedule, RecipeLock
+
+
+@pytest.fixture
+def new_schedule():
+    return make_schedule()
+
+
+def make_schedule():
+    return Schedule()
+
+
+class TestSchedule(object):
+    def test_get_next_due(self):
+        now = datetime.now()
+        assert Schedule.get_next_due(None, 15, now) == now
+        assert Schedule.get_next_due(now, 15, now) == now + timedelta(minutes=15)
+
+    def test_pop_due(self, new_schedule):
+        now = datetime.now()
+        new_schedule.update(1, now - timedelta(minutes=1))
+        new_schedule.update(2, now + timedelta(minutes=1))
+        assert new_schedule.pop_due(now) == [1]
+        assert new_schedule.is_running(1)
+        assert new_schedule.pop_due(now) == []
+
+    def test_finish(self, new_schedule):
+        now = datetime.now()
+        new_schedule.update(1, now)
+        new_schedule.pop_due(now)
+        new_schedule.finish(1, now + timedelta(minutes=2))
+        assert new_schedule.is_running(1) is False
+        assert new_schedule.pop_due(now) == []
+        new_schedule.update(1, now)
+        assert new_schedule.pop_due(now) == []
+        assert new_schedule.pop_due(now + timedelta(minutes=2)) == [1]
+        new_schedule.finish(1)
+        assert len(new_schedule) == 0
+
+    def test_retain(self, new_schedule):
+        now = datetime.now()
+        new_schedule.update(1, now)
+        new_schedule.update(2, now)
+        new_schedule.pop_due(now)
+        new_schedule.retain([])
+        assert len(new_schedule) == 2
+        new_schedule.finish(1, now)
+        new_schedule.finish(2, now)
+        new_schedule.retain([2])
+        assert len(new_schedule) == 1
+
+    def test_seconds_until_next(self, new_schedule):
+        now = datetime.now()
+        assert new_schedule.get_seconds_until_next(now, 60) == 60
+        new_schedule.update(1, now + timedelta(seconds=10))
+        assert new_schedule.get_seconds_until_next(now, 60) == 10
+        new_schedule.update(2, now - timedelta(seconds=10))
+        assert new_schedule.get_seconds_until_next(now, 60) == 0
+
+
+class TestRecipeLock(object):
+    def test_acquire(self, tmpdir):
+        lock = RecipeLock('test instance', 42, str(tmpdir))
+        assert lock.acquire()
+        lock.release()
+        assert lock.acquire()
+        lock.release()
@@ -0,0 +1,104 @@
+import pytest
+import scrapebot.steps
+from scrapebot.test.test_database import *
+from scrapebot.test.test_configuration import *
+from scrapebot.emulate import RecipeStepTypeEnum, Emulator, step_registry
+from scrapebot.database import RunStatusEnum
+from scrapebot.steps import StepHandler, StepRegistry
+
+
+class RecordingHandler(StepHandler):
+    def __init__(self):
+        self.calls = []
+
+    def before(self, emulator, run, step, prior_step=None):
+        self.calls.append('before')
+
+    def handle(self, emulator, run, step, prior_step=None):
+        self.calls.append('handle')
+        run.add_data(step, 'recorded')
+        return RunStatusEnum.success
+
+    def after(self, emulator, run, step, prior_step, status, duration):
+        self.calls.append(('after', status, duration >= 0))
+
+
+class FakeEntryPoint(object):
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+
+    def load(self):
+        if isinstance(self.target, Exception):
+            raise self.target
+        return self.target
+
+
+def make_step(recipe, step_type, value=None):
+    step = make_recipe_step(recipe)
+    step.type = step_type
+    step.value = value
+    return step
+
+
+class TestStepRegistry(object):
+    def test_builtin_handlers(self):
+        for step_type in RecipeStepTypeEnum:
+            assert isinstance(step_registry.get(step_type), StepHandler)
+
+    def test_dispatch(self, new_run, new_user):
+        registry = StepRegistry()
+        handler = RecordingHandler()
+        registry.register(RecipeStepTypeEnum.log, handler)
+        listened = []
+        registry.add_listener(lambda step, status, duration: listened.append((step, status)))
+        step = make_step(make_recipe(new_user), RecipeStepTypeEnum.log)
+        assert registry.dispatch(None, new_run, step) is RunStatusEnum.success
+        assert handler.calls == ['before', 'handle', ('after', RunStatusEnum.success, True)]
+        assert listened == [(step, RunStatusEnum.success)]
+        assert new_run.data_buffer == [(step, 'recorded')]
+
+    def test_dispatch_unknown(self, new_run, new_user):
+        step = make_step(make_recipe(new_user), RecipeStepTypeEnum.log)
+        assert StepRegistry().dispatch(None, new_run, step) is RunStatusEnum.config_error
+
+    def test_dispatch_failing(self, new_run, new_user):
+        class FailingHandler(StepHandler):
+            def handle(self, emulator, run, step, prior_step=None):
+                raise RuntimeError('failed')
+        registry = StepRegistry()
+        registry.register(RecipeStepTypeEnum.log, FailingHandler)
+        listened = []
+        registry.add_listener(lambda step, status, duration: listened.append(status))
+        with pytest.raises(RuntimeError):
+            registry.dispatch(None, new_run, make_step(make_recipe(new_user), RecipeStepTypeEnum.log))
+        assert listened == [None]
+
+    def test_entry_points(self, monkeypatch):
+        handler = RecordingHandler()
+        monkeypatch.setattr(scrapebot.steps, 'iter_entry_points', lambda group: [
+            FakeEntryPoint('log', handler),
+            FakeEntryPoint('no_such_type', RecordingHandler),
+            FakeEntryPoint('data', ImportError('missing package'))
+        ])
+        registry = StepRegistry('scrapebot.test')
+        assert registry.get(RecipeStepTypeEnum.log) is handler
+        assert registry.get(RecipeStepTypeEnum.data) is None
+
+    def test_emulator_run(self, new_configuration, new_run, new_user):
+        recipe = make_recipe(new_user)
+        step = make_step(recipe, RecipeStepTypeEnum.data, 'some data')
+        assert Emulator().run(new_configuration, new_run, step, make_recipe_step(recipe)) is RunStatusEnum.success
+        assert new_run.data_buffer == [(step, 'some data')]
+        assert [timing[0:2] + timing[3:] for timing in new_run.timing_buffer] == [(step, 'data', 0, 1)]
+
+    def test_emulator_iterate(self, new_configuration, new_run, new_user):
+        recipe = make_recipe(new_user)
+        step = make_step(recipe, RecipeStepTypeEnum.pause, 8)
+        steps = Emulator().iterate(new_configuration, new_run, step, make_recipe_step(recipe))
+        delay = next(steps)
+        assert 6 <= delay <= 10
+        with pytest.raises(StopIteration) as stop:
+            next(steps)
+        assert stop.value.value is RunStatusEnum.success
+        assert new_run.log_buffer[-1][0] == 'Paused for ' + str(round(delay, 1)) + ' seconds'
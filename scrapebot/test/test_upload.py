@@ -0,0 +1,119 @@
+import io
+import pytest
+import scrapebot.upload
+from scrapebot.test.test_database import *
+from scrapebot.configuration import Configuration
+from scrapebot.upload import ScreenshotUploader, get_png_size, recompress
+
+
+PNG = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x02\x00\x00\x00\x03\x08\x02\x00\x00\x006\x88I\xd6' \
+      b'\x00\x00\x00\x13IDATx\x9cc\xfc\xcf\xc0\xc0\xc0\xc0\xc0\xc4\x80L\x01\x00\x14@\x01\x05\xdd#y\x0e\x00\x00\x00' \
+      b'\x00IEND\xaeB`\x82'
+
+
+@pytest.fixture
+def new_uploader():
+    uploader = ScreenshotUploader()
+    yield uploader
+    uploader.close()
+
+
+def make_upload_configuration(directory=None, bucket=None, **instance_values):
+    config = Configuration()
+    if directory is not None:
+        config.add_value('Instance', 'ScreenshotDirectory', directory)
+    if bucket is not None:
+        config.add_value('Database', 'AWSaccess', 'testing')
+        config.add_value('Database', 'AWSsecret', 'testing')
+        config.add_value('Database', 'AWSbucket', bucket)
+    for name, value in instance_values.items():
+        config.add_value('Instance', name, value)
+    return config
+
+
+class FailingClient(object):
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def put_object(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise IOError('S3 not reachable')
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.added = []
+
+    def add(self, instance):
+        self.added.append(instance)
+
+
+class TestScreenshotUploader(object):
+    def test_submit_local(self, new_uploader, new_run, new_recipe_step, tmpdir):
+        config = make_upload_configuration(str(tmpdir))
+        screenshot_log = new_uploader.submit(config, PNG, new_run, new_recipe_step)
+        assert screenshot_log.startswith(str(tmpdir) + '/') and screenshot_log.endswith('.png')
+        assert new_run.data_buffer == [(new_recipe_step, screenshot_log)]
+        assert new_uploader.join() == 0
+        assert open(screenshot_log, 'rb').read() == PNG
+
+    def test_submit_names(self, new_uploader, new_run, new_recipe_step, tmpdir):
+        config = make_upload_configuration(str(tmpdir))
+        screenshot_logs = [new_uploader.submit(config, PNG, new_run, new_recipe_step) for _ in range(0, 5)]
+        assert len(set(screenshot_logs)) == 5
+        assert all('_' + str(new_run.uid) + '_' + str(new_recipe_step.uid) + '_' in screenshot_log
+                   for screenshot_log in screenshot_logs)
+        assert new_uploader.join() == 0
+        assert len(tmpdir.listdir()) == 5
+
+    def test_submit_nowhere(self, new_uploader, new_run, new_recipe_step):
+        assert new_uploader.submit(make_upload_configuration(), PNG, new_run, new_recipe_step) == ''
+        assert new_run.data_buffer is None
+
+    def test_submit_s3(self, new_uploader, new_run, new_recipe_step, monkeypatch):
+        boto3 = pytest.importorskip('boto3')
+        moto = pytest.importorskip('moto')
+        monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+        with (getattr(moto, 'mock_aws', None) or getattr(moto, 'mock_s3'))():
+            boto3.client('s3').create_bucket(Bucket='screenshots')
+            config = make_upload_configuration(bucket='screenshots')
+            for _ in range(0, 3):
+                screenshot_log = new_uploader.submit(config, PNG, new_run, new_recipe_step)
+            assert screenshot_log.startswith('s3://screenshots/')
+            assert new_uploader.join() == 0
+            s3_object = boto3.client('s3').get_object(Bucket='screenshots', Key=screenshot_log.split('/')[-1])
+            assert s3_object['Body'].read() == PNG
+            assert s3_object['ContentType'] == 'image/png'
+            assert s3_object['Metadata']['step'] == str(new_recipe_step.uid)
+            assert len(new_run.data_buffer) == 3
+
+    @pytest.mark.parametrize('failures, retries, failed', [(1, 1, 0), (2, 1, 1)])
+    def test_retries(self, new_uploader, new_run, new_recipe_step, monkeypatch, failures, retries, failed):
+        monkeypatch.setattr(scrapebot.upload.time, 'sleep', lambda seconds: None)
+        client = FailingClient(failures)
+        new_uploader._ScreenshotUploader__client = client
+        config = make_upload_configuration(bucket='screenshots', ScreenshotRetries=retries)
+        screenshot_log = new_uploader.submit(config, PNG, new_run, new_recipe_step)
+        assert new_uploader.join() == failed
+        assert client.calls == retries + 1
+        session = FakeSession()
+        assert new_uploader.store_failures(session) == failed
+        assert [(log.run_uid, log.type, log.message.startswith('Screenshot ' + screenshot_log + ' could not be stored'))
+                for log in session.added] == [(new_run.uid, LogTypeEnum.error, True)] * failed
+        assert new_uploader.store_failures(session) == 0
+
+    @pytest.mark.parametrize('image_format, extension', [('webp', '.webp'), ('optimized', '.png')])
+    def test_recompress(self, new_uploader, new_run, new_recipe_step, tmpdir, image_format, extension):
+        image = pytest.importorskip('PIL.Image')
+        config = make_upload_configuration(str(tmpdir), ScreenshotFormat=image_format)
+        screenshot_log = new_uploader.submit(config, PNG, new_run, new_recipe_step)
+        assert screenshot_log.endswith(extension)
+        assert new_uploader.join() == 0
+        assert image.open(io.BytesIO(open(screenshot_log, 'rb').read())).size == (2, 3)
+
+    def test_get_png_size(self):
+        assert get_png_size(PNG) == (2, 3)
+        assert get_png_size(b'no png') == (0, 0)
+        assert recompress(PNG, 'png') == PNG
@@ -0,0 +1,258 @@
+import io
+import sys
+import time
+import uuid
+import struct
+import queue
+import atexit
+import datetime
+import threading
+import traceback
+
+
+# number of background threads writing and uploading screenshots
+UPLOAD_THREADS = 2
+# WebP cannot hold images beyond this width or height (which full-page screenshots may well exceed)
+WEBP_MAX_SIZE = 16383
+
+
+class ScreenshotUploader:
+    """
+    Persists screenshots (i.e., writes them to ScreenshotDirectory and/or uploads them to Amazon S3) in background
+    threads, so that a screenshot step only has to capture the image; pending screenshots are held in a bounded queue
+    which makes steps wait once uploads fall behind, and screenshots that could not be stored are kept until
+    store_failures logs them to their runs
+    """
+
+    def __init__(self):
+        self.__queue = None
+        self.__threads = []
+        self.__client = None
+        self.__config = None
+        self.__lock = threading.Lock()
+        self.__failed = 0
+        self.__failures = []
+
+    def submit(self, config, png, run, step):
+        """
+        Queues a screenshot for persistence and stores its future location(s) as data right away
+        :param config:
+        :param png: the captured screenshot
+        :param run:
+        :param step:
+        :return: description of where the screenshot is going to be stored (empty if nowhere)
+        """
+        self.__start(config)
+        image_format = self.get_format(config)
+        if image_format == 'webp' and max(get_png_size(png)) > WEBP_MAX_SIZE:
+            image_format = 'optimized'
+        screenshot_dir = config.get('Instance', 'ScreenshotDirectory')
+        if run.uid is None:
+            # the run needs its uid for the screenshot's name and for failures to be logged to it later on
+            from sqlalchemy.orm import object_session
+            session = object_session(run)
+            if session is not None:
+                session.flush()
+        # timestamps alone collide within the same second (e.g., on parallel runs), hence run, step, and a random part
+        screenshot_name = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + '_' + str(run.uid) + '_' + \
+            str(step.uid) + '_' + uuid.uuid4().hex[:8] + ('.webp' if image_format == 'webp' else '.png')
+        job = {
+            'png': png,
+            'format': image_format,
+            'file': None,
+            'bucket': None,
+            'key': screenshot_name,
+            'run_uid': run.uid,
+            'location': None,
+            'metadata': {
+                'Instance': str(run.instance.name),
+                'Run': str(run.uid),
+                'Step': str(step.uid)
+            }
+        }
+        screenshot_log = ''
+        if screenshot_dir is not None:
+            if not screenshot_dir.endswith('/'):
+                screenshot_dir = screenshot_dir + '/'
+            job['file'] = screenshot_dir + screenshot_name
+            screenshot_log = job['file']
+            run.add_data(step, job['file'])
+        if config.get('Database', 'AWSaccess') is not None and \
+           config.get('Database', 'AWSsecret') is not None and \
+           config.get('Database', 'AWSbucket') is not None:
+            job['bucket'] = config.get('Database', 'AWSbucket')
+            s3_name = 's3://' + job['bucket'] + '/' + screenshot_name
+            screenshot_log = s3_name if screenshot_log == '' else screenshot_log + ' and ' + s3_name
+            run.add_data(step, s3_name)
+        if job['file'] is not None or job['bucket'] is not None:
+            job['location'] = screenshot_log
+            self.__queue.put(job)
+        return screenshot_log
+
+    @staticmethod
+    def get_format(config):
+        """
+        Reads ScreenshotFormat, where optimized (PNG) and webp require Pillow and fall back to png otherwise
+        :param config:
+        :return: png, optimized, or webp
+        """
+        image_format = (config.get('Instance', 'ScreenshotFormat', fallback='png') or 'png').lower()
+        if image_format not in ['optimized', 'webp']:
+            return 'png'
+        try:
+            import PIL.Image
+            return image_format
+        except ImportError:
+            return 'png'
+
+    def join(self):
+        """
+        Waits until all queued screenshots have been persisted
+        :return: number of screenshots that could not be persisted so far
+        """
+        if self.__queue is not None:
+            self.__queue.join()
+        return self.__failed
+
+    def store_failures(self, session):
+        """
+        Adds an error log to every run whose screenshot(s) could not be stored since the last call, as the run itself
+        has usually been stored as successful by then (with data pointing to the missing screenshot); the caller commits
+        :param session:
+        :return: number of error logs added
+        """
+        from scrapebot.database import Log, LogTypeEnum
+        with self.__lock:
+            failures = self.__failures
+            self.__failures = []
+        for run_uid, location, error in failures:
+            session.add(Log(run_uid=run_uid, type=LogTypeEnum.error,
+                            message='Screenshot ' + location + ' could not be stored: ' + error))
+        return len(failures)
+
+    def close(self):
+        """
+        Persists all queued screenshots and stops the background threads
+        :return:
+        """
+        with self.__lock:
+            threads = self.__threads
+            self.__threads = []
+        if len(threads) == 0:
+            return
+        self.__queue.join()
+        for _ in threads:
+            self.__queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def __start(self, config):
+        with self.__lock:
+            if len(self.__threads) > 0:
+                return
+            self.__config = config
+            if self.__queue is None:
+                try:
+                    size = max(1, int(config.get('Instance', 'ScreenshotQueue', fallback=50)))
+                except ValueError:
+                    size = 50
+                self.__queue = queue.Queue(maxsize=size)
+            for i in range(0, UPLOAD_THREADS):
+                thread = threading.Thread(target=self.__work, name='screenshot-upload-' + str(i), daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def __get_retries(self):
+        try:
+            return max(0, int(self.__config.get('Instance', 'ScreenshotRetries', fallback=3)))
+        except ValueError:
+            return 3
+
+    def __get_client(self):
+        """
+        Creates the S3 client once and shares it among all threads (boto3 clients are thread-safe)
+        :return:
+        """
+        with self.__lock:
+            if self.__client is None:
+                import boto3
+                self.__client = boto3.client(
+                    's3',
+                    aws_access_key_id=self.__config.get('Database', 'AWSaccess'),
+                    aws_secret_access_key=self.__config.get('Database', 'AWSsecret')
+                )
+            return self.__client
+
+    def __work(self):
+        while True:
+            job = self.__queue.get()
+            try:
+                if job is None:
+                    return
+                self.__persist(job)
+            except:
+                error = str(sys.exc_info()[1])
+                with self.__lock:
+                    self.__failed = self.__failed + 1
+                    if job['run_uid'] is not None:
+                        self.__failures.append((job['run_uid'], job['location'], error))
+                print('Error: Screenshot ' + job['key'] + ' could not be stored')
+                print('- ' + traceback.format_exc())
+            finally:
+                self.__queue.task_done()
+
+    def __persist(self, job):
+        content = recompress(job['png'], job['format'])
+        if job['file'] is not None:
+            with open(job['file'], 'wb') as local_file:
+                local_file.write(content)
+        if job['bucket'] is not None:
+            retries = self.__get_retries()
+            for attempt in range(0, retries + 1):
+                try:
+                    self.__get_client().put_object(
+                        Bucket=job['bucket'],
+                        Key=job['key'],
+                        Body=content,
+                        ContentType='image/webp' if job['format'] == 'webp' else 'image/png',
+                        Metadata=job['metadata']
+                    )
+                    return
+                except Exception:
+                    if attempt == retries:
+                        raise
+                    time.sleep(2**attempt)
+
+
+def get_png_size(png):
+    """
+    Reads width and height from a PNG's header (without decoding the image)
+    :param png:
+    :return: tuple of width and height
+    """
+    if len(png) < 24 or bytes(png[12:16]) != b'IHDR':
+        return 0, 0
+    return struct.unpack('>II', bytes(png[16:24]))
+
+
+def recompress(png, image_format):
+    """
+    Re-encodes a PNG screenshot, which is done in the background as it may take a while for large pages
+    :param png:
+    :param image_format: png (i.e., leave as is), optimized (i.e., smaller PNG), or webp (lossless)
+    :return: bytes
+    """
+    if image_format not in ['optimized', 'webp']:
+        return bytes(png)
+    import PIL.Image
+    image = PIL.Image.open(io.BytesIO(png))
+    output = io.BytesIO()
+    if image_format == 'webp':
+        image.save(output, format='WEBP', lossless=True, method=4)
+    else:
+        image.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+screenshot_uploader = ScreenshotUploader()
+atexit.register(screenshot_uploader.close)
@@ -3,8 +3,8 @@ import os
 import getpass
 import sys
 import traceback
-from crontab import CronTab
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, Enum
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker, scoped_session
 from scrapebot.configuration import Configuration
 from scrapebot.database import base, User, Instance
@@ -21,6 +21,9 @@ def main():
     try:
         engine = get_engine(config)
         base.metadata.create_all(engine)
+        upgraded = upgrade_schema(engine)
+        if len(upgraded) > 0:
+            print('- upgraded existing tables by ' + ', '.join(upgraded))
         db = get_db(engine)
     except:
         print('- uh, there is a problem with connecting to your database ...')
@@ -72,6 +75,8 @@ def main():
         print('- to run it regularly and since you are using Linux, I recommend a cronjob')
         os_user = getpass.getuser()
         if read_bool_forcefully('- install cronjob for ' + os_user + ' now'):
+            # imported only here, as scrapebot.py and frontend.py import this module just for its database helpers
+            from crontab import CronTab
             cron = CronTab(user=os_user)
             cron.remove_all(comment='ScrapeBot // ' + instance_name)
             cronjob = cron.new(command='cd ' + os.getcwd() + ' && ' + sys.executable +
@@ -79,8 +84,10 @@ def main():
                                comment='ScrapeBot // ' + instance_name)
             cronjob.minute.every(2)
             cron.write()
+        print('- alternatively, keep "scrapebot.py --daemon" running (e.g., through supervisor) instead of the cronjob')
     else:
         print('- to run it regularly (which is what you want), you may want to use Windows Task Scheduler or the like')
+        print('- alternatively, keep "scrapebot.py --daemon" running in the background')
     print('---------')
     print('Thanks for using; please direct any questions and pull requests to https://github.com/marhai/scrapebot')
     db.close()
@@ -145,6 +152,8 @@ def setup_config():
     print('(4) Also, to simulate human surf behavior, this instance introduces random delays. ' +
           'Well, they are not completely random, though. You can set an approximate delay in seconds.')
     config.add_value('Instance', 'Timeout', read_numeric_forcefully('- Rough browser delay [in seconds]', 1))
+    config.add_value('Instance', 'Workers',
+                     read_numeric_forcefully('- How many recipes should this instance run in parallel', 1))
     print('(5) When taking screenshots, should these be stored locally or in an Amazon S3 bucket (i.e., the cloud)?')
     if read_bool_forcefully('- Do you want to upload them to an Amazon S3 bucket'):
         config.add_value('Database', 'AWSaccess', read_forcefully('- Enter your AWS Access Key'))
@@ -238,7 +247,7 @@ def check_minimal_config(config):
         return instance_name
 
 
-def get_engine(config):
+def get_engine(config, workers=1):
     database_timeout = -1
     try:
         database_timeout = int(config.get('Database', 'Timeout', fallback=-1))
@@ -248,6 +257,10 @@ def get_engine(config):
     except:
         database_timeout = -1
     try:
+        if workers > 5:
+            # every worker holds its own database session, so the connection pool needs to keep up
+            return create_engine(config.get_db_engine_string(), encoding='utf-8', pool_recycle=database_timeout,
+                                 pool_size=workers)
         return create_engine(config.get_db_engine_string(), encoding='utf-8', pool_recycle=database_timeout)
     except:
         print('Error: Database engine could not be created (' + config.get_db_engine_string() + ')')
@@ -258,6 +271,40 @@ def get_engine(config):
         exit(1)
 
 
+def upgrade_schema(engine):
+    """
+    Adds columns and indexes introduced after the tables had been created (create_all only creates missing tables),
+    and extends MySQL ENUM columns by newly introduced members
+    :param engine:
+    :return: list of columns and indexes added or altered
+    """
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    upgraded = []
+    for table in base.metadata.sorted_tables:
+        if table.name in existing_tables:
+            existing_columns = {}
+            for column in inspector.get_columns(table.name):
+                existing_columns[column['name']] = getattr(column['type'], 'enums', [])
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    engine.execute('ALTER TABLE ' + table.name + ' ADD COLUMN ' +
+                                   str(CreateColumn(column).compile(dialect=engine.dialect)))
+                    upgraded.append(table.name + '.' + column.name)
+                elif engine.dialect.name == 'mysql' and isinstance(column.type, Enum) and \
+                        not set(column.type.enums).issubset(existing_columns[column.name]):
+                    # MySQL's native ENUM columns need to be told about newly added members (e.g., new step types)
+                    engine.execute('ALTER TABLE ' + table.name + ' MODIFY COLUMN ' +
+                                   str(CreateColumn(column).compile(dialect=engine.dialect)))
+                    upgraded.append(table.name + '.' + column.name)
+            existing_indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(engine)
+                    upgraded.append(index.name)
+    return upgraded
+
+
 def get_db(engine):
     try:
         session_factory = sessionmaker(bind=engine)
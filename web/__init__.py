@@ -1,5 +1,6 @@
 from setup import get_config
 from scrapebot.database import User
+from scrapebot.permissions import permission_service
 from flask import Flask
 from flask_login import LoginManager
 from flask_bootstrap import Bootstrap
@@ -26,6 +27,10 @@ def create_web():
     web.config['MAIL_USERNAME'] = config.get('Email', 'user')
     web.config['MAIL_PASSWORD'] = config.get('Email', 'password')
     # web.debug = True
+    try:
+        permission_service.ttl = max(0, int(config.get('Database', 'PermissionCache', fallback=0)))
+    except ValueError:
+        permission_service.ttl = 0
 
     db.init_app(web)
     login.init_app(web)
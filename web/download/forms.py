@@ -1,8 +1,9 @@
 from flask_wtf import FlaskForm
-from wtforms import TextAreaField, SubmitField
+from wtforms import TextAreaField, BooleanField, SubmitField
 
 
 class DownloadForm(FlaskForm):
     instance_list = TextAreaField('Instances')
     recipe_list = TextAreaField('Recipes')
+    compress = BooleanField('Compress (gzip)')
     submit = SubmitField('Download this data now')
@@ -1,12 +1,11 @@
-from threading import Thread
 from web import mail
 from flask_mail import Message
-from flask import render_template, flash, redirect, url_for, current_app
+from flask import render_template, flash, redirect, url_for, request, abort, Response, stream_with_context
 from web.main import bp
 from flask_login import current_user, login_required
 from web import db, config
 from scrapebot.database import *
-import csv
+from scrapebot.export import get_export_rows, iterate_csv, write_csv
 import os
 import hashlib
 import time
@@ -22,82 +21,74 @@ def download():
             instance_uids = [int(uid) for uid in form.instance_list.data.split('-')]
             recipe_uids = [int(uid) for uid in form.recipe_list.data.split('-')]
             if len(instance_uids) > 0 and len(recipe_uids) > 0:
-                Thread(
-                    target=init_threaded_download,
-                    args=(current_app._get_current_object(), current_user._get_current_object(),
-                          instance_uids, recipe_uids)
-                ).start()
-                flash('Download added to queue. As soon as it is ready, ' + current_user.email + ' will be notified.')
+                job = Job.enqueue(db.session, current_user._get_current_object(), JobTypeEnum.download, {
+                    'instance_uids': instance_uids,
+                    'recipe_uids': recipe_uids,
+                    'compress': form.compress.data is True
+                })
+                flash('Download added to queue (job ' + str(job.uid) + '). As soon as it is ready, ' +
+                      current_user.email + ' will be notified.')
                 return redirect(url_for('main.dashboard'))
 
 
-def init_threaded_download(web, user, instance_uids, recipe_uids):
-    with web.app_context():
-        temp_name = 'order_' + hashlib.md5(bytes(user.email + str(time.time()), encoding='utf-8')).hexdigest() + '.csv'
-        temp_file = open(temp_name, 'w', newline='')
-        # extrasaction='ignore' tells DictWriter not to check on the keys in every single iteration
-        csv_data = csv.DictWriter(temp_file,
-                                  fieldnames=['run', 'instance',
-                                              'recipe', 'recipe_name', 'recipe_status',
-                                              'step', 'step_name',
-                                              'data_creation', 'data_value'],
-                                  extrasaction='ignore')
-        csv_data.writeheader()
-        for instance_uid in instance_uids:
-            instance = db.session.query(Instance).filter(Instance.uid == instance_uid).one_or_none()
-            if instance and instance.is_visible_to_user(user):
-                for recipe_uid in recipe_uids:
-                    recipe = db.session.query(Recipe).filter(Recipe.uid == recipe_uid).one_or_none()
-                    if recipe and recipe.is_visible_to_user(user):
-                        rows = []
-                        for run_data in \
-                                db.session.query(
-                                    Data.created, Data.value,
-                                    RecipeStep.sort, RecipeStep.type,
-                                    Run.created, Run.status
-                                )\
-                                .filter(
-                                    Data.step_uid == RecipeStep.uid, Data.run_uid == Run.uid,
-                                    Run.instance_uid == instance_uid, Run.recipe_uid == recipe_uid
-                                ):
-                            rows.append({
-                                'run': str(run_data[4]),
-                                'instance': instance.name,
-                                'recipe': str(recipe_uid),
-                                'recipe_name': recipe.name,
-                                'recipe_status': run_data[5].name,
-                                'step': run_data[2],
-                                'step_name': run_data[3].name,
-                                'data_creation': str(run_data[0]),
-                                'data_value': run_data[1]
-                            })
-                        csv_data.writerows(rows)
-        file_size = temp_file.tell()
+@bp.route('/download/<instance_list>/<recipe_list>')
+@login_required
+def download_stream(instance_list, recipe_list):
+    try:
+        instance_uids = [int(uid) for uid in instance_list.split('-')]
+        recipe_uids = [int(uid) for uid in recipe_list.split('-')]
+    except ValueError:
+        abort(404)
+    compress = request.args.get('gzip', '0') == '1'
+    rows = get_export_rows(db.session, current_user._get_current_object(), instance_uids, recipe_uids)
+    file_name = 'data.csv' + ('.gz' if compress else '')
+    return Response(stream_with_context(iterate_csv(rows, compress)),
+                    mimetype='application/gzip' if compress else 'text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=' + file_name})
+
+
+def run_download_job(user, payload, progress, checkpoint=None):
+    """
+    Collects the requested data into one CSV file and sends it to the user (called by worker.py)
+    :param user:
+    :param payload: dict with instance_uids, recipe_uids, and compress
+    :param progress: callback taking the progress in percent (also called regularly while rows are being collected,
+    which tells other workers that the job is still alive)
+    :param checkpoint: not used, as a download is always collected from scratch
+    :return:
+    """
+    compress = payload.get('compress', False)
+    temp_name = 'order_' + hashlib.md5(bytes(user.email + str(time.time()), encoding='utf-8')).hexdigest() + \
+                '.csv' + ('.gz' if compress else '')
+    temp_file = open(temp_name, 'wb')
+    write_csv(get_export_rows(db.session, user, payload['instance_uids'], payload['recipe_uids'],
+                              progress=lambda share: progress(share*90)), temp_file, compress)
+    file_size = temp_file.tell()
+    temp_file.close()
+    delete = True
+    msg = Message('Your ScrapeBot data request', sender='ScrapeBot <scrapebot@haim.it>', recipients=[user.email])
+    if file_size < 2000000:
+        msg.body = render_template('email/download.txt', user=user, link='')
+        temp_file = open(temp_name, 'rb')
+        msg.attach(temp_name, 'application/gzip' if compress else 'text/csv', temp_file.read())
         temp_file.close()
-        delete = True
-        msg = Message('Your ScrapeBot data request', sender='ScrapeBot <scrapebot@haim.it>', recipients=[user.email])
-        if file_size < 2000000:
-            msg.body = render_template('email/download.txt', user=user, link='')
-            temp_file = open(temp_name, 'r')
-            msg.attach(temp_name, 'text/csv', temp_file.read())
-            temp_file.close()
+    else:
+        link = temp_name
+        if config.get('Database', 'AWSaccess') is not None and \
+           config.get('Database', 'AWSsecret') is not None and \
+           config.get('Database', 'AWSbucket') is not None:
+            import boto3
+            client = boto3.client(
+                's3',
+                aws_access_key_id=config.get('Database', 'AWSaccess'),
+                aws_secret_access_key=config.get('Database', 'AWSsecret')
+            )
+            with open(temp_name, 'rb') as data:
+                client.upload_fileobj(data, config.get('Database', 'AWSbucket'), temp_name)
+            link = 's3://' + config.get('Database', 'AWSbucket') + '/' + temp_name
         else:
-            link = temp_name
-            if config.get('Database', 'AWSaccess') is not None and \
-               config.get('Database', 'AWSsecret') is not None and \
-               config.get('Database', 'AWSbucket') is not None:
-                import boto3
-                client = boto3.client(
-                    's3',
-                    aws_access_key_id=config.get('Database', 'AWSaccess'),
-                    aws_secret_access_key=config.get('Database', 'AWSsecret')
-                )
-                with open(temp_name, 'rb') as data:
-                    client.upload_fileobj(data, config.get('Database', 'AWSbucket'), temp_name)
-                link = 's3://' + config.get('Database', 'AWSbucket') + '/' + temp_name
-            else:
-                delete = False
-            msg.body = render_template('email/download.txt', user=user, link=link)
-        if delete:
-            os.remove(temp_name)
-        mail.send(msg)
+            delete = False
+        msg.body = render_template('email/download.txt', user=user, link=link)
+    if delete:
+        os.remove(temp_name)
+    mail.send(msg)
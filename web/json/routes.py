@@ -1,6 +1,8 @@
-from flask import jsonify, request
+from datetime import datetime, timedelta
+from flask import jsonify, request, Response, stream_with_context, json as flask_json
 from web import db
-from scrapebot.database import Run, Instance, Recipe, UserRecipePrivilege, RecipeOrder
+from scrapebot.database import Run, Instance, Recipe, UserRecipePrivilege, RecipeOrder, Job, RunStatistics, \
+    StepTiming
 from flask_login import current_user, login_required
 from web.json import bp
 from sqlalchemy import func, or_
@@ -14,20 +16,10 @@ def instances():
     if json is not None and 'uids' in json:
         recipe_uids = json['uids']
     data = []
-    for instance in current_user.instances_owned:
-        if len(recipe_uids) > 0:
-            for order in instance.recipes:
-                if order.recipe_uid in recipe_uids:
-                    data.append(instance.jsonify(include_latest_run=True, recipe=order.recipe))
-        else:
-            data.append(instance.jsonify(include_latest_run=True))
-    for privilege in current_user.instance_privileges:
-        if len(recipe_uids) > 0:
-            for order in privilege.instance.recipes:
-                if order.recipe_uid in recipe_uids:
-                    data.append(privilege.instance.jsonify(include_latest_run=True, recipe=order.recipe))
-        else:
-            data.append(privilege.instance.jsonify(include_latest_run=True))
+    for (instance, latest_run) in Instance.get_visible_with_latest_runs(db.session, current_user, recipe_uids):
+        instance_json = instance.jsonify()
+        instance_json['latest_run'] = False if latest_run is None else latest_run.jsonify()
+        data.append(instance_json)
     return jsonify({'status': 200, 'count': len(data), 'data': data})
 
 
@@ -70,34 +62,52 @@ def recipes():
 @login_required
 def run(run_uid):
     temp_run = db.session.query(Run).filter(Run.uid == int(run_uid)).first()
-    if temp_run.recipe.is_visible_to_user(current_user) and temp_run.instance.is_visible_to_user(current_user):
-        return jsonify({'status': 200, 'run': temp_run.jsonify(True, True)})
+    if temp_run is not None and temp_run.recipe.is_visible_to_user(current_user) and \
+            temp_run.instance.is_visible_to_user(current_user):
+        return jsonify({'status': 200, 'run': temp_run.serialize(db.session, True, True, True)})
     return jsonify({'status': 403, 'message': 'No permission to view this run.'})
 
 
-@bp.route('/json/runs/<recipe_uid>-<instance_uid>', defaults={'page': 1})
-@bp.route('/json/runs/<recipe_uid>-<instance_uid>/<page>')
+@bp.route('/json/run/<run_uid>/ndjson')
 @login_required
-def runs(recipe_uid, instance_uid, page):
+def run_ndjson(run_uid):
+    temp_run = db.session.query(Run).filter(Run.uid == int(run_uid)).first()
+    if temp_run is not None and temp_run.recipe.is_visible_to_user(current_user) and \
+            temp_run.instance.is_visible_to_user(current_user):
+        # one JSON record per line (the run first, then its logs, data, and timings), streamed as it is read
+        return Response(stream_with_context(flask_json.dumps(record) + '\n' for record in temp_run.stream(db.session)),
+                        mimetype='application/x-ndjson')
+    return jsonify({'status': 403, 'message': 'No permission to view this run.'})
+
+
+@bp.route('/json/job/<job_uid>')
+@login_required
+def job(job_uid):
+    temp_job = db.session.query(Job).filter(Job.uid == int(job_uid)).first()
+    if temp_job is not None and temp_job.user_uid == current_user.uid:
+        return jsonify({'status': 200, 'job': temp_job.jsonify()})
+    return jsonify({'status': 403, 'message': 'No permission to view this job.'})
+
+
+@bp.route('/json/runs/<recipe_uid>-<instance_uid>')
+@login_required
+def runs(recipe_uid, instance_uid):
+    recipe_uid = int(recipe_uid)
+    instance_uid = int(instance_uid)
+    try:
+        temp_runs, next_cursor = Run.query_page(db.session, current_user, recipe_uid, instance_uid,
+                                                request.args.get('before'))
+    except ValueError:
+        return jsonify({'status': 400, 'message': 'Invalid cursor.'})
     data = []
-    temp_runs = db.session.query(Run)
-    if int(recipe_uid) > 0:
-        temp_runs = temp_runs.filter(Run.recipe_uid == int(recipe_uid))
-    if int(instance_uid) > 0:
-        temp_runs = temp_runs.filter(Run.instance_uid == int(instance_uid))
-    temp_runs = temp_runs.order_by(Run.created.desc()).paginate(int(page), 10, error_out=False)
-    for temp_run in temp_runs.items:
-        if temp_run.recipe.is_visible_to_user(current_user) and temp_run.instance.is_visible_to_user(current_user):
-            data.append(temp_run.jsonify())
+    for temp_run in temp_runs:
+        data.append(temp_run.jsonify())
     return jsonify({
         'status': 200,
         'count': len(data),
         'data': data,
-        'page': page,
-        'has_next': temp_runs.has_next,
-        'has_prev': temp_runs.has_prev,
-        'next_page': temp_runs.next_num,
-        'prev_page': temp_runs.prev_num
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor
     })
 
 
@@ -106,12 +116,11 @@ def runs(recipe_uid, instance_uid, page):
 def instance_chart(instance_uid):
     temp_instance = db.session.query(Instance).filter(Instance.uid == instance_uid).first()
     if temp_instance is not None and temp_instance.is_visible_to_user(current_user):
-        data = db.session.query(Recipe.name, func.date(Run.created), func.count(Run.uid))\
-            .select_from(Run)\
-            .filter(Run.instance_uid == instance_uid)\
-            .join(Run.recipe)\
-            .group_by(Recipe, func.date(Run.created))\
-            .order_by(func.date(Run.created))
+        data = db.session.query(Recipe.name, RunStatistics.day, RunStatistics.runs)\
+            .select_from(RunStatistics)\
+            .filter(RunStatistics.instance_uid == instance_uid)\
+            .join(RunStatistics.recipe)\
+            .order_by(RunStatistics.day)
         datasets = dict()
         labels = []
         for row in data:
@@ -127,3 +136,23 @@ def instance_chart(instance_uid):
             'datasets': [{'label': name, 'data': values} for name, values in datasets.items()]
         })
     return jsonify({'status': 403, 'message': 'No permission to view this instance.'})
+
+
+@bp.route('/json/recipe/<recipe_uid>/chart')
+@login_required
+def recipe_chart(recipe_uid):
+    temp_recipe = db.session.query(Recipe).filter(Recipe.uid == recipe_uid).first()
+    if temp_recipe is not None and temp_recipe.is_visible_to_user(current_user):
+        try:
+            days = max(1, int(request.args.get('days', 30)))
+        except ValueError:
+            days = 30
+        summary = StepTiming.summarize(db.session, temp_recipe, datetime.now() - timedelta(days=days))
+        return jsonify({
+            'status': 200,
+            'recipe': temp_recipe.name,
+            'days': days,
+            'labels': [('' if row['sort'] is None else str(row['sort']) + '. ') + row['label'] for row in summary],
+            'steps': summary
+        })
+    return jsonify({'status': 403, 'message': 'No permission to view this recipe.'})
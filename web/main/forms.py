@@ -1,7 +1,8 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, TextAreaField, BooleanField, SelectField, IntegerField
 from wtforms.validators import DataRequired, Email
-from scrapebot.emulate import RecipeStepTypeEnum
+from scrapebot.steptypes import RecipeStepTypeEnum
+from scrapebot.database import RecipeEngineEnum
 
 
 class RecipeForm(FlaskForm):
@@ -9,6 +10,8 @@ class RecipeForm(FlaskForm):
     description = TextAreaField('Description')
     interval = IntegerField('Interval [minutes]', validators=[DataRequired()])
     cookies = BooleanField('Store cookies')
+    engine = SelectField('Engine', choices=RecipeEngineEnum.choices(), coerce=RecipeEngineEnum.coerce,
+                         default=RecipeEngineEnum.browser.name)
     active = BooleanField('Activated', default=True)
     submit = SubmitField('Save')
 
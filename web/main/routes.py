@@ -1,10 +1,10 @@
 import io
 import traceback
 import sys
-from threading import Thread
 from datetime import date
-from flask import render_template, flash, redirect, url_for, request, current_app, send_file
+from flask import render_template, flash, redirect, url_for, request, send_file
 from scrapebot.database import *
+from scrapebot.permissions import permission_service
 from web import db, mail
 from flask_login import current_user, login_required
 from flask_mail import Message
@@ -38,7 +38,7 @@ def instance(instance_uid):
                 user_recipes.append(privilege.recipe)
         form_privilege = PrivilegeForm()
         if form_privilege.validate_on_submit() and form_privilege.email.data:
-            if temp_instance.owner_uid is current_user.uid:
+            if temp_instance.owner_uid == current_user.uid:
                 temp_user = db.session.query(User).filter(User.email == form_privilege.email.data).first()
                 if temp_user is None or temp_user is temp_instance.owner:
                     flash('User not found')
@@ -55,6 +55,7 @@ def instance(instance_uid):
                     else:
                         flash('Access already granted')
                         return redirect(url_for('main.instance', instance_uid=instance_uid))
+                    permission_service.invalidate(temp_user)
                     db.session.commit()
                     msg = Message('Access to new ScrapeBot instance granted', sender='ScrapeBot <scrapebot@haim.it>',
                                   recipients=[temp_user.email])
@@ -109,6 +110,7 @@ def instance_remove_privilege(instance_uid, privilege_uid):
         if temp_privilege is None:
             flash('Privilege not found')
         else:
+            permission_service.invalidate(temp_privilege.user)
             db.session.delete(temp_privilege)
             db.session.commit()
             flash('Privilege removed successfully')
@@ -139,6 +141,7 @@ def recipe(recipe_uid):
         temp_recipe.description = form.description.data
         temp_recipe.interval = form.interval.data
         temp_recipe.cookies = form.cookies.data
+        temp_recipe.engine = RecipeEngineEnum[form.engine.data]
         temp_recipe.active = form.active.data
         for temp_instance in instances:
             if request.form.get('instance_' + str(temp_instance.uid)) is 'y':
@@ -162,7 +165,7 @@ def recipe(recipe_uid):
         return redirect(url_for('main.recipe', recipe_uid=recipe_uid))
     form_privilege = PrivilegeForm()
     if form_privilege.validate_on_submit() and form_privilege.email.data:
-        if temp_recipe.owner_uid is current_user.uid:
+        if temp_recipe.owner_uid == current_user.uid:
             temp_user = db.session.query(User).filter(User.email == form_privilege.email.data).first()
             if temp_user is None or temp_user is temp_recipe.owner:
                 flash('User not found')
@@ -178,6 +181,7 @@ def recipe(recipe_uid):
                 else:
                     flash('Access already granted')
                     return redirect(url_for('main.recipe', recipe_uid=recipe_uid))
+                permission_service.invalidate(temp_user)
                 db.session.commit()
                 msg = Message('Access to new ScrapeBot recipe granted', sender='ScrapeBot <scrapebot@haim.it>',
                               recipients=[temp_user.email])
@@ -202,6 +206,7 @@ def recipe(recipe_uid):
         form.description.data = temp_recipe.description
         form.interval.data = temp_recipe.interval
         form.cookies.data = temp_recipe.cookies
+        form.engine.data = RecipeEngineEnum.coerce(temp_recipe.engine) or RecipeEngineEnum.browser.name
         form.active.data = temp_recipe.active
         for temp_instance in instances:
             user_instances.append({
@@ -230,6 +235,7 @@ def recipe_remove_privilege(recipe_uid, privilege_uid):
         if temp_privilege is None:
             flash('Privilege not found')
         else:
+            permission_service.invalidate(temp_privilege.user)
             db.session.delete(temp_privilege)
             db.session.commit()
             flash('Privilege removed successfully')
@@ -276,6 +282,7 @@ def recipe_export(recipe_uid):
         'description': temp_recipe.description,
         'interval': temp_recipe.interval,
         'cookies': temp_recipe.cookies,
+        'engine': temp_recipe.engine.name if temp_recipe.engine is not None else RecipeEngineEnum.browser.name,
         'active': temp_recipe.active,
         'steps': []
     }
@@ -311,6 +318,7 @@ def recipe_import():
             description=sbj['description'],
             active=True if sbj['active'] else False,
             cookies=True if sbj['cookies'] else False,
+            engine=RecipeEngineEnum[sbj.get('engine', RecipeEngineEnum.browser.name)],
             interval=sbj['interval'],
             owner=current_user
         )
@@ -358,12 +366,21 @@ def recipe_duplicate(recipe_uid):
     if form.validate_on_submit():
         copies = int(form.amount.data)
         if copies > 0:
-            Thread(
-                target=init_threaded_duplication,
-                args=(current_app._get_current_object(), current_user._get_current_object(),
-                      form, temp_recipe, instances, request.form)
-            ).start()
-            flash('Added "' + temp_recipe.name + '" to the queue to be copied a total of ' + str(copies) + ' times. ' +
+            instance_uids = []
+            for temp_instance in instances:
+                if request.form.get('instance_' + str(temp_instance.uid)) == 'y':
+                    instance_uids.append(temp_instance.uid)
+            job = Job.enqueue(db.session, current_user._get_current_object(), JobTypeEnum.duplication, {
+                'recipe_uid': temp_recipe.uid,
+                'amount': copies,
+                'name': form.name.data,
+                'description': form.description.data,
+                'active': form.active.data is True,
+                'user_privileges': form.user_privileges.data is True,
+                'instance_uids': instance_uids
+            })
+            flash('Added "' + temp_recipe.name + '" to the queue (job ' + str(job.uid) + ') to be copied a total of ' +
+                  str(copies) + ' times. ' +
                   'As soon as it is ready, a notification will be sent to ' + current_user.email)
             return redirect(url_for('main.dashboard'))
         else:
@@ -386,55 +403,67 @@ def recipe_duplicate(recipe_uid):
     return render_template('main/recipe_copy.html', form=form, instances=user_instances, recipe=temp_recipe)
 
 
-def init_threaded_duplication(web, user, form, temp_recipe, instances, form_submitted):
-    with web.app_context():
-        temp_recipe = db.session.query(Recipe).filter(Recipe.uid == temp_recipe.uid).first()
-        copies = int(form.amount.data)
-        instance_count = 0
-        for i in range(1, 1 + copies):
-            new_recipe = Recipe(
-                name=form.name.data.replace('%i', str(i)).replace('%n', str(copies)),
-                description=form.description.data,
-                active=form.active.data,
-                cookies=temp_recipe.cookies,
-                interval=temp_recipe.interval
+def run_duplication_job(user, payload, progress, checkpoint):
+    """
+    Creates the requested copies of a recipe and notifies the user (called by worker.py); every copy is committed along
+    with the number of copies done so far, so that a retry (e.g., after the email could not be sent) only creates the
+    copies still missing
+    :param user:
+    :param payload: dict with recipe_uid, amount, name, description, active, user_privileges, and instance_uids (and
+    copies_done, once some copies have been created)
+    :param progress: callback taking the progress in percent
+    :param checkpoint: callback storing the payload along with the next commit
+    :return:
+    """
+    temp_recipe = db.session.query(Recipe).filter(Recipe.uid == payload['recipe_uid']).first()
+    copies = int(payload['amount'])
+    instances = db.session.query(Instance).filter(Instance.uid.in_(payload['instance_uids'])).all() \
+        if len(payload['instance_uids']) > 0 else []
+    for i in range(1 + int(payload.get('copies_done', 0)), 1 + copies):
+        new_recipe = Recipe(
+            name=payload['name'].replace('%i', str(i)).replace('%n', str(copies)),
+            description=payload['description'],
+            active=payload['active'],
+            cookies=temp_recipe.cookies,
+            engine=temp_recipe.engine,
+            interval=temp_recipe.interval
+        )
+        for temp_step in temp_recipe.steps:
+            new_step = RecipeStep(
+                sort=temp_step.sort,
+                type=temp_step.type,
+                value=temp_step.value,
+                use_random_item_instead_of_value=temp_step.use_random_item_instead_of_value,
+                active=temp_step.active
             )
-            for temp_step in temp_recipe.steps:
-                new_step = RecipeStep(
-                    sort=temp_step.sort,
-                    type=temp_step.type,
-                    value=temp_step.value,
-                    use_random_item_instead_of_value=temp_step.use_random_item_instead_of_value,
-                    active=temp_step.active
-                )
-                for temp_item in temp_step.items:
-                    new_step.items.append(RecipeStepItem(value=temp_item.value))
-                new_recipe.steps.append(new_step)
-            if form.user_privileges.data is True:
-                new_recipe.owner = temp_recipe.owner
-                for temp_privilege in temp_recipe.privileged_users:
-                    new_recipe.privileged_users.append(UserRecipePrivilege(
-                        user=temp_privilege.user,
-                        allowed_to_edit=temp_privilege.allowed_to_edit
-                    ))
-            else:
-                new_recipe.owner = user
-            instance_count = 0
-            for temp_instance in instances:
-                if ('instance_' + str(temp_instance.uid)) in form_submitted:
-                    if form_submitted['instance_' + str(temp_instance.uid)] is 'y':
-                        instance_count = instance_count + 1
-                        new_recipe.instances.append(RecipeOrder(instance=temp_instance))
-            db.session.add(new_recipe)
-            db.session.commit()
-        msg = Message('Your ScrapeBot recipe-duplication request', sender='ScrapeBot <scrapebot@haim.it>',
-                      recipients=[user.email])
-        msg.body = render_template('email/duplication.txt', user=user, copies=copies,
-                                   copied_privileges=form.user_privileges.data,
-                                   copied_active=form.active.data,
-                                   copied_instances=instance_count,
-                                   recipe=temp_recipe)
-        mail.send(msg)
+            for temp_item in temp_step.items:
+                new_step.items.append(RecipeStepItem(value=temp_item.value))
+            new_recipe.steps.append(new_step)
+        if payload['user_privileges'] is True:
+            new_recipe.owner = temp_recipe.owner
+            for temp_privilege in temp_recipe.privileged_users:
+                new_recipe.privileged_users.append(UserRecipePrivilege(
+                    user=temp_privilege.user,
+                    allowed_to_edit=temp_privilege.allowed_to_edit
+                ))
+                permission_service.invalidate(temp_privilege.user)
+        else:
+            new_recipe.owner = user
+        for temp_instance in instances:
+            new_recipe.instances.append(RecipeOrder(instance=temp_instance))
+        db.session.add(new_recipe)
+        payload['copies_done'] = i
+        checkpoint(payload)
+        db.session.commit()
+        progress(100*i/copies)
+    msg = Message('Your ScrapeBot recipe-duplication request', sender='ScrapeBot <scrapebot@haim.it>',
+                  recipients=[user.email])
+    msg.body = render_template('email/duplication.txt', user=user, copies=copies,
+                               copied_privileges=payload['user_privileges'],
+                               copied_active=payload['active'],
+                               copied_instances=len(instances),
+                               recipe=temp_recipe)
+    mail.send(msg)
 
 
 @bp.route('/recipe/<recipe_uid>/step', methods=['GET', 'POST'], defaults={'step_uid': None})
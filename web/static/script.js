@@ -7,6 +7,10 @@ $(function(){
     /**
      * Dashboard instance-recipe handlers
      */
+    $('#download #download_stream').on('click', function() {
+        var href = $(this).attr('href').split('?')[0];
+        $(this).attr('href', href + ($('#download #compress').is(':checked') ? '?gzip=1' : ''));
+    });
     function get_opposing_model(model) {
         return model == 'recipe' ? 'instance' : 'recipe';
     }
@@ -156,6 +160,8 @@ $(function(){
                 str_opposing = $.map(selected_opposing_models,function(o) {return $(o).data('uid')}).join('-');
             $('#download #instance_list').val((model == 'instance' ? str_model : str_opposing));
             $('#download #recipe_list').val((model == 'instance' ? str_opposing : str_model));
+            $('#download #download_stream').attr('href', '/download/' + $('#download #instance_list').val() + '/' +
+                                                 $('#download #recipe_list').val());
             $('#download').removeClass('d-none');
         } else {
             $('#download').addClass('d-none');
@@ -180,7 +186,7 @@ $(function(){
      * Run detail-view handler
      */
     function init_run_detail_view_handler() {
-        $('a[href^="/json/run/"]').off('click').on('click', function (_event) {
+        $('a[href^="/json/run/"]:not([href$="/ndjson"])').off('click').on('click', function (_event) {
             _event.preventDefault();
             $.getJSON(this.href, function (_data) {
                 if (_data['status'] == 200) {
@@ -188,6 +194,7 @@ $(function(){
                     $('#modal_run [data-column="recipe.name"]').html(run.recipe.name);
                     $('#modal_run [data-column="instance.name"]').html(run.instance.name);
                     $('#modal_run [data-column="run.runtime"]').html(run.runtime);
+                    $('#modal_run [data-column="run.ndjson"]').attr('href', '/json/run/' + run.uid + '/ndjson');
                     $('#modal_run .badge')
                         .removeClass('badge-success')
                         .removeClass('badge-danger')
@@ -229,10 +236,16 @@ $(function(){
                     if(run.data.length == 0) {
                         $('ul[data-column="data"]').html('<li class="list-group-item"><em>no data collected</em></li>');
                     } else {
+                        // data entries refer to their step by uid, each step is included only once
+                        var steps = {};
+                        $.each(run.steps, function (i, step) {
+                            steps[step.uid] = step;
+                        });
                         $('ul[data-column="data"]').html('');
                         $.each(run.data, function (i, data) {
+                            var step = steps[data.step] || {'sort': '?', 'type': 'removed step'};
                             $('<li class="list-group-item" data-toggle="tooltip" data-placement="left" title="Step #' +
-                                data.step.sort + ' (' + data.step.type + ')">' + (
+                                step.sort + ' (' + step.type + ')">' + (
                                     data.value.length > 100 ?
                                     (data.value.substr(0, 30) + '...') :
                                     data.value
@@ -255,12 +268,21 @@ $(function(){
     /**
      * Self-updating run-view handler
      */
-    function refresh_runs(ul, recipe_uid, instance_uid) {
-        var runs = [];
-        $(ul).html(loading);
-        $.getJSON('/json/runs/' + (recipe_uid > 0 ? recipe_uid : '0') + '-' + (instance_uid > 0 ? instance_uid : '0'), function(_data) {
+    function refresh_runs(ul, recipe_uid, instance_uid, before) {
+        var url = '/json/runs/' + (recipe_uid > 0 ? recipe_uid : '0') + '-' + (instance_uid > 0 ? instance_uid : '0');
+        if(before) {
+            // further pages are appended (in place of their "more" link) rather than replacing the list
+            url += '?before=' + encodeURIComponent(before);
+            $(ul).find('.runs_more').replaceWith(loading);
+        } else {
+            $(ul).html(loading);
+        }
+        $.getJSON(url, function(_data) {
             if(_data['status'] == 200) {
-                $(ul).html('');
+                $(ul).find('.disabled').remove();
+                if(!before) {
+                    $(ul).html('');
+                }
                 $.each(_data['data'], function(i, run) {
                     var item = $('<li class="list-group-item list-group-item-' +
                         (run.status == 'success' ? 'success' :
@@ -277,9 +299,18 @@ $(function(){
                     }
                     $(ul).append(item);
                 });
+                if(_data['has_next']) {
+                    var more = $('<li class="list-group-item text-center runs_more"><a href="#">... more ...</a></li>');
+                    more.find('a').on('click', function(_event) {
+                        _event.preventDefault();
+                        refresh_runs(ul, recipe_uid, instance_uid, _data['next_cursor']);
+                    });
+                    $(ul).append(more);
+                }
                 init_run_detail_view_handler();
             } else {
-                $(ul).html(error.replace('###', _data['message']));
+                $(ul).find('.disabled').remove();
+                $(ul).append(error.replace('###', _data['message']));
             }
         });
     }
@@ -334,4 +365,43 @@ $(function(){
             });
         });
     });
+
+
+    /**
+     * Recipe chart initiation (average and maximum time per step)
+     */
+    $('.chart_recipe').each(function(i, elem) {
+        var recipe = $(elem).data('recipe');
+        $.getJSON('/json/recipe/' + recipe + '/chart', function (data) {
+            if (data.status != 200) {
+                return;
+            }
+            new Chart(elem, {
+                type: 'horizontalBar',
+                data: {
+                    labels: data.labels,
+                    datasets: [{
+                        label: 'Average seconds',
+                        backgroundColor: '#007bff',
+                        data: $.map(data.steps, function(step) { return step.duration_avg.toFixed(2); })
+                    }, {
+                        label: 'Maximum seconds',
+                        backgroundColor: '#ced4da',
+                        data: $.map(data.steps, function(step) { return step.duration_max.toFixed(2); })
+                    }]
+                },
+                options: {
+                    tooltips: {
+                        callbacks: {
+                            afterBody: function(items) {
+                                var step = data.steps[items[0].index];
+                                return step.count + ' time(s), on average ' + step.calls_avg.toFixed(1) +
+                                    ' call(s) and ' + step.data_avg.toFixed(1) + ' data row(s)';
+                            }
+                        }
+                    }
+                }
+            });
+        });
+    });
 });
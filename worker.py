@@ -0,0 +1,104 @@
+import sys
+import time
+import signal
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy.orm import sessionmaker
+from web import create_web, db, config
+from scrapebot.database import Job, JobTypeEnum
+from web.download.routes import run_download_job
+from web.main.routes import run_duplication_job
+
+
+JOB_HANDLERS = {
+    JobTypeEnum.download: run_download_job,
+    JobTypeEnum.duplication: run_duplication_job
+}
+
+
+def main():
+    print('[' + str(datetime.now()) + '] ScrapeBot worker initiated (this is server time)')
+    concurrency = get_config_int('Concurrency', 2)
+    retries = get_config_int('Retries', 3)
+    timeout = get_config_int('Timeout', 3600)
+    poll = get_config_int('Poll', 5)
+    web = create_web()
+    print('Handling up to ' + str(concurrency) + ' job(s) in parallel')
+    stop = []
+    wakeup = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: (stop.append(signum), wakeup.set()))
+    running = []
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    next_requeue = 0
+    try:
+        with web.app_context():
+            while len(stop) == 0:
+                if time.time() >= next_requeue:
+                    requeued = Job.requeue_stale(db.session, timeout)
+                    if requeued > 0:
+                        print('Requeued ' + str(requeued) + ' job(s) that timed out')
+                    next_requeue = time.time() + poll*10
+                running = [future for future in running if not future.done()]
+                while len(running) < concurrency:
+                    job = Job.claim_next(db.session)
+                    if job is None:
+                        break
+                    print('# job ' + str(job.uid) + ' (' + job.type.name + ', attempt ' + str(job.attempts) + ')')
+                    future = pool.submit(handle_job, web, job.uid, retries)
+                    future.add_done_callback(lambda done: wakeup.set())
+                    running.append(future)
+                db.session.remove()
+                wakeup.wait(poll)
+                wakeup.clear()
+    except KeyboardInterrupt:
+        pass
+    print('Stopping worker, waiting for running jobs to finish')
+    pool.shutdown(wait=True)
+
+
+def get_config_int(name, default):
+    try:
+        return max(1, int(config.get('Worker', name, fallback=default)))
+    except ValueError:
+        return default
+
+
+def handle_job(web, job_uid, retries):
+    """
+    Runs one claimed job within its own app context (and thus its own database session)
+    :param web:
+    :param job_uid:
+    :param retries:
+    :return:
+    """
+    with web.app_context():
+        # progress is reported through a separate session so as not to interfere with the job's own transactions
+        progress_session = sessionmaker(bind=db.engine)()
+        job = db.session.query(Job).filter(Job.uid == job_uid).one()
+        try:
+            JOB_HANDLERS[job.type](
+                job.user, job.get_payload(),
+                lambda progress: Job.report_progress(progress_session, job_uid, progress),
+                lambda payload: Job.save_payload(db.session, job_uid, payload)
+            )
+            job = db.session.query(Job).filter(Job.uid == job_uid).one()
+            job.finish()
+            print('- job ' + str(job_uid) + ' done')
+        except:
+            error = sys.exc_info()[0]
+            print('- job ' + str(job_uid) + ' failed: ' + str(error))
+            print('- ' + traceback.format_exc())
+            db.session.rollback()
+            job = db.session.query(Job).filter(Job.uid == job_uid).one()
+            if job.fail(str(error).strip('<>') + '\n' + traceback.format_exc(), retries):
+                print('- job ' + str(job_uid) + ' will be retried')
+        finally:
+            db.session.commit()
+            db.session.remove()
+            progress_session.close()
+
+
+if __name__ == '__main__':
+    main()